@@ -1,27 +1,40 @@
 """Aviatrix Controller HA Lambda script"""
 
+from __future__ import annotations
+
 # pylint: disable=too-many-lines,too-many-locals,too-many-branches,too-many-return-statements
 # pylint: disable=too-many-statements,too-many-arguments,broad-except
+import dataclasses
 import enum
+import functools
 import os
 import traceback
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable
 
-import boto3
 import urllib3
 from urllib3.exceptions import InsecureRequestWarning
 
+from aviatrix_ha.common.constants import CONTINUATION_EVENT_KEY
+from aviatrix_ha.csp.clients import get_client, preload_clients
 from aviatrix_ha.csp.instance import get_controller_instance
-from aviatrix_ha.csp.lambda_c import update_env_dict
+from aviatrix_ha.csp.lambda_c import load_state, update_env_dict
 from aviatrix_ha.csp.sg import remove_temp_security_group_access
 from aviatrix_ha.errors.exceptions import AvxError
-from aviatrix_ha.handlers.asg.handler import handle_sns_event
-from aviatrix_ha.handlers.cft.handler import handle_cft
-from aviatrix_ha.handlers.function.handler import handle_function_event
+from aviatrix_ha.tools import cache, deadline
 from aviatrix_ha.version import VERSION
 
+if TYPE_CHECKING:
+    from types_boto3_ec2.client import EC2Client
+    from types_boto3_ec2.type_defs import InstanceTypeDef
+    from types_boto3_lambda.client import LambdaClient
+
 urllib3.disable_warnings(InsecureRequestWarning)
 
+# Create the shared AWS clients in the init phase of the lambda function,
+# before the first invocation
+if os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+    preload_clients()
+
 
 class EventType(enum.Enum):
     """Enum for event types"""
@@ -29,6 +42,7 @@ class EventType(enum.Enum):
     CFT = "CFT"
     SNS = "SNS"
     FUNCTION = "Function"
+    CONTINUATION = "Continuation"
     UNKNOWN = "Unknown"
 
 
@@ -58,9 +72,140 @@ def _get_event_type(event: dict[str, Any]) -> EventType:
     if "headers" in event and "requestContext" in event:
         return EventType.FUNCTION
 
+    if CONTINUATION_EVENT_KEY in event:
+        return EventType.CONTINUATION
+
     return EventType.UNKNOWN
 
 
+class Invocation:
+    """Clients and controller details for one invocation, created on first use"""
+
+    def __init__(self, event: dict[str, Any], context: Any):
+        self.event = event
+        self.context = context
+
+    @functools.cached_property
+    def ec2_client(self) -> EC2Client:
+        return get_client("ec2")
+
+    @functools.cached_property
+    def lambda_client(self) -> LambdaClient:
+        return get_client("lambda")
+
+    @property
+    def instance_name(self) -> str:
+        return os.environ.get("AVIATRIX_TAG", "")
+
+    @functools.cached_property
+    def controller(self) -> tuple[str | None, InstanceTypeDef]:
+        inst_id = os.environ.get("INST_ID", "")
+        print(f"Trying describe with name {self.instance_name} and ID {inst_id}")
+        return get_controller_instance(self.ec2_client, self.instance_name, inst_id)
+
+    def revert_temp_sg(self) -> None:
+        tmp_sg = os.environ.get("TMP_SG_GRP", "")
+        tmp_sgr = os.environ.get("TMP_SG_RULE", "")
+        if not tmp_sg or not tmp_sgr:
+            return
+        print(
+            f"Lambda probably did not complete last time. Reverting {tmp_sg}/{tmp_sgr}"
+        )
+        update_env_dict(
+            self.lambda_client,
+            self.context,
+            {"TMP_SG_GRP": "", "TMP_SG_RULE": ""},
+            durable=True,
+        )
+        remove_temp_security_group_access(self.ec2_client, tmp_sg, tmp_sgr)
+
+
+# Handler modules are imported on first use, so an invocation only loads the
+# code and dependencies of its own event type.
+# pylint: disable=import-outside-toplevel
+
+
+def _handle_cft(invocation: Invocation) -> Any:
+    from aviatrix_ha.handlers.cft.handler import handle_cft
+
+    describe_err, controller_instanceobj = invocation.controller
+    return handle_cft(
+        describe_err,
+        invocation.event,
+        invocation.context,
+        invocation.ec2_client,
+        invocation.lambda_client,
+        controller_instanceobj,
+        invocation.instance_name,
+    )
+
+
+def _handle_sns(invocation: Invocation) -> Any:
+    from aviatrix_ha.handlers.asg.handler import handle_sns_event, starts_ha_run
+
+    # HA runs revert the rule once they hold the HA lock, so a duplicate
+    # delivery cannot remove the rule of the run in progress
+    if not starts_ha_run(invocation.event):
+        invocation.revert_temp_sg()
+    describe_err, controller_instanceobj = invocation.controller
+    return handle_sns_event(
+        describe_err,
+        invocation.event,
+        invocation.ec2_client,
+        invocation.lambda_client,
+        controller_instanceobj,
+        invocation.context,
+    )
+
+
+def _handle_continuation(invocation: Invocation) -> Any:
+    from aviatrix_ha.handlers.asg.handler import handle_continuation_event
+
+    describe_err, controller_instanceobj = invocation.controller
+    return handle_continuation_event(
+        describe_err,
+        invocation.event,
+        invocation.ec2_client,
+        invocation.lambda_client,
+        controller_instanceobj,
+        invocation.context,
+    )
+
+
+def _handle_function(invocation: Invocation) -> Any:
+    from aviatrix_ha.handlers.function.handler import handle_function_event
+
+    return handle_function_event(invocation.event, invocation.context)
+
+
+def _handle_unknown(invocation: Invocation) -> Any:
+    print("Unknown source. Not from CFT or SNS")
+    return False
+
+
+@dataclasses.dataclass(frozen=True)
+class EventRoute:
+    """How an event type is handled"""
+
+    handle: Callable[[Invocation], Any]
+    # Whether the HA state must be loaded before handling the event
+    load_state: bool = True
+    # Whether a temporary SG rule left by an interrupted run is reverted first
+    revert_temp_sg: bool = True
+
+
+EVENT_ROUTES: dict[EventType, EventRoute] = {
+    EventType.CFT: EventRoute(_handle_cft),
+    # HA runs revert the rule once they hold the HA lock. SNS events which do
+    # not start one revert it themselves.
+    EventType.SNS: EventRoute(_handle_sns, revert_temp_sg=False),
+    EventType.CONTINUATION: EventRoute(_handle_continuation, revert_temp_sg=False),
+    # Function URL requests only read the state, and must answer quickly
+    EventType.FUNCTION: EventRoute(_handle_function, revert_temp_sg=False),
+    EventType.UNKNOWN: EventRoute(_handle_unknown),
+}
+
+
 def _lambda_handler(event: dict[str, Any], context: Any) -> Any:
     """Entry point of the lambda script without exception handling
     This lambda function will serve muliple kinds of requests:
@@ -68,42 +213,14 @@ def _lambda_handler(event: dict[str, Any], context: Any) -> Any:
     2) sns_event - Request from sns to attach elastic ip to new instance
        created after controller failover.
     3) function_request - request to the function url
+    4) continuation - a HA run which ran out of time in an earlier invocation
     """
-    event_type = _get_event_type(event)
-    client = boto3.client("ec2")
-    lambda_client = boto3.client("lambda")
-
-    tmp_sg = os.environ.get("TMP_SG_GRP", "")
-    tmp_sgr = os.environ.get("TMP_SG_RULE", "")
-    if event_type != EventType.FUNCTION and tmp_sg and tmp_sgr:
-        print(
-            f"Lambda probably did not complete last time. Reverting {tmp_sg}/{tmp_sgr}"
-        )
-        update_env_dict(lambda_client, context, {"TMP_SG_GRP": "", "TMP_SG_RULE": ""})
-        remove_temp_security_group_access(client, tmp_sg, tmp_sgr)
-    instance_name = os.environ.get("AVIATRIX_TAG", "")
-    inst_id = os.environ.get("INST_ID", "")
-    print(f"Trying describe with name {instance_name} and ID {inst_id}")
-    describe_err, controller_instanceobj = get_controller_instance(
-        client, instance_name, inst_id
-    )
-
-    if event_type == EventType.CFT:
-        return handle_cft(
-            describe_err,
-            event,
-            context,
-            client,
-            lambda_client,
-            controller_instanceobj,
-            instance_name,
-        )
-    elif event_type == EventType.SNS:
-        return handle_sns_event(
-            describe_err, event, client, lambda_client, controller_instanceobj, context
-        )
-    elif event_type == EventType.FUNCTION:
-        return handle_function_event(event, context)
-    else:
-        print("Unknown source. Not from CFT or SNS")
-        return False
+    route = EVENT_ROUTES[_get_event_type(event)]
+    cache.clear()
+    deadline.start_invocation(context)
+    invocation = Invocation(event, context)
+    if route.load_state:
+        load_state(invocation.lambda_client, context)
+    if route.revert_temp_sg:
+        invocation.revert_temp_sg()
+    return route.handle(invocation)
@@ -1,11 +1,16 @@
+import asyncio
 import os
 import logging
-from typing import Any
+from typing import Any, Sequence
 
-import boto3
 import requests
+import requests.adapters
 
-from aviatrix_ha.errors.exceptions import AvxError
+from aviatrix_ha.api.endpoints import race_endpoints
+from aviatrix_ha.api.retry import api_error
+from aviatrix_ha.csp.clients import get_client
+from aviatrix_ha.errors.exceptions import AvxError, DeadlineExceeded
+from aviatrix_ha.tools import cache, deadline
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -13,10 +18,31 @@ logger.setLevel(logging.INFO)
 
 OVERRIDE_API_ENDPOINT: str | None = None
 
+CONNECT_TIMEOUT = 5
+# Read timeout in seconds for each controller API action
+API_TIMEOUTS: dict[str, float] = {
+    "get_api_token": 10,
+    "login": 30,
+    "initial_setup_check": 30,
+    "initial_setup": 600,
+    "setup_account_profile": 60,
+    "restore_cloudx_config": 600,
+}
+POOL_MAXSIZE = 4
+
+REQUEST_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.HTTPError,
+    requests.exceptions.Timeout,
+)
+
 
 def _get_aws_account_number() -> str:
-    client = boto3.client("sts")
-    return client.get_caller_identity()["Account"]
+    return cache.get_or_load(
+        "aws_account",
+        None,
+        lambda: get_client("sts").get_caller_identity()["Account"],
+    )
 
 
 def _get_role(role: str, default: str) -> str:
@@ -27,62 +53,122 @@ def _get_role(role: str, default: str) -> str:
 
 
 class ApiClient:
-    def __init__(self, controller_ip: str):
-        self.controller_ip = OVERRIDE_API_ENDPOINT or controller_ip
-        self.endpoint = f"https://{self.controller_ip}/v2/api"
+    """Client for the controller API.
+
+    A single keep-alive session is used for all calls, so that the TCP and TLS
+    handshakes are only paid once. The API token and CID obtained while
+    logging in are reused by all later calls.
+
+    The controller may be reachable at several addresses, e.g. its EIP and
+    its private IP. Given alternatives, select_endpoint() connects to all of
+    them at once and the client uses the first to answer.
+
+    The client is synchronous. HA steps without dependencies between them
+    already run concurrently in threads, each controller action depends on
+    the previous one, and the endpoint race is the only part which gains
+    from asyncio.
+    """
+
+    def __init__(self, controller_ip: str, alternatives: Sequence[str] = ()):
+        candidates = [OVERRIDE_API_ENDPOINT, controller_ip, *alternatives]
+        self.candidates = list(dict.fromkeys(c for c in candidates if c))
+        if not self.candidates:
+            raise AvxError("Could not determine controller API endpoint IP")
+        self._use(self.candidates[0])
         self.cid = ""
+        self.api_token: str | None = None
+        self.session = requests.Session()
+        self.session.mount(
+            "https://",
+            requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=POOL_MAXSIZE
+            ),
+        )
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _use(self, address: str) -> None:
+        self.controller_ip = address
+        self.endpoint = f"https://{address}/v2/api"
+
+    def select_endpoint(self, timeout: float = CONNECT_TIMEOUT) -> str:
+        """Connect to all candidate addresses and use the first to answer.
+
+        Raises TransientApiError if none of them answers.
+        """
+        timeout = deadline.timeout_for(timeout, "connecting")
+        address = asyncio.run(race_endpoints(self.candidates, timeout))
+        if address != self.controller_ip:
+            logger.info("Using controller endpoint %s", address)
+        self._use(address)
+        return address
+
+    def _timeout(self, operation: str) -> tuple[float, float]:
+        """Connect and read timeouts, shortened to fit the current deadline"""
+        read_timeout = deadline.timeout_for(API_TIMEOUTS[operation], operation)
+        return min(CONNECT_TIMEOUT, read_timeout), read_timeout
+
+    def _request(
+        self, method: str, url: str, operation: str, **kwargs: Any
+    ) -> requests.Response:
+        timeout = self._timeout(operation)
+        try:
+            response = self.session.request(
+                method, url, timeout=timeout, verify=False, **kwargs
+            )
+        except requests.exceptions.Timeout as err:
+            if timeout[1] < API_TIMEOUTS[operation]:
+                raise DeadlineExceeded(
+                    f"Deadline reached after {timeout[1]:.0f}s of {operation}"
+                ) from err
+            raise
+        response.raise_for_status()
+        return response
+
+    def _post(self, operation: str, data: dict[str, Any]) -> requests.Response:
+        return self._request("POST", self.endpoint, operation, json=data)
 
     def get_api_token(self) -> str | None:
         try:
-            response = requests.get(
-                f"{self.endpoint}?action=get_api_token", verify=False
+            response = self._request(
+                "GET", f"{self.endpoint}?action=get_api_token", "get_api_token"
             )
-            response.raise_for_status()
-        except (
-            requests.exceptions.ConnectionError,
-            requests.exceptions.HTTPError,
-        ) as err:
-            raise AvxError(f"Failed to get API token: {err}") from err
+        except REQUEST_ERRORS as err:
+            raise api_error("Failed to get API token", err) from err
         response_json = response.json()
         if response_json.get("return") is False:
             return None
-        return response_json.get("results", {}).get("api_token")
+        self.api_token = response_json.get("results", {}).get("api_token")
+        if self.api_token is not None:
+            self.session.headers["X-Access-Key"] = self.api_token
+        return self.api_token
 
     def login(self, username: str, password: str) -> None:
-        token = self.get_api_token()
-        headers = {}
-        if token is not None:
-            headers["X-Access-Key"] = token
+        if self.api_token is None:
+            self.get_api_token()
 
         try:
-            response = requests.post(
-                self.endpoint,
-                json={
+            response = self._post(
+                "login",
+                {
                     "action": "login",
                     "username": username,
                     "password": password,
                 },
-                headers=headers,
-                verify=False,
             )
-            response.raise_for_status()
-        except (
-            requests.exceptions.ConnectionError,
-            requests.exceptions.HTTPError,
-        ) as err:
-            raise AvxError(f"Failed to login: {err}") from err
+        except REQUEST_ERRORS as err:
+            raise api_error("Failed to login", err) from err
         response_json = response.json()
+        if response_json.get("return") is False:
+            raise api_error("Failed to login", response_json)
         self.cid = response_json.get("CID")
 
     def get_initial_setup_status(self) -> dict[str, Any]:
         data = {"CID": self.cid, "action": "initial_setup", "subaction": "check"}
         try:
-            response = requests.post(self.endpoint, json=data, verify=False)
-            response.raise_for_status()
-        except (
-            requests.exceptions.ConnectionError,
-            requests.exceptions.HTTPError,
-        ) as err:
+            response = self._post("initial_setup_check", data)
+        except REQUEST_ERRORS as err:
             logger.error(err)
             return {"return": False, "reason": str(err)}
         return response.json()
@@ -98,20 +184,14 @@ class ApiClient:
             "subaction": "run",
         }
         try:
-            response = requests.post(self.endpoint, json=setup_data, verify=False)
-            response.raise_for_status()
+            response = self._post("initial_setup", setup_data)
             response_json = response.json()
-        except (
-            requests.exceptions.ConnectionError,
-            requests.exceptions.HTTPError,
-        ) as err:
-            raise AvxError(f"Failed to execute initial setup: {err}") from err
+        except REQUEST_ERRORS as err:
+            raise api_error("Failed to execute initial setup", err) from err
         if response_json.get("return") is True:
             logger.info("Successfully initialized the controller")
             return
-        raise AvxError(
-            "Could not setup the new controller: {response_json.get('reason')"
-        )
+        raise api_error("Could not setup the new controller", response_json)
 
     def create_cloud_account(self, account_name: str) -> dict[str, Any]:
         aws_acc_num = _get_aws_account_number()
@@ -130,12 +210,8 @@ class ApiClient:
         logger.info("Trying to create account with data %s" % str(account_data))
         account_data["CID"] = self.cid
         try:
-            response = requests.post(self.endpoint, json=account_data, verify=False)
-            response.raise_for_status()
-        except (
-            requests.exceptions.ConnectionError,
-            requests.exceptions.HTTPError,
-        ) as err:
+            response = self._post("setup_account_profile", account_data)
+        except REQUEST_ERRORS as err:
             logger.error(err)
             response_json = {"return": False, "reason": str(err)}
         else:
@@ -153,12 +229,8 @@ class ApiClient:
         logger.info("Trying to restore config with data %s" % str(restore_data))
         restore_data["CID"] = self.cid
         try:
-            response = requests.post(self.endpoint, json=restore_data, verify=False)
-            response.raise_for_status()
-        except (
-            requests.exceptions.ConnectionError,
-            requests.exceptions.HTTPError,
-        ) as err:
+            response = self._post("restore_cloudx_config", restore_data)
+        except REQUEST_ERRORS as err:
             logger.error(err)
             response_json = {"return": False, "reason": str(err)}
         else:
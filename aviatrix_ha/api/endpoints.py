@@ -0,0 +1,62 @@
+"""Find which of the addresses of a controller answers first"""
+
+import asyncio
+import ssl
+import urllib.parse
+from typing import Sequence
+
+from aviatrix_ha.errors.exceptions import TransientApiError
+
+
+async def check_connect(address: str, timeout: float) -> None:
+    """Open a TCP connection to address and complete a TLS handshake"""
+    url = urllib.parse.urlsplit(f"https://{address}")
+    host = url.hostname or ""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                host, url.port or 443, ssl=context, server_hostname=host
+            ),
+            timeout,
+        )
+    except (OSError, asyncio.TimeoutError) as err:
+        raise TransientApiError(
+            f"Failed to connect to {address}: {err or 'timed out'}"
+        ) from err
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+
+
+async def race_endpoints(candidates: Sequence[str], timeout: float) -> str:
+    """Connect to all candidates at once and return the first to answer.
+
+    Connections still in progress are cancelled once one has answered.
+    Raises TransientApiError if none of them answers.
+    """
+    tasks = {
+        asyncio.ensure_future(check_connect(address, timeout)): address
+        for address in candidates
+    }
+    pending = set(tasks)
+    failures = []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            # Of candidates answering together, the earliest one is preferred
+            for task in sorted(done, key=lambda task: candidates.index(tasks[task])):
+                if task.exception() is None:
+                    return tasks[task]
+                failures.append(str(task.exception()))
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    raise TransientApiError(f"No controller endpoint answered: {failures}")
@@ -1,22 +1,157 @@
+"""Check controller AMIs against the published list of supported images.
+
+The list is indexed by AMI ID once per download. The index is kept in /tmp,
+so warm starts only revalidate it with a conditional request. If the CDN
+cannot be reached or fails with a server error, the kept index is used, or
+else the snapshot bundled with the lambda package.
+"""
+
+import json
 import os
+from dataclasses import dataclass, field
 from typing import Any
 
 import requests
 
 from aviatrix_ha.common.constants import DEV_FLAG
+from aviatrix_ha.tools import deadline
 
 AMI_ID = "https://cdn.aviatrix.com/image-details/aws_controller_image_details.json"
+AMI_ID_TIMEOUT = 10
+# Where the index is kept across warm starts
+AMI_INDEX_CACHE = "/tmp/aviatrix_ha/ami_index.json"
+# Copy of the published list taken when the lambda package was built, see
+# scripts/update_ami_snapshot.py
+AMI_SNAPSHOT = os.path.join(os.path.dirname(__file__), "ami_snapshot.json")
 
 
-def _has_value(data: dict[str, Any], key: str) -> bool:
-    for k, v in data.items():
-        if isinstance(v, dict):
-            if _has_value(v, key):
-                return True
-        else:
-            if v == key:
-                return True
-    return False
+@dataclass(frozen=True)
+class AmiImage:
+    ami_id: str
+    region: str
+    # Path to the image in the published list, e.g. "BYOL" or "g3/amd64"
+    version: str
+
+
+@dataclass
+class AmiIndex:
+    """Supported images by AMI ID, with the validators of the list"""
+
+    images: dict[str, AmiImage] = field(default_factory=dict)
+    etag: str | None = None
+    last_modified: str | None = None
+
+    @classmethod
+    def from_document(
+        cls,
+        document: dict[str, Any],
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ) -> "AmiIndex":
+        index = cls(etag=etag, last_modified=last_modified)
+        stack: list[tuple[tuple[str, ...], dict[str, Any]]] = [((), document)]
+        while stack:
+            path, node = stack.pop()
+            for key, value in node.items():
+                if isinstance(value, dict):
+                    stack.append(((*path, key), value))
+                elif isinstance(value, str) and value.startswith("ami-"):
+                    index.images[value] = AmiImage(value, key, "/".join(path))
+        return index
+
+    @classmethod
+    def load(cls, path: str) -> "AmiIndex":
+        with open(path, encoding="utf-8") as fileh:
+            data = json.load(fileh)
+        return cls(
+            images={
+                ami_id: AmiImage(ami_id, region, version)
+                for ami_id, (region, version) in data["images"].items()
+            },
+            etag=data.get("etag"),
+            last_modified=data.get("last_modified"),
+        )
+
+    def save(self, path: str) -> None:
+        data = {
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "images": {
+                image.ami_id: [image.region, image.version]
+                for image in self.images.values()
+            },
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as fileh:
+            json.dump(data, fileh)
+        os.replace(f"{path}.tmp", path)
+
+    def __contains__(self, ami_id: str) -> bool:
+        return ami_id in self.images
+
+
+def _load_cached_index() -> AmiIndex | None:
+    try:
+        return AmiIndex.load(AMI_INDEX_CACHE)
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _load_snapshot() -> AmiIndex | None:
+    try:
+        with open(AMI_SNAPSHOT, encoding="utf-8") as fileh:
+            return AmiIndex.from_document(json.load(fileh))
+    except (OSError, ValueError):
+        return None
+
+
+def _fallback(cached: AmiIndex | None, err: requests.RequestException) -> AmiIndex:
+    """The kept index or the snapshot, when the list cannot be downloaded"""
+    fallback = cached or _load_snapshot()
+    if fallback is None:
+        raise err
+    print(f"Could not download the AMI list ({err}). Using a copy of it")
+    return fallback
+
+
+def get_ami_index() -> AmiIndex:
+    """Get the index of supported images, downloading the list if it changed.
+
+    Raises requests.RequestException if the list cannot be downloaded and no
+    copy of it is available.
+    """
+    cached = _load_cached_index()
+    headers = {}
+    if cached is not None and cached.etag:
+        headers["If-None-Match"] = cached.etag
+    if cached is not None and cached.last_modified:
+        headers["If-Modified-Since"] = cached.last_modified
+    try:
+        resp = requests.get(
+            AMI_ID,
+            headers=headers,
+            timeout=deadline.timeout_for(AMI_ID_TIMEOUT, "checking the AMI ID"),
+        )
+    except (requests.ConnectionError, requests.Timeout) as err:
+        return _fallback(cached, err)
+    if resp.status_code == 304 and cached is not None:
+        return cached
+    try:
+        resp.raise_for_status()
+    except requests.HTTPError as err:
+        # A server error of the CDN is an outage, while a client error means
+        # the list is gone from where it is looked for
+        if resp.status_code < 500:
+            raise
+        return _fallback(cached, err)
+    index = AmiIndex.from_document(
+        resp.json(), resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+    )
+    try:
+        index.save(AMI_INDEX_CACHE)
+    except OSError as err:
+        print(f"Could not save the AMI index: {err}")
+    return index
 
 
 def check_ami_id(ami_id: str) -> bool:
@@ -26,16 +161,14 @@ def check_ami_id(ami_id: str) -> bool:
         return True
     print("Verifying AMI ID")
     try:
-        resp = requests.get(AMI_ID)
-        resp.raise_for_status()
-        ami_dict = resp.json()
-        if _has_value(ami_dict, ami_id):
-            print("AMI is valid")
+        image = get_ami_index().images.get(ami_id)
+        if image is not None:
+            print(f"AMI is valid: {image.version} image for {image.region}")
             return True
         print(
             "AMI is not latest. Cannot enable Controller HA. Please backup restore to the latest AMI"
             "before enabling controller HA"
         )
-    except requests.RequestException as err:
+    except (requests.RequestException, ValueError) as err:
         print(f"Error checking AMI ID: {err}")
     return False
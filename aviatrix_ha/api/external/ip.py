@@ -1,7 +1,113 @@
+"""Discover the public IP address the lambda function connects from.
+
+Several sources are asked at once and the first valid answer is used. The
+address is cached for warm invocations of the same lambda container, which
+keep their egress address, and looked up again once the cache is stale.
+"""
+
+import concurrent.futures
+import ipaddress
+import logging
+import os
+import threading
+import time
+from typing import Sequence
+
 import requests
 
+from aviatrix_ha.errors.exceptions import AvxError
+from aviatrix_ha.tools import deadline
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Services answering with the address of the caller, as plain text. The
+# PUBLIC_IP_SOURCES environment variable, a comma separated list of URLs,
+# takes precedence.
+DEFAULT_PUBLIC_IP_SOURCES = (
+    "https://checkip.amazonaws.com",
+    "https://api.ipify.org",
+    "https://ifconfig.me/ip",
+)
+PUBLIC_IP_TIMEOUT = 10
+# Age after which a cached address is looked up again
+PUBLIC_IP_CACHE_TTL = 300
+# Age up to which a cached address is used when no source answers
+PUBLIC_IP_MAX_STALE = 3600
+
+_cached: tuple[str, float] | None = None
+_cache_lock = threading.Lock()
+
+
+def get_public_ip_sources() -> list[str]:
+    sources = os.environ.get("PUBLIC_IP_SOURCES", "")
+    return [url.strip() for url in sources.split(",") if url.strip()] or list(
+        DEFAULT_PUBLIC_IP_SOURCES
+    )
+
+
+def validate_public_ip(text: str) -> str:
+    """The IPv4 address in text, or ValueError if it does not hold one"""
+    address = ipaddress.IPv4Address(text.strip())
+    if (
+        address.is_loopback
+        or address.is_unspecified
+        or address.is_multicast
+        or address.is_link_local
+    ):
+        raise ValueError(f"{address} is not a usable source address")
+    return str(address)
+
+
+def _query(url: str, timeout: float) -> str:
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    return validate_public_ip(response.text)
+
+
+def resolve_public_ip(sources: Sequence[str], timeout: float) -> str:
+    """Ask all sources at once and return the first valid answer"""
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=len(sources), thread_name_prefix="public-ip"
+    )
+    futures = {executor.submit(_query, url, timeout): url for url in sources}
+    failures = {}
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                address = future.result()
+            except (requests.exceptions.RequestException, ValueError) as err:
+                failures[futures[future]] = str(err)
+                continue
+            logger.info("Public IP %s reported by %s", address, futures[future])
+            return address
+    finally:
+        # Slower sources are left to time out on their own
+        executor.shutdown(wait=False, cancel_futures=True)
+    raise AvxError(f"Could not determine the public IP: {failures}")
+
+
+def get_public_ip(sources: Sequence[str] | None = None) -> str:
+    """The public IP of the lambda function, from the cache if fresh enough"""
+    global _cached  # pylint: disable=global-statement
+    with _cache_lock:
+        cached = _cached
+    if cached is not None and time.time() - cached[1] < PUBLIC_IP_CACHE_TTL:
+        return cached[0]
+    timeout = deadline.timeout_for(PUBLIC_IP_TIMEOUT, "looking up the public IP")
+    try:
+        address = resolve_public_ip(sources or get_public_ip_sources(), timeout)
+    except AvxError as err:
+        if cached is None or time.time() - cached[1] >= PUBLIC_IP_MAX_STALE:
+            raise
+        logger.warning("%s. Using the last known public IP %s", err, cached[0])
+        return cached[0]
+    with _cache_lock:
+        _cached = (address, time.time())
+    return address
+
 
-def get_public_ip() -> str:
-    r = requests.get("https://checkip.amazonaws.com")
-    r.raise_for_status()
-    return r.text.strip()
+def clear_public_ip_cache() -> None:
+    global _cached  # pylint: disable=global-statement
+    with _cache_lock:
+        _cached = None
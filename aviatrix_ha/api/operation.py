@@ -0,0 +1,138 @@
+"""Long running controller API operations, polled until they complete"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Generic, TypeVar
+
+from aviatrix_ha.errors.exceptions import OperationInFlight
+from aviatrix_ha.tools import deadline
+from aviatrix_ha.tools.backoff import BackoffPolicy
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+T = TypeVar("T")
+
+
+class LongRunningOperation(Generic[T]):
+    """A controller API action which may run for minutes, like a restore.
+
+    The action is a blocking call, made from a worker thread while the caller
+    polls for completion with increasing intervals. The worker uses the
+    deadline of the caller. The caller stops waiting once its deadline
+    passes, leaving the action running on the controller.
+
+    A HA run resumed in a later invocation attaches to an operation started
+    earlier instead of starting it again. An attached operation has no result:
+    it completes when its status probe says so. Without a probe, or if the
+    probe never reports completion, it is waited for until the window in
+    which the controller may still be running the action has passed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        started_at: float,
+        window: float,
+        status: Callable[[], bool] | None = None,
+    ):
+        self.name = name
+        self.started_at = started_at
+        self.window = window
+        self.status = status
+        self.polls = 0
+        self.completed = False
+        self._thread: threading.Thread | None = None
+        self._done = threading.Event()
+        self._result: T | None = None
+        self._error: BaseException | None = None
+
+    @classmethod
+    def start(
+        cls,
+        name: str,
+        action: Callable[[], T],
+        window: float,
+        status: Callable[[], bool] | None = None,
+    ) -> "LongRunningOperation[T]":
+        operation: LongRunningOperation[T] = cls(name, time.time(), window, status)
+        operation._thread = threading.Thread(
+            target=operation._run,
+            args=(action, deadline.current()),
+            name=name,
+            daemon=True,
+        )
+        operation._thread.start()
+        return operation
+
+    @property
+    def attached(self) -> bool:
+        return self._thread is None
+
+    def elapsed(self) -> float:
+        return time.time() - self.started_at
+
+    def _run(self, action: Callable[[], T], until: deadline.Deadline | None) -> None:
+        try:
+            if until is None:
+                self._result = action()
+            else:
+                with deadline.scoped(until):
+                    self._result = action()
+        except BaseException as err:  # pylint: disable=broad-except
+            self._error = err
+        finally:
+            self._done.set()
+
+    def _poll(self) -> bool:
+        """Whether the operation is over, one way or the other"""
+        self.polls += 1
+        if self._done.is_set():
+            self.completed = True
+            return True
+        if self.status is not None:
+            try:
+                self.completed = self.status()
+            except Exception as err:  # pylint: disable=broad-except
+                logger.warning("Could not get the status of %s: %s", self.name, err)
+            if self.completed:
+                return True
+        return self.attached and self.elapsed() >= self.window
+
+    def wait(
+        self,
+        policy: BackoffPolicy,
+        deadline_exceeded: Callable[[], bool],
+        on_progress: Callable[["LongRunningOperation[T]"], Any] | None = None,
+    ) -> T | None:
+        """Poll until the operation is over and return the result of the action.
+
+        Raises OperationInFlight if deadline_exceeded() turns true first, and
+        the error of the action if it failed. The call made by the action is
+        cut short by the same deadline, so a failure once it has passed also
+        leaves the operation in flight.
+        """
+        delays = policy.delays()
+        while not self._poll():
+            if on_progress is not None:
+                on_progress(self)
+            if deadline_exceeded():
+                raise OperationInFlight(
+                    f"{self.name} still running after {self.elapsed():.0f}s"
+                )
+            delay = next(delays)
+            current = deadline.current()
+            if current is not None:
+                delay = max(min(delay, current.remaining()), 0)
+            # Wakes up as soon as the action returns
+            self._done.wait(delay)
+        if on_progress is not None:
+            on_progress(self)
+        if self._error is not None:
+            if deadline_exceeded():
+                raise OperationInFlight(
+                    f"{self.name} cut short after {self.elapsed():.0f}s: {self._error}"
+                ) from self._error
+            raise self._error
+        return self._result
@@ -0,0 +1,82 @@
+"""Probe a newly launched controller until it accepts logins"""
+
+import logging
+import time
+from typing import Callable
+
+from aviatrix_ha.api.client import ApiClient
+from aviatrix_ha.api.retry import Retrier
+from aviatrix_ha.common.constants import READINESS_CONNECT_TIMEOUT
+from aviatrix_ha.errors.exceptions import DeadlineExceeded
+from aviatrix_ha.tools.backoff import BackoffPolicy, RetryStats
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class ReadinessProber:
+    """Wait for a controller to become ready in three stages.
+
+    1. connect: a TCP connection and TLS handshake to the API endpoint, or
+       to all candidate endpoints at once
+    2. token: the get_api_token action, which needs the API to be up
+    3. login: a full login
+
+    Cheaper stages are tried first, so an unreachable controller is detected
+    quickly and retried with a short backoff.
+    """
+
+    def __init__(
+        self,
+        client: ApiClient,
+        policy: BackoffPolicy,
+        deadline_exceeded: Callable[[], bool],
+        on_retry: Callable[[], None] | None = None,
+    ):
+        self.client = client
+        self.policy = policy
+        self.deadline_exceeded = deadline_exceeded
+        self.on_retry = on_retry
+
+    def check_connect(self) -> None:
+        self.client.select_endpoint(READINESS_CONNECT_TIMEOUT)
+
+    def wait_until_ready(self, username: str, password: str) -> RetryStats:
+        stages: list[tuple[str, Callable[[], object]]] = [
+            ("connect", self.check_connect),
+            ("token", self.client.get_api_token),
+            ("login", lambda: self.client.login(username, password)),
+        ]
+        stats = RetryStats()
+        # Errors which retrying does not fix, like a wrong password, fail
+        # after a few attempts rather than at the deadline.
+        retrier = Retrier(self.policy)
+        while not self.deadline_exceeded():
+            stats.attempts += 1
+            for stage, probe in stages:
+                try:
+                    probe()
+                except Exception as err:  # pylint: disable=broad-except
+                    delay = retrier.next_delay(f"Controller {stage} failed", err)
+                    logger.warning(
+                        "Controller not ready (%s failed: %s): trying again in %.1fs",
+                        stage,
+                        err,
+                        delay,
+                    )
+                    stats.record_failure(stage, delay)
+                    if self.on_retry is not None:
+                        self.on_retry()
+                    time.sleep(delay)
+                    break
+            else:
+                logger.info(
+                    "Controller ready after %d probes, %.1fs spent waiting",
+                    stats.attempts,
+                    stats.waited,
+                )
+                return stats
+        raise DeadlineExceeded(
+            f"Deadline exceeded while waiting for the controller to be ready after"
+            f" {stats.attempts} probes: {stats.failures}"
+        )
@@ -0,0 +1,102 @@
+"""Classification of failed controller API calls, and how each is retried"""
+
+import re
+from typing import Any
+
+import requests
+
+from aviatrix_ha.errors.exceptions import (
+    AvxError,
+    DeadlineExceeded,
+    PermanentApiError,
+    TransientApiError,
+)
+from aviatrix_ha.tools.backoff import BackoffPolicy, RetryPolicy
+
+ApiErrorType = type[TransientApiError] | type[PermanentApiError]
+
+# Reasons given by the controller for failed actions. Transient reasons are
+# matched first. A reason matching neither is treated as transient, as a
+# controller which is still starting up gives all sorts of reasons.
+TRANSIENT_REASON = re.compile(
+    r"not ready|try again|in progress|busy|\bCID\b|connection|timed? ?out"
+    r"|temporar|unavailable|initiali[sz]",
+    re.IGNORECASE,
+)
+PERMANENT_REASON = re.compile(
+    r"invalid|\brole\b|not authorized|unauthorized|access ?denied|permission"
+    r"|forbidden|credential|password|does not exist|not found",
+    re.IGNORECASE,
+)
+# Client errors which are worth retrying
+TRANSIENT_STATUS_CODES = frozenset({408, 425, 429})
+
+RETRY_POLICIES: dict[ApiErrorType, RetryPolicy] = {
+    TransientApiError: RetryPolicy(BackoffPolicy(1, 10)),
+    # IAM changes take a few seconds to be seen everywhere, so even role
+    # errors get a couple of quick retries.
+    PermanentApiError: RetryPolicy(BackoffPolicy(1, 2), max_attempts=3),
+}
+
+
+def classify(failure: BaseException | dict[str, Any]) -> ApiErrorType:
+    """Whether a failed call, or a response with "return" false, is transient"""
+    if isinstance(failure, (TransientApiError, PermanentApiError)):
+        return type(failure)
+    if isinstance(failure, requests.exceptions.HTTPError):
+        if failure.response is not None:
+            status = failure.response.status_code
+            if status >= 500 or status in TRANSIENT_STATUS_CODES:
+                return TransientApiError
+            return PermanentApiError
+    if isinstance(
+        failure, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    ):
+        return TransientApiError
+    if isinstance(failure, dict):
+        reason = str(failure.get("reason", ""))
+    else:
+        reason = str(failure)
+    if TRANSIENT_REASON.search(reason):
+        return TransientApiError
+    if PERMANENT_REASON.search(reason):
+        return PermanentApiError
+    return TransientApiError
+
+
+def api_error(what: str, failure: BaseException | dict[str, Any]) -> AvxError:
+    """An error for a failed call, of the class it is classified as"""
+    if isinstance(failure, dict):
+        failure = failure.get("reason") or failure
+    return classify(failure)(f"{what}: {failure}")
+
+
+class Retrier:
+    """Decides whether, and after which delay, a failed call is retried.
+
+    Attempts are counted per category, so a few transient failures do not
+    use up the attempts allowed for a permanent one.
+    """
+
+    def __init__(self, transient: BackoffPolicy | None = None):
+        self.policies = dict(RETRY_POLICIES)
+        if transient is not None:
+            self.policies[TransientApiError] = RetryPolicy(transient)
+        self.failures: dict[ApiErrorType, int] = {}
+        self._delays = {
+            category: policy.backoff.delays()
+            for category, policy in self.policies.items()
+        }
+
+    def next_delay(self, what: str, failure: BaseException | dict[str, Any]) -> float:
+        """Delay before the next attempt, or raise if there must not be one"""
+        if isinstance(failure, DeadlineExceeded):
+            raise failure
+        category = classify(failure)
+        self.failures[category] = self.failures.get(category, 0) + 1
+        if not self.policies[category].allows(self.failures[category]):
+            error = api_error(what, failure)
+            if isinstance(failure, BaseException):
+                raise error from failure
+            raise error
+        return next(self._delays[category])
@@ -1,6 +1,16 @@
 HANDLE_HA_TIMEOUT = 840  # 14 min
-WAIT_DELAY = 30
+HA_RUN_BUDGET = 3600  # 1 hour, across all continuations of a HA run
+CONTINUATION_RESERVE = 60  # time kept for cleanup and starting a continuation
+CONTINUATION_EVENT_KEY = "AviatrixHAContinuation"
+HA_LOCK_LEASE = 900  # 15 min, the longest a lambda invocation can run
+CHECKPOINT_SAVE_FAILURES = 2  # consecutive failed saves failing a HA run
+READINESS_BACKOFF_BASE = 1
+READINESS_BACKOFF_CAP = 10
+READINESS_CONNECT_TIMEOUT = 5
 INITIAL_SETUP_DELAY = 10
 API_TIMEOUT = 30
+OPERATION_POLL_BASE = 2  # first poll of a long running controller operation
+OPERATION_POLL_CAP = 30
+HA_STEP_WORKERS = 4
 DEV_FLAG = "dev_flag"
 TEMP_ACCOUNT_NAME = "tempacc"
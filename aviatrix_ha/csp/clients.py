@@ -0,0 +1,73 @@
+"""Shared AWS clients.
+
+Creating a boto3 client takes tens of milliseconds and every client has its
+own connection pool. Clients are therefore created once per process and
+reused by all calls, including those of later warm invocations.
+
+Calls made by the clients fail without being sent once the current deadline
+has passed, see aviatrix_ha.tools.deadline.
+"""
+
+import os
+import threading
+from typing import Any, cast
+
+import boto3
+import botocore.config
+
+from aviatrix_ha.tools import deadline
+
+# Named client configurations
+CLIENT_CONFIGS = {
+    "default": botocore.config.Config(
+        retries={"max_attempts": 5, "mode": "standard"},
+        connect_timeout=5,
+        read_timeout=30,
+        # Enough for the thread pools used during HA setup and failover
+        max_pool_connections=16,
+    ),
+}
+
+# Clients created during the init phase of the lambda function
+PRELOADED_SERVICES = ("ec2", "lambda", "s3")
+
+_clients: dict[tuple[str, str | None, str], Any] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service: str, region: str | None = None, config: str = "default") -> Any:
+    """Get the shared client for a service, region and named configuration.
+
+    Without a region, the region of the lambda function is used.
+    """
+    region = (
+        region or os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION")
+    )
+    key = (service, region, config)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    # boto3's default session is not thread safe
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            # Services are named at runtime, which the typed overloads of
+            # boto3.client do not accept
+            client = cast(Any, boto3).client(
+                service, region_name=region, config=CLIENT_CONFIGS[config]
+            )
+            client.meta.events.register("before-call", deadline.check_before_aws_call)
+            _clients[key] = client
+    return client
+
+
+def reset_clients() -> None:
+    """Drop all shared clients, e.g. after credentials have changed"""
+    with _clients_lock:
+        _clients.clear()
+
+
+def preload_clients(services: tuple[str, ...] = PRELOADED_SERVICES) -> None:
+    """Create the commonly used clients ahead of the first invocation"""
+    for service in services:
+        get_client(service)
@@ -1,7 +1,14 @@
 """ CSP calls related to elastic IP"""
 
-from types_boto3_ec2.client import EC2Client
-from types_boto3_ec2.type_defs import InstanceTypeDef
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from aviatrix_ha.tools import cache
+
+if TYPE_CHECKING:
+    from types_boto3_ec2.client import EC2Client
+    from types_boto3_ec2.type_defs import InstanceTypeDef
 
 
 def is_ip_elastic(ec2_client: EC2Client, ip_: str) -> bool:
@@ -34,6 +41,7 @@ def assign_eip(
         client.associate_address(
             AllocationId=eip_alloc_id, InstanceId=controller_instanceobj["InstanceId"]
         )
+        cache.invalidate("instance", controller_instanceobj["InstanceId"])
     except Exception as err:
         if cf_req and "InvalidAddress.NotFound" in str(err):
             print(
@@ -1,12 +1,18 @@
 """ CSP APis related to instances"""
 
+from __future__ import annotations
+
 import base64
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import boto3
 import botocore
-from types_boto3_ec2.client import EC2Client
-from types_boto3_ec2.type_defs import InstanceTypeDef
+
+from aviatrix_ha.csp.clients import get_client
+from aviatrix_ha.tools import cache
+
+if TYPE_CHECKING:
+    from types_boto3_ec2.client import EC2Client
+    from types_boto3_ec2.type_defs import InstanceTypeDef
 
 
 def get_controller_instance(
@@ -42,10 +48,28 @@ def get_controller_instance(
             str(err),
         )
         print(describe_err)
+    else:
+        cache.put(
+            "instance", controller_instanceobj["InstanceId"], controller_instanceobj
+        )
 
     return describe_err, controller_instanceobj
 
 
+def load_instance(client: EC2Client, inst_id: str) -> InstanceTypeDef:
+    """Describe an instance, bypassing the cache"""
+    return client.describe_instances(InstanceIds=[inst_id])["Reservations"][0][
+        "Instances"
+    ][0]
+
+
+def describe_instance(client: EC2Client, inst_id: str) -> InstanceTypeDef:
+    """Describe an instance, reusing an earlier description in this invocation"""
+    return cache.get_or_load(
+        "instance", inst_id, lambda: load_instance(client, inst_id)
+    )
+
+
 def enable_t2_unlimited(client: EC2Client, inst_id: str) -> None:
     """Modify instance credit to unlimited for T2"""
     print("Enabling T2 unlimited for %s" % inst_id)
@@ -63,7 +87,7 @@ def enable_t2_unlimited(client: EC2Client, inst_id: str) -> None:
 def is_controller_termination_protected(inst_id: str) -> bool:
     """Check if the controller instance has API termination protection"""
     try:
-        enabled = boto3.client("ec2").describe_instance_attribute(
+        enabled = get_client("ec2").describe_instance_attribute(
             Attribute="disableApiTermination", InstanceId=inst_id
         )["DisableApiTermination"]["Value"]
         print(
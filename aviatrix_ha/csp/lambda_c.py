@@ -1,13 +1,41 @@
+from __future__ import annotations
+
+import contextlib
 import json
 import os
-from typing import Any
+import threading
+from typing import TYPE_CHECKING, Any, Iterator
 
 import botocore
-from types_boto3_ec2.client import EC2Client
-from types_boto3_ec2.type_defs import InstanceTypeDef, TagTypeDef
-from types_boto3_lambda.client import LambdaClient
 
+from aviatrix_ha.csp.state import StateStore, store_from_url
 from aviatrix_ha.errors.exceptions import AvxError
+from aviatrix_ha.tools import cache
+
+if TYPE_CHECKING:
+    from types_boto3_ec2.client import EC2Client
+    from types_boto3_ec2.type_defs import InstanceTypeDef, TagTypeDef
+    from types_boto3_lambda.client import LambdaClient
+
+# Variables set by the CloudFormation template on the lambda function. These
+# are never overridden by values read from a state store.
+BOOTSTRAP_VARS = frozenset(
+    {
+        "AVIATRIX_TAG",
+        "AWS_ROLE_APP_NAME",
+        "AWS_ROLE_EC2_NAME",
+        "SUBNETLIST",
+        "S3_BUCKET_BACK",
+        "API_PRIVATE_ACCESS",
+        "NOTIF_EMAIL",
+        "HA_STATE_STORE",
+    }
+)
+
+_state_stores: dict[tuple[str, str], StateStore] = {}
+# Number of open environment transactions for each lambda function
+_open_transactions: dict[str, int] = {}
+_env_lock = threading.RLock()
 
 
 def wait_function_update_successful(
@@ -28,6 +56,12 @@ def wait_function_update_successful(
 
 def get_lambda_tags(lambda_client: LambdaClient, arn: str) -> list[TagTypeDef]:
     """Get tags for the lambda function"""
+    return cache.get_or_load(
+        "lambda_tags", arn, lambda: _list_lambda_tags(lambda_client, arn)
+    )
+
+
+def _list_lambda_tags(lambda_client: LambdaClient, arn: str) -> list[TagTypeDef]:
     try:
         response = lambda_client.list_tags(Resource=arn)
         tags = response.get("Tags", {})
@@ -41,6 +75,17 @@ def get_lambda_tags(lambda_client: LambdaClient, arn: str) -> list[TagTypeDef]:
     ]
 
 
+def get_lambda_function_arn(lambda_client: LambdaClient, function_name: str) -> str:
+    """Get the ARN of the lambda function"""
+    return cache.get_or_load(
+        "lambda_function_arn",
+        function_name,
+        lambda: lambda_client.get_function(FunctionName=function_name)["Configuration"][
+            "FunctionArn"
+        ],
+    )
+
+
 def set_environ(
     client: EC2Client,
     lambda_client: LambdaClient,
@@ -156,19 +201,12 @@ def set_environ(
         # 'AVIATRIX_PASS_BACK': os.environ.get('AVIATRIX_PASS_BACK'),
     }
     print("Setting environment %s" % env_dict)
+    update_env_dict(lambda_client, context, env_dict)
 
-    wait_function_update_successful(lambda_client, context.function_name)
-    lambda_client.update_function_configuration(
-        FunctionName=context.function_name, Environment={"Variables": env_dict}
-    )
-    os.environ.update(env_dict)
 
-
-def update_env_dict(
-    lambda_client: LambdaClient, context: Any, replace_dict: dict[str, str]
-) -> None:
-    """Update particular variables in the Environment variables in lambda"""
-    env_dict: dict[str, str] = {
+def _get_env_dict() -> dict[str, str]:
+    """Get the variables stored in the lambda environment from os.environ"""
+    return {
         "EIP": os.environ.get("EIP", ""),
         "USE_EIP": os.environ.get("USE_EIP", ""),
         "AMI_ID": os.environ.get("AMI_ID", ""),
@@ -202,11 +240,134 @@ def update_env_dict(
         # 'AVIATRIX_USER_BACK': os.environ.get('AVIATRIX_USER_BACK'),
         # 'AVIATRIX_PASS_BACK': os.environ.get('AVIATRIX_PASS_BACK'),
     }
-    env_dict.update(replace_dict)
-    os.environ.update(replace_dict)
 
-    wait_function_update_successful(lambda_client, context.function_name)
-    lambda_client.update_function_configuration(
-        FunctionName=context.function_name, Environment={"Variables": env_dict}
+
+class LambdaEnvStateStore(StateStore):
+    """State kept in the environment variables of the lambda function"""
+
+    def __init__(self, lambda_client: LambdaClient, function_name: str) -> None:
+        super().__init__()
+        self.lambda_client = lambda_client
+        self.function_name = function_name
+
+    def _get_variables(self) -> dict[str, str]:
+        config = self.lambda_client.get_function_configuration(
+            FunctionName=self.function_name
+        )
+        return dict(config.get("Environment", {}).get("Variables", {}))
+
+    def _read(self) -> dict[str, Any]:
+        try:
+            return self._get_variables()
+        except botocore.exceptions.ClientError as err:
+            print(f"Could not get current environment: {err}")
+            return {}
+
+    def is_saved(self, state: dict[str, Any]) -> bool:
+        # The environment also holds variables which are not part of the state
+        return self.saved is not None and all(
+            self.saved.get(key) == value for key, value in state.items()
+        )
+
+    def _write(self, state: dict[str, Any]) -> None:
+        wait_function_update_successful(self.lambda_client, self.function_name)
+        # The environment is replaced as a whole. Variables which are not part
+        # of the HA state, e.g. HA_STATE_STORE or HA_LOCK_STORE, are kept.
+        try:
+            variables = self._get_variables()
+        except botocore.exceptions.ClientError as err:
+            raise AvxError(f"Could not get current environment: {err}") from err
+        variables.update(state)
+        self.lambda_client.update_function_configuration(
+            FunctionName=self.function_name, Environment={"Variables": variables}
+        )
+
+    def __repr__(self) -> str:
+        return f"lambda:{self.function_name}"
+
+
+def get_state_store(lambda_client: LambdaClient, function_name: str) -> StateStore:
+    """Get the store for the HA state selected by HA_STATE_STORE.
+
+    The default is the environment of the lambda function. See
+    aviatrix_ha.csp.state for the other supported stores.
+    """
+    url = os.environ.get("HA_STATE_STORE", "lambda")
+    with _env_lock:
+        store = _state_stores.get((url, function_name))
+        if store is None:
+            if url in ("", "lambda"):
+                store = LambdaEnvStateStore(lambda_client, function_name)
+            else:
+                store = store_from_url(url)
+            _state_stores[(url, function_name)] = store
+        if isinstance(store, LambdaEnvStateStore):
+            store.lambda_client = lambda_client
+    return store
+
+
+def load_state(lambda_client: LambdaClient, context: Any) -> None:
+    """Read the HA state once at the start of an invocation.
+
+    The runtime already loads the lambda environment into os.environ, so for
+    that store only the cached copy is dropped. It is read again lazily
+    before the next write.
+    """
+    store = get_state_store(lambda_client, context.function_name)
+    if isinstance(store, LambdaEnvStateStore):
+        store.saved = None
+        return
+    state = store.load()
+    print(f"Loaded HA state from {store}")
+    os.environ.update(
+        {key: str(value) for key, value in state.items() if key not in BOOTSTRAP_VARS}
     )
-    print("Updated environment dictionary")
+
+
+def flush_env(lambda_client: LambdaClient, context: Any) -> None:
+    """Write the environment to the state store, if anything changed"""
+    with _env_lock:
+        store = get_state_store(lambda_client, context.function_name)
+        if not store.save(_get_env_dict()):
+            print("Environment is unchanged. Skipping update")
+            return
+        print(f"Updated environment dictionary in {store}")
+
+
+@contextlib.contextmanager
+def env_transaction(lambda_client: LambdaClient, context: Any) -> Iterator[None]:
+    """Defer environment updates made inside the block.
+
+    All deferred updates are written with a single update_function_configuration
+    call when the outermost transaction ends, even if the block raised.
+    """
+    function_name = context.function_name
+    with _env_lock:
+        _open_transactions[function_name] = _open_transactions.get(function_name, 0) + 1
+    try:
+        yield
+    finally:
+        with _env_lock:
+            _open_transactions[function_name] -= 1
+            if not _open_transactions[function_name]:
+                flush_env(lambda_client, context)
+
+
+def update_env_dict(
+    lambda_client: LambdaClient,
+    context: Any,
+    replace_dict: dict[str, str],
+    durable: bool = False,
+) -> None:
+    """Update particular variables in the Environment variables in lambda
+
+    Inside an env_transaction the write is deferred, unless durable is set.
+    Durable updates are used for markers that must survive the lambda being
+    interrupted, and also write any updates deferred so far.
+    """
+    with _env_lock:
+        os.environ.update(replace_dict)
+        if _open_transactions.get(context.function_name) and not durable:
+            print(f"Deferring update of environment variables {list(replace_dict)}")
+            return
+        flush_env(lambda_client, context)
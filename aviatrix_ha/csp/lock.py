@@ -0,0 +1,101 @@
+"""Lease based lock, so only one invocation handles a controller at a time"""
+
+import os
+import time
+import uuid
+from typing import Any
+
+from aviatrix_ha.common.constants import HA_LOCK_LEASE
+from aviatrix_ha.csp.state import MemoryStateStore, StateStore, store_from_url
+from aviatrix_ha.errors.exceptions import AvxError, LockHeldError, StateConflictError
+
+# Where locks are kept. The URL may use {bucket}, the backup bucket, {tag},
+# the controller tag and {instance_id}, the controller instance. The store
+# must support conditional writes. "memory" keeps locks in this process only.
+DEFAULT_LOCK_STORE = "s3://{bucket}/avx-ha/locks/{tag}/{instance_id}.json"
+
+_memory_locks: dict[str, dict[str, Any]] = {}
+
+
+class LeaseLock:
+    """A lock which expires after a lease time, unless taken again.
+
+    The lock is a document in a state store, taken with a conditional write:
+    of two invocations racing for the lock, only one write succeeds. An
+    invocation which dies while holding the lock blocks others only until
+    the lease expires.
+    """
+
+    def __init__(
+        self,
+        store: StateStore,
+        owner: str | None = None,
+        lease: float = HA_LOCK_LEASE,
+    ):
+        self.store = store
+        self.owner = owner or str(uuid.uuid4())
+        self.lease = lease
+        self.holder: dict[str, Any] = {}
+
+    def acquire(self) -> bool:
+        """Take the lock, or extend it if already held by the same owner.
+
+        Returns False if another owner holds an unexpired lease. Raises
+        AvxError if the lock store cannot be used: running without the lock
+        could let two invocations handle the same controller.
+        """
+        now = time.time()
+        try:
+            current = self.store.load()
+            if (
+                current.get("owner") not in (None, self.owner)
+                and current.get("expires_at", 0) > now
+            ):
+                self.holder = current
+                return False
+            self.store.save(
+                {
+                    "owner": self.owner,
+                    "acquired_at": now,
+                    "expires_at": now + self.lease,
+                }
+            )
+        except StateConflictError:
+            # Another invocation took the lock between our read and write
+            self.holder = {}
+            return False
+        except AvxError as err:
+            raise AvxError(f"Could not take lock {self.store}: {err}") from err
+        return True
+
+    def release(self) -> None:
+        try:
+            current = self.store.load()
+            if current.get("owner") == self.owner:
+                self.store.save({})
+        except AvxError as err:
+            # The lease expires on its own
+            print(f"Could not release lock {self.store}: {err}")
+
+    def __enter__(self) -> "LeaseLock":
+        if not self.acquire():
+            raise LockHeldError(
+                f"{self.store} is held by {self.holder.get('owner', 'another owner')}"
+                f" until {self.holder.get('expires_at', 'unknown')}"
+            )
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.release()
+
+
+def get_ha_lock(instance_id: str, owner: str | None = None) -> LeaseLock:
+    """Get the lock for HA operations on a controller instance"""
+    url = os.environ.get("HA_LOCK_STORE", DEFAULT_LOCK_STORE)
+    bucket = os.environ.get("S3_BUCKET_BACK", "")
+    tag = os.environ.get("AVIATRIX_TAG", "")
+    if url == "memory" or ("{bucket}" in url and not bucket):
+        backend = _memory_locks.setdefault(f"{tag}/{instance_id}", {})
+        return LeaseLock(MemoryStateStore(backend), owner)
+    store = store_from_url(url.format(bucket=bucket, tag=tag, instance_id=instance_id))
+    return LeaseLock(store, owner)
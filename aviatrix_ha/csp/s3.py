@@ -1,35 +1,43 @@
+from __future__ import annotations
+
+import dataclasses
+import datetime
 import os
 import time
+from typing import TYPE_CHECKING
 
-import boto3
 import botocore
-from types_boto3_ec2.type_defs import InstanceTypeDef
 
+from aviatrix_ha.csp.clients import get_client
 from aviatrix_ha.errors.exceptions import AvxError
 
+if TYPE_CHECKING:
+    from types_boto3_ec2.type_defs import InstanceTypeDef
+
 VERSION_PREFIX = "UserConnect-"
 MAXIMUM_BACKUP_AGE = 24 * 3600 * 3  # 3 days
 AWS_US_EAST_REGION = "us-east-1"
 
 
-def retrieve_controller_version(version_file: str) -> tuple[str, str]:
-    """Get the controller version from backup file"""
-    print("Retrieving version from file " + str(version_file))
-    s3c = boto3.client("s3", region_name=os.environ["S3_BUCKET_REGION"])
-    try:
-        with open("/tmp/version_ctrlha.txt", "wb") as data:
-            s3c.download_fileobj(
-                os.environ.get("S3_BUCKET_BACK", ""), version_file, data
-            )
-    except botocore.exceptions.ClientError as err:
-        if err.response["Error"]["Code"] == "404":
-            print("The object does not exist.")
-            raise AvxError("The cloudx version file does not exist") from err
-        raise
-    if not os.path.exists("/tmp/version_ctrlha.txt"):
-        raise AvxError("Unable to open version file")
-    with open("/tmp/version_ctrlha.txt") as fileh:
-        buf = fileh.read()
+@dataclasses.dataclass(frozen=True)
+class ControllerVersion:
+    """Controller version read from a version file in the S3 bucket"""
+
+    version: str
+    version_with_build: str
+    etag: str
+
+
+# Versions read during this and earlier warm invocations, keyed by bucket and
+# version file. Entries are revalidated against the ETag of the S3 object.
+_version_cache: dict[tuple[str, str], ControllerVersion] = {}
+
+
+def clear_version_cache() -> None:
+    _version_cache.clear()
+
+
+def _parse_controller_version(buf: str) -> tuple[str, str]:
     print("Retrieved version " + str(buf))
     if not buf:
         raise AvxError("Version file is empty")
@@ -50,11 +58,50 @@ def retrieve_controller_version(version_file: str) -> tuple[str, str]:
     return ctrl_version, ctrl_version_with_build
 
 
+def get_controller_version(version_file: str) -> ControllerVersion:
+    """Get the controller version from backup file.
+
+    A cached version is revalidated with a conditional GET, so the file is
+    only transferred when it has changed.
+    """
+    bucket = os.environ.get("S3_BUCKET_BACK", "")
+    cached = _version_cache.get((bucket, version_file))
+    print("Retrieving version from file " + str(version_file))
+    s3c = get_client("s3", os.environ["S3_BUCKET_REGION"])
+    kwargs = {"IfNoneMatch": cached.etag} if cached else {}
+    try:
+        rsp = s3c.get_object(Bucket=bucket, Key=version_file, **kwargs)
+    except botocore.exceptions.ClientError as err:
+        code = err.response["Error"]["Code"]
+        if code == "304" and cached:
+            print("Version file is unchanged, using cached version")
+            return cached
+        _version_cache.pop((bucket, version_file), None)
+        if code in ("404", "NoSuchKey"):
+            print("The object does not exist.")
+            raise AvxError("The cloudx version file does not exist") from err
+        raise
+    try:
+        buf = rsp["Body"].read().decode()
+    except UnicodeDecodeError as err:
+        raise AvxError("Unable to decode version file") from err
+    ctrl_version, ctrl_version_with_build = _parse_controller_version(buf)
+    version = ControllerVersion(ctrl_version, ctrl_version_with_build, rsp["ETag"])
+    _version_cache[(bucket, version_file)] = version
+    return version
+
+
+def retrieve_controller_version(version_file: str) -> tuple[str, str]:
+    """Get the controller version from backup file"""
+    version = get_controller_version(version_file)
+    return version.version, version.version_with_build
+
+
 def verify_bucket() -> tuple[bool, str]:
     """Verify S3 and controller account credentials"""
     print("Verifying bucket")
     try:
-        s3_client = boto3.client("s3")
+        s3_client = get_client("s3")
         resp = s3_client.get_bucket_location(
             Bucket=os.environ.get("S3_BUCKET_BACK", "")
         )
@@ -78,54 +125,69 @@ def verify_bucket() -> tuple[bool, str]:
     return True, bucket_region
 
 
-def verify_backup_file(controller_instanceobj: InstanceTypeDef) -> tuple[bool, str]:
+@dataclasses.dataclass
+class BackupFileInfo:
+    """Metadata of a backup file in the S3 bucket"""
+
+    key: str
+    size: int
+    etag: str
+    last_modified: datetime.datetime
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.last_modified.timestamp()
+
+
+def get_backup_file_info(s3_file: str) -> BackupFileInfo | None:
+    """Get the metadata of a backup file without downloading it"""
+    s3c = get_client("s3", os.environ["S3_BUCKET_REGION"])
+    try:
+        rsp = s3c.head_object(Bucket=os.environ.get("S3_BUCKET_BACK", ""), Key=s3_file)
+    except botocore.exceptions.ClientError as err:
+        if err.response["Error"]["Code"] in ("404", "NoSuchKey"):
+            print("The object %s does not exist." % s3_file)
+        else:
+            print(str(err))
+        return None
+    return BackupFileInfo(
+        key=s3_file,
+        size=rsp["ContentLength"],
+        etag=rsp["ETag"],
+        last_modified=rsp["LastModified"],
+    )
+
+
+def verify_backup_file(
+    controller_instanceobj: InstanceTypeDef,
+) -> BackupFileInfo | None:
     """Verify if s3 file exists"""
     print("Verifying Backup file")
     try:
-        s3c = boto3.client("s3", region_name=os.environ["S3_BUCKET_REGION"])
         priv_ip = controller_instanceobj["NetworkInterfaces"][0]["PrivateIpAddress"]
         version_file = "CloudN_" + priv_ip + "_save_cloudx_version.txt"
         retrieve_controller_version(version_file)
         s3_file = "CloudN_" + priv_ip + "_save_cloudx_config.enc"
-        try:
-            with open("/tmp/tmp.enc", "wb") as data:
-                s3c.download_fileobj(
-                    os.environ.get("S3_BUCKET_BACK", ""), s3_file, data
-                )
-        except botocore.exceptions.ClientError as err:
-            if err.response["Error"]["Code"] == "404":
-                print("The object %s does not exist." % s3_file)
-                return False, ""
-            print(str(err))
-            return False, ""
+        backup = get_backup_file_info(s3_file)
     except Exception as err:
         print("Verify Backup failed %s" % str(err))
-        return False, ""
-    else:
-        print("Successfully verified backup file %s" % s3_file)
-        return True, s3_file
+        return None
+    if backup is not None:
+        print(
+            f"Successfully verified backup file {backup.key}: {backup.size} bytes,"
+            f" ETag {backup.etag}"
+        )
+    return backup
 
 
-def is_backup_file_is_recent(backup_file: str) -> bool:
+def is_backup_file_is_recent(backup: BackupFileInfo) -> bool:
     """Check if backup file is not older than MAXIMUM_BACKUP_AGE"""
-    print("Checking backup file %s age" % backup_file)
-    try:
-        s3c = boto3.client("s3", region_name=os.environ["S3_BUCKET_REGION"])
-        try:
-            file_obj = s3c.get_object(
-                Key=backup_file, Bucket=os.environ.get("S3_BUCKET_BACK", "")
-            )
-        except botocore.exceptions.ClientError as err:
-            print(str(err))
-            return False
-        age = time.time() - file_obj["LastModified"].timestamp()
-        if age < MAXIMUM_BACKUP_AGE:
-            print("Succesfully validated Backup file age")
-            return True
-        print(
-            f"File age {age} is older than the maximum allowed value of {MAXIMUM_BACKUP_AGE}"
-        )
-        return False
-    except Exception as err:
-        print(f"Checking backup file age failed due to {str(err)}")
-        return False
+    print("Checking backup file %s age" % backup.key)
+    age = backup.age
+    if age < MAXIMUM_BACKUP_AGE:
+        print("Succesfully validated Backup file age")
+        return True
+    print(
+        f"File age {age} is older than the maximum allowed value of {MAXIMUM_BACKUP_AGE}"
+    )
+    return False
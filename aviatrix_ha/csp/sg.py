@@ -1,15 +1,83 @@
+from __future__ import annotations
+
 import os
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 import botocore
-from types_boto3_ec2.client import EC2Client
-from types_boto3_ec2.type_defs import InstanceTypeDef
 
+from aviatrix_ha.csp.instance import load_instance
 from aviatrix_ha.errors.exceptions import AvxError
+from aviatrix_ha.tools import cache
+
+if TYPE_CHECKING:
+    from types_boto3_ec2.client import EC2Client
+    from types_boto3_ec2.type_defs import (
+        FilterTypeDef,
+        InstanceTypeDef,
+        SecurityGroupRuleTypeDef,
+        SecurityGroupRuleUpdateTypeDef,
+    )
 
 BLOCKED_RULE_TAG = "avx:ha-blocked-rule"
 
 
+def _set_rules_cidr(
+    client: EC2Client, rules: list[SecurityGroupRuleTypeDef], cidr: str
+) -> int:
+    """Set the CIDR of the given rules, with one call per security group.
+
+    The given rules are updated to match. Returns the number of API calls made.
+    """
+    rules_by_group: dict[str, list[SecurityGroupRuleUpdateTypeDef]] = {}
+    for sgr in rules:
+        rules_by_group.setdefault(sgr["GroupId"], []).append(
+            {
+                "SecurityGroupRuleId": sgr["SecurityGroupRuleId"],
+                "SecurityGroupRule": {
+                    "IpProtocol": sgr["IpProtocol"],
+                    "FromPort": sgr["FromPort"],
+                    "ToPort": sgr["ToPort"],
+                    "CidrIpv4": cidr,
+                },
+            }
+        )
+    for group_id, group_rules in rules_by_group.items():
+        client.modify_security_group_rules(
+            GroupId=group_id, SecurityGroupRules=group_rules
+        )
+    for sgr in rules:
+        sgr["CidrIpv4"] = cidr
+    return len(rules_by_group)
+
+
+def _describe_instance_sg_rules(
+    client: EC2Client, instance_id: str, filters: list[FilterTypeDef]
+) -> tuple[list[SecurityGroupRuleTypeDef], int]:
+    """Describe the security group rules of an instance.
+
+    Returns the rules and the number of API calls made. The instance itself is
+    only described if it was not already in this invocation.
+    """
+    api_calls = 1
+
+    def load() -> InstanceTypeDef:
+        nonlocal api_calls
+        api_calls += 1
+        return load_instance(client, instance_id)
+
+    sgs = cache.get_or_load("instance", instance_id, load).get("SecurityGroups", [])
+    dsgrrsp = client.describe_security_group_rules(
+        Filters=filters
+        + [
+            {
+                "Name": "group-id",
+                "Values": [sg["GroupId"] for sg in sgs],
+            }
+        ]
+    )
+    return dsgrrsp.get("SecurityGroupRules", []), api_calls
+
+
 def disable_open_sg_rules(client: EC2Client, instance_id: str) -> list[dict[str, Any]]:
     """Disable open security group if exists.
 
@@ -17,20 +85,14 @@ def disable_open_sg_rules(client: EC2Client, instance_id: str) -> list[dict[str,
     0.0.0.0/0 to 0.0.0.0/32 for all open security group rules. This is done
     "in-place" to preserve any metadata (description, tags, etc) that might be
     preexisting on the rule.
+
+    The rules are modified with one call per security group, and tagged with
+    a single call.
     """
-    modified_rules: list[dict[str, Any]] = []
     try:
-        dirsp = client.describe_instances(InstanceIds=[instance_id])
-        sgs = dirsp["Reservations"][0]["Instances"][0].get("SecurityGroups", [])
-        dsgrrsp = client.describe_security_group_rules(
-            Filters=[
-                {
-                    "Name": "group-id",
-                    "Values": [sg["GroupId"] for sg in sgs],
-                }
-            ]
-        )
-        for sgr in dsgrrsp.get("SecurityGroupRules", []):
+        open_rules = []
+        rules, api_calls = _describe_instance_sg_rules(client, instance_id, [])
+        for sgr in rules:
             if sgr["IsEgress"]:
                 continue
             if (
@@ -43,23 +105,12 @@ def disable_open_sg_rules(client: EC2Client, instance_id: str) -> list[dict[str,
             cidr = sgr.get("CidrIpv4")
             if not cidr or cidr != "0.0.0.0/0":
                 continue
+            open_rules.append(sgr)
 
-            client.modify_security_group_rules(
-                GroupId=sgr["GroupId"],
-                SecurityGroupRules=[
-                    {
-                        "SecurityGroupRuleId": sgr["SecurityGroupRuleId"],
-                        "SecurityGroupRule": {
-                            "IpProtocol": sgr["IpProtocol"],
-                            "FromPort": sgr["FromPort"],
-                            "ToPort": sgr["ToPort"],
-                            "CidrIpv4": "0.0.0.0/32",
-                        },
-                    }
-                ],
-            )
+        if open_rules:
+            api_calls += _set_rules_cidr(client, open_rules, "0.0.0.0/32")
             client.create_tags(
-                Resources=[sgr["SecurityGroupRuleId"]],
+                Resources=[sgr["SecurityGroupRuleId"] for sgr in open_rules],
                 Tags=[
                     {
                         "Key": BLOCKED_RULE_TAG,
@@ -67,56 +118,55 @@ def disable_open_sg_rules(client: EC2Client, instance_id: str) -> list[dict[str,
                     }
                 ],
             )
+            api_calls += 1
     except botocore.exceptions.ClientError as err:
         raise AvxError(str(err)) from err
-    return modified_rules
+    print(f"Current security group rules for the controller instance: {rules}")
+    print(f"Disabled {len(open_rules)} open SG rules using {api_calls} EC2 API calls")
+    return [
+        {"GroupId": sgr["GroupId"], "SecurityGroupRuleId": sgr["SecurityGroupRuleId"]}
+        for sgr in open_rules
+    ]
 
 
 def enable_open_sg_rules(client: EC2Client, instance_id: str) -> list[dict[str, Any]]:
-    """Re-enable any previously disabled open SG rules."""
-    modified_rules: list[dict[str, Any]] = []
+    """Re-enable any previously disabled open SG rules.
+
+    The rules are modified with one call per security group, and untagged with
+    a single call.
+    """
     try:
-        dirsp = client.describe_instances(InstanceIds=[instance_id])
-        sgs = dirsp["Reservations"][0]["Instances"][0].get("SecurityGroups", [])
-        dsgrrsp = client.describe_security_group_rules(
-            Filters=[
+        blocked_rules, api_calls = _describe_instance_sg_rules(
+            client,
+            instance_id,
+            [
                 {
                     "Name": "tag-key",
                     "Values": [BLOCKED_RULE_TAG],
                 },
-                {
-                    "Name": "group-id",
-                    "Values": [sg["GroupId"] for sg in sgs],
-                },
             ],
         )
-        print(f"Found security groups to be restored: {dsgrrsp['SecurityGroupRules']}")
-        for sgr in dsgrrsp["SecurityGroupRules"]:
-            client.modify_security_group_rules(
-                GroupId=sgr["GroupId"],
-                SecurityGroupRules=[
-                    {
-                        "SecurityGroupRuleId": sgr["SecurityGroupRuleId"],
-                        "SecurityGroupRule": {
-                            "IpProtocol": sgr["IpProtocol"],
-                            "FromPort": sgr["FromPort"],
-                            "ToPort": sgr["ToPort"],
-                            "CidrIpv4": "0.0.0.0/0",
-                        },
-                    }
-                ],
-            )
+        print(f"Found security groups to be restored: {blocked_rules}")
+        if blocked_rules:
+            api_calls += _set_rules_cidr(client, blocked_rules, "0.0.0.0/0")
             client.delete_tags(
-                Resources=[sgr["SecurityGroupRuleId"]],
+                Resources=[sgr["SecurityGroupRuleId"] for sgr in blocked_rules],
                 Tags=[
                     {
                         "Key": BLOCKED_RULE_TAG,
                     }
                 ],
             )
+            api_calls += 1
     except botocore.exceptions.ClientError as err:
         raise AvxError(str(err)) from err
-    return modified_rules
+    print(
+        f"Re-enabled {len(blocked_rules)} open SG rules using {api_calls} EC2 API calls"
+    )
+    return [
+        {"GroupId": sgr["GroupId"], "SecurityGroupRuleId": sgr["SecurityGroupRuleId"]}
+        for sgr in blocked_rules
+    ]
 
 
 def remove_temp_security_group_access(
@@ -0,0 +1,229 @@
+"""Stores for the persistent HA state.
+
+A store holds a JSON document which is read and written as a whole. Stores
+are selected with a URL:
+
+    s3://bucket/key         JSON object in S3, written with conditional writes
+    ssm:/parameter/name     JSON document in an SSM parameter
+    file:///path/name.json  local file, for tests and local runs
+    memory                  in-memory only, for tests
+"""
+
+import abc
+import json
+import os
+import tempfile
+import threading
+import urllib.parse
+from typing import Any
+
+import botocore
+
+from aviatrix_ha.csp.clients import get_client
+from aviatrix_ha.errors.exceptions import AvxError, StateConflictError
+
+
+class StateStore(abc.ABC):
+    """A JSON document which is read and written as a whole"""
+
+    def __init__(self) -> None:
+        # State last read from or written to the backend, None if unknown
+        self.saved: dict[str, Any] | None = None
+
+    @abc.abstractmethod
+    def _read(self) -> dict[str, Any]:
+        """Read the state from the backend, {} if there is none yet"""
+
+    @abc.abstractmethod
+    def _write(self, state: dict[str, Any]) -> None:
+        """Write the state to the backend"""
+
+    def load(self) -> dict[str, Any]:
+        self.saved = self._read()
+        return dict(self.saved)
+
+    def is_saved(self, state: dict[str, Any]) -> bool:
+        """Whether the state is what was last read or written"""
+        return self.saved == state
+
+    def save(self, state: dict[str, Any]) -> bool:
+        """Write the state, unless it is unchanged. Returns True if written."""
+        if self.saved is None:
+            self.load()
+        if self.is_saved(state):
+            return False
+        self._write(state)
+        self.saved = dict(state)
+        return True
+
+
+class MemoryStateStore(StateStore):
+    """State kept in memory, for tests and local runs.
+
+    Stores created with the same backend share the state. Like S3StateStore,
+    writes fail if the state was changed through another store since it was
+    last read.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, backend: dict[str, Any] | None = None) -> None:
+        super().__init__()
+        self.backend = backend if backend is not None else {}
+        self.backend.setdefault("state", {})
+        self.backend.setdefault("version", 0)
+        self.version: int | None = None
+
+    def _read(self) -> dict[str, Any]:
+        with self._lock:
+            self.version = self.backend["version"]
+            return dict(self.backend["state"])
+
+    def _write(self, state: dict[str, Any]) -> None:
+        with self._lock:
+            if self.version != self.backend["version"]:
+                self.saved = None
+                raise StateConflictError(f"{self} was modified concurrently")
+            self.backend["state"] = dict(state)
+            self.backend["version"] += 1
+            self.version = self.backend["version"]
+
+    def __repr__(self) -> str:
+        return "memory"
+
+
+class FileStateStore(StateStore):
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+
+    def _read(self) -> dict[str, Any]:
+        try:
+            with open(self.path) as fileh:
+                return json.load(fileh)
+        except FileNotFoundError:
+            return {}
+        except ValueError as err:
+            raise AvxError(f"Could not parse state file {self.path}: {err}") from err
+
+    def _write(self, state: dict[str, Any]) -> None:
+        # Write to a temporary file and rename it, so readers never observe a
+        # partially written file.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".")
+        with os.fdopen(fd, "w") as fileh:
+            json.dump(state, fileh)
+        os.replace(tmp_path, self.path)
+
+    def __repr__(self) -> str:
+        return f"file://{self.path}"
+
+
+class S3StateStore(StateStore):
+    """State kept in an S3 object.
+
+    Writes are conditional on the ETag of the object last read, so concurrent
+    writers cannot silently overwrite each other.
+    """
+
+    def __init__(self, bucket: str, key: str) -> None:
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.etag: str | None = None
+
+    def _read(self) -> dict[str, Any]:
+        s3_client = get_client("s3")
+        try:
+            rsp = s3_client.get_object(Bucket=self.bucket, Key=self.key)
+        except botocore.exceptions.ClientError as err:
+            code = err.response["Error"]["Code"]
+            if code in ("NoSuchKey", "404"):
+                self.etag = None
+                return {}
+            if code in ("AccessDenied", "403"):
+                # Without s3:ListBucket, S3 also denies reading a missing key
+                raise AvxError(
+                    f"Could not read state from {self}: {err}. The role needs"
+                    " s3:GetObject and s3:ListBucket on the bucket"
+                ) from err
+            raise AvxError(f"Could not read state from {self}: {err}") from err
+        self.etag = rsp["ETag"]
+        try:
+            return json.loads(rsp["Body"].read())
+        except ValueError as err:
+            raise AvxError(f"Could not parse state from {self}: {err}") from err
+
+    def _write(self, state: dict[str, Any]) -> None:
+        s3_client = get_client("s3")
+        condition = {"IfMatch": self.etag} if self.etag else {"IfNoneMatch": "*"}
+        try:
+            rsp = s3_client.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=json.dumps(state).encode("utf-8"),
+                ContentType="application/json",
+                **condition,
+            )
+        except botocore.exceptions.ClientError as err:
+            if err.response["Error"]["Code"] in (
+                "PreconditionFailed",
+                "ConditionalRequestConflict",
+            ):
+                self.saved = None
+                raise StateConflictError(f"{self} was modified concurrently") from err
+            raise AvxError(f"Could not write state to {self}: {err}") from err
+        self.etag = rsp["ETag"]
+
+    def __repr__(self) -> str:
+        return f"s3://{self.bucket}/{self.key}"
+
+
+class SsmStateStore(StateStore):
+    def __init__(self, name: str) -> None:
+        super().__init__()
+        self.name = name
+
+    def _read(self) -> dict[str, Any]:
+        ssm_client = get_client("ssm")
+        try:
+            rsp = ssm_client.get_parameter(Name=self.name)
+        except ssm_client.exceptions.ParameterNotFound:
+            return {}
+        except botocore.exceptions.ClientError as err:
+            raise AvxError(f"Could not read state from {self}: {err}") from err
+        try:
+            return json.loads(rsp["Parameter"]["Value"])
+        except ValueError as err:
+            raise AvxError(f"Could not parse state from {self}: {err}") from err
+
+    def _write(self, state: dict[str, Any]) -> None:
+        ssm_client = get_client("ssm")
+        try:
+            # Intelligent-Tiering switches to the advanced tier if the state
+            # grows beyond 4 KB
+            ssm_client.put_parameter(
+                Name=self.name,
+                Value=json.dumps(state),
+                Type="String",
+                Overwrite=True,
+                Tier="Intelligent-Tiering",
+            )
+        except botocore.exceptions.ClientError as err:
+            raise AvxError(f"Could not write state to {self}: {err}") from err
+
+    def __repr__(self) -> str:
+        return f"ssm:{self.name}"
+
+
+def store_from_url(url: str) -> StateStore:
+    """Create a state store from a URL"""
+    parsed = urllib.parse.urlsplit(url)
+    if url == "memory":
+        return MemoryStateStore()
+    if parsed.scheme == "file" and parsed.path:
+        return FileStateStore(parsed.path)
+    if parsed.scheme == "s3" and parsed.netloc and parsed.path.strip("/"):
+        return S3StateStore(parsed.netloc, parsed.path.lstrip("/"))
+    if parsed.scheme == "ssm" and parsed.path:
+        return SsmStateStore(parsed.path)
+    raise AvxError(f"Unsupported state store {url}")
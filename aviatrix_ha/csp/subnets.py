@@ -1,8 +1,8 @@
 import os
 
-import boto3
 import botocore
 
+from aviatrix_ha.csp.clients import get_client
 from aviatrix_ha.errors.exceptions import AvxError
 
 
@@ -13,7 +13,7 @@ def validate_subnets(subnet_list: list[str]) -> str:
         print("New creation. Assuming subnets are valid as selected from CFT")
         return ",".join(subnet_list)
     try:
-        client = boto3.client("ec2")
+        client = get_client("ec2")
         response = client.describe_subnets(
             Filters=[{"Name": "vpc-id", "Values": [vpc_id]}]
         )
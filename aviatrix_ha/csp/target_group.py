@@ -1,25 +1,77 @@
-import boto3
+from __future__ import annotations
+
+import concurrent.futures
+from typing import TYPE_CHECKING
+
 import botocore
 
+from aviatrix_ha.csp.clients import get_client
+from aviatrix_ha.tools import cache
+
+if TYPE_CHECKING:
+    from types_boto3_elbv2.client import ElasticLoadBalancingv2Client
+
+TARGET_HEALTH_WORKERS = 8
+
+
+def _is_registered(
+    elb_client: ElasticLoadBalancingv2Client, target_group_arn: str, inst_id: str
+) -> bool:
+    try:
+        target_health = elb_client.describe_target_health(
+            TargetGroupArn=target_group_arn
+        ).get("TargetHealthDescriptions", [])
+    except (
+        botocore.exceptions.ClientError,
+        elb_client.exceptions.TargetGroupNotFoundException,
+    ) as err:
+        print(str(err))
+        return False
+    return any(
+        registered_target.get("Target", {}).get("Id", "") == inst_id
+        for registered_target in target_health
+    )
+
+
+def get_target_group_arns(inst_id: str, vpc_id: str | None = None) -> list[str]:
+    """Get target group arns the running ec2 instance is registered to.
+
+    Only target groups of the instance target type, in the VPC of the
+    controller if known, can contain the controller. Their health is looked
+    up concurrently.
+    """
+    return list(
+        cache.get_or_load(
+            "target_group_arns",
+            (inst_id, vpc_id),
+            lambda: _find_target_group_arns(inst_id, vpc_id),
+        )
+    )
+
+
+def _find_target_group_arns(inst_id: str, vpc_id: str | None) -> list[str]:
+    elb_client = get_client("elbv2")
+    candidates = []
+    paginator = elb_client.get_paginator("describe_target_groups")
+    for page in paginator.paginate():
+        for tg_ in page.get("TargetGroups", []):
+            if tg_.get("TargetType", "instance") != "instance":
+                continue
+            if vpc_id and tg_.get("VpcId") != vpc_id:
+                continue
+            candidates.append(tg_["TargetGroupArn"])
+    print(f"Checking {len(candidates)} candidate target groups")
 
-def get_target_group_arns(inst_id: str) -> list[str]:
-    """Get target group arns the running ec2 instance is registered to."""
-    elb_client = boto3.client("elbv2")
-    target_groups = elb_client.describe_target_groups().get("TargetGroups", [])
     target_group_arns = []
-    for tg_ in target_groups:
-        try:
-            target_health = elb_client.describe_target_health(
-                TargetGroupArn=tg_.get("TargetGroupArn", "")
-            ).get("TargetHealthDescriptions", [])
-            for registered_target in target_health:
-                if registered_target.get("Target", {}).get("Id", "") == inst_id:
-                    target_group_arns.append(tg_["TargetGroupArn"])
-                    break
-        except (
-            botocore.exceptions.ClientError,
-            elb_client.exceptions.TargetGroupNotFoundException,
-        ) as err:
-            print(str(err))
+    if candidates:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=TARGET_HEALTH_WORKERS
+        ) as executor:
+            registered = executor.map(
+                lambda arn: _is_registered(elb_client, arn, inst_id), candidates
+            )
+            target_group_arns = [
+                arn for arn, found in zip(candidates, registered) if found
+            ]
     print(f"target_group_arns is {target_group_arns}")
     return target_group_arns
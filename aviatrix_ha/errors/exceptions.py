@@ -3,3 +3,27 @@
 
 class AvxError(Exception):
     """Error class for Aviatrix exceptions"""
+
+
+class StateConflictError(AvxError):
+    """The stored state was changed by someone else since it was read"""
+
+
+class LockHeldError(AvxError):
+    """The lock is held by another invocation"""
+
+
+class DeadlineExceeded(AvxError):
+    """There is no time left to start or finish an operation"""
+
+
+class OperationInFlight(DeadlineExceeded):
+    """A long running operation was still running when the deadline passed"""
+
+
+class TransientApiError(AvxError):
+    """A controller API call failed, but may succeed when retried"""
+
+
+class PermanentApiError(AvxError):
+    """A controller API call failed in a way retrying does not fix"""
@@ -0,0 +1,106 @@
+"""Durable progress of a HA run, so a retried event can resume it"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any
+
+from aviatrix_ha.common.constants import CHECKPOINT_SAVE_FAILURES
+from aviatrix_ha.csp.state import MemoryStateStore, StateStore, store_from_url
+from aviatrix_ha.errors.exceptions import AvxError
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Where checkpoints are kept. The URL may use {bucket}, the backup bucket,
+# and {instance_id}, the new controller instance.
+DEFAULT_CHECKPOINT_STORE = "s3://{bucket}/avx-ha/checkpoints/{instance_id}.json"
+
+
+def get_checkpoint_store(instance_id: str) -> StateStore:
+    """Get the store for the checkpoint of a new controller instance"""
+    url = os.environ.get("HA_CHECKPOINT_STORE", DEFAULT_CHECKPOINT_STORE)
+    bucket = os.environ.get("S3_BUCKET_BACK", "")
+    if "{bucket}" in url and not bucket:
+        logger.warning("No backup bucket configured, HA progress is not saved")
+        return MemoryStateStore()
+    return store_from_url(url.format(bucket=bucket, instance_id=instance_id))
+
+
+class Checkpoint:
+    """Steps of a HA run completed so far, and the outputs they produced.
+
+    The checkpoint is keyed by the new controller instance and written after
+    every completed step. A checkpoint which cannot be read fails the HA run,
+    as it may record an operation still running on the controller. A failed
+    write is retried with the next one, and fails the HA run once writes keep
+    failing.
+    """
+
+    def __init__(self, instance_id: str, store: StateStore | None = None):
+        self.instance_id = instance_id
+        self.store = store or get_checkpoint_store(instance_id)
+        self._lock = threading.Lock()
+        self._save_failures = 0
+        try:
+            state = self.store.load()
+        except Exception as err:  # pylint: disable=broad-except
+            raise AvxError(
+                f"Could not read checkpoint from {self.store}: {err}"
+            ) from err
+        if state.get("instance_id") != instance_id:
+            state = {}
+        self.completed: list[str] = list(state.get("completed", []))
+        self.outputs: dict[str, Any] = dict(state.get("outputs", {}))
+        if self.completed:
+            logger.info(
+                "Resuming HA run for %s after steps %s", instance_id, self.completed
+            )
+
+    def is_done(self, step: str) -> bool:
+        with self._lock:
+            return step in self.completed
+
+    def record(self, step: str, **outputs: Any) -> None:
+        """Mark a step as completed, along with any outputs of the step"""
+        with self._lock:
+            if step not in self.completed:
+                self.completed.append(step)
+            self.outputs.update(outputs)
+            self._save()
+
+    def update(self, **outputs: Any) -> None:
+        """Record outputs of a step which has not completed yet"""
+        with self._lock:
+            self.outputs.update(outputs)
+            self._save()
+
+    def clear(self) -> None:
+        """Forget all progress, once the HA run has completed"""
+        with self._lock:
+            self.completed = []
+            self.outputs = {}
+            self._save()
+
+    def _save(self) -> None:
+        state: dict[str, Any] = {}
+        if self.completed or self.outputs:
+            state = {
+                "instance_id": self.instance_id,
+                "completed": self.completed,
+                "outputs": self.outputs,
+                "updated_at": time.time(),
+            }
+        try:
+            self.store.save(state)
+        except Exception as err:  # pylint: disable=broad-except
+            self._save_failures += 1
+            if self._save_failures >= CHECKPOINT_SAVE_FAILURES:
+                raise AvxError(
+                    f"Could not save checkpoint to {self.store}"
+                    f" {self._save_failures} times in a row: {err}"
+                ) from err
+            logger.warning("Could not save checkpoint to %s: %s", self.store, err)
+        else:
+            self._save_failures = 0
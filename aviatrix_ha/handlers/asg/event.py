@@ -1,25 +1,44 @@
+from __future__ import annotations
+
+import functools
+import json
 import logging
 import os
 import time
 from enum import Enum, auto
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable
 
-from types_boto3_ec2.client import EC2Client
-from types_boto3_ec2.type_defs import InstanceTypeDef
-from types_boto3_lambda.client import LambdaClient
+import botocore
 
 from aviatrix_ha.api import client
+from aviatrix_ha.api.operation import LongRunningOperation
+from aviatrix_ha.api.readiness import ReadinessProber
+from aviatrix_ha.api.retry import Retrier, api_error
 from aviatrix_ha.api.external.ip import get_public_ip
 from aviatrix_ha.common.constants import (
+    CONTINUATION_EVENT_KEY,
+    CONTINUATION_RESERVE,
+    HA_RUN_BUDGET,
+    HA_STEP_WORKERS,
     HANDLE_HA_TIMEOUT,
+    OPERATION_POLL_BASE,
+    OPERATION_POLL_CAP,
+    READINESS_BACKOFF_BASE,
+    READINESS_BACKOFF_CAP,
     TEMP_ACCOUNT_NAME,
-    WAIT_DELAY,
 )
 from aviatrix_ha.csp.eip import assign_eip
 from aviatrix_ha.csp.instance import enable_t2_unlimited
-from aviatrix_ha.csp.lambda_c import set_environ, update_env_dict
+from aviatrix_ha.csp.lambda_c import (
+    env_transaction,
+    flush_env,
+    set_environ,
+    update_env_dict,
+)
+from aviatrix_ha.csp.lock import get_ha_lock
 from aviatrix_ha.csp.s3 import (
     MAXIMUM_BACKUP_AGE,
+    get_backup_file_info,
     is_backup_file_is_recent,
 )
 from aviatrix_ha.csp.sg import (
@@ -28,7 +47,17 @@ from aviatrix_ha.csp.sg import (
     remove_temp_security_group_access,
     temp_add_security_group_access,
 )
-from aviatrix_ha.errors.exceptions import AvxError
+from aviatrix_ha.errors.exceptions import AvxError, DeadlineExceeded
+from aviatrix_ha.handlers.asg.checkpoint import Checkpoint
+from aviatrix_ha.handlers.asg.timeline import FailoverTimeline
+from aviatrix_ha.tools import deadline
+from aviatrix_ha.tools.backoff import BackoffPolicy, RetryStats
+from aviatrix_ha.tools.scheduler import Task, TaskScheduler
+
+if TYPE_CHECKING:
+    from types_boto3_ec2.client import EC2Client
+    from types_boto3_ec2.type_defs import InstanceTypeDef
+    from types_boto3_lambda.client import LambdaClient
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -42,6 +71,33 @@ class HAStepResult(Enum):
     # Note that fatal errors are indicated by raising AvxError exceptions
 
 
+HAStep = Callable[[], HAStepResult]
+
+# Steps which run again when a HA run is resumed. They check whether the
+# controller was already restored, depend on the lambda's own network access
+# and API session, which do not carry over between invocations, or undo the
+# cleanup of a failed run: open SG rules are re-enabled when a run fails.
+RERUN_STEPS = frozenset(
+    {
+        "disable_api_termination_step",
+        "disable_open_sg_rules_step",
+        "create_temp_sg_rule_step",
+        "login_step",
+    }
+)
+
+# Share of the time left in the HA run which a step may use, so that a hung
+# call fails the step while there is still time to clean up. Steps which
+# wait for the controller may use all of it.
+DEFAULT_STEP_BUDGET_SHARE = 0.25
+STEP_BUDGET_SHARES = {
+    "login_step": 1.0,
+    "initial_setup_step": 0.75,
+    "create_temp_account_step": 0.5,
+    "restore_backup_step": 1.0,
+}
+
+
 class HAEventHandler:
     """Encapsulates the steps taken to handle a HA event"""
 
@@ -51,26 +107,94 @@ class HAEventHandler:
         lambda_client: LambdaClient,
         context: Any,
         controller_instance: InstanceTypeDef,
+        event_time: float | None = None,
+        started_at: float | None = None,
+        attempt: int = 1,
+        lease_owner: str | None = None,
     ):
         self.ec2_client = ec2_client
         self.lambda_client = lambda_client
         self.context = context
         self.controller_instance = controller_instance
         self.start_time = time.time()
+        # A HA run may span several invocations, see run()
+        self.attempt = attempt
+        self.run_start_time = started_at or self.start_time
+        self.run_deadline = self.run_start_time + float(
+            os.environ.get("HA_RUN_BUDGET", HA_RUN_BUDGET)
+        )
+        get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+        self.can_continue = get_remaining_time is not None
+        if get_remaining_time is not None:
+            self.invocation_deadline = (
+                self.start_time + get_remaining_time() / 1000 - CONTINUATION_RESERVE
+            )
+        else:
+            self.invocation_deadline = self.start_time + HANDLE_HA_TIMEOUT
+        self.deadline = deadline.Deadline(
+            min(self.invocation_deadline, self.run_deadline), "HA run"
+        )
+        self.timeline = FailoverTimeline(controller_instance["InstanceId"], event_time)
+        self.checkpoint = Checkpoint(controller_instance["InstanceId"])
+        self.lock = get_ha_lock(controller_instance["InstanceId"], lease_owner)
 
-        self.public_ip = self.api_ip = os.environ.get("EIP", "")
+        self.public_ip = os.environ.get("EIP", "")
         self.private_ip = controller_instance["NetworkInterfaces"][0][
             "PrivateIpAddress"
         ]
-        if self.api_ip is None or os.environ.get("API_PRIVATE_ACCESS") == "True":
-            self.api_ip = self.private_ip
-
-        if self.api_ip is None:
-            raise AvxError("Could not determine controller API endpoint IP")
-        self.client = client.ApiClient(self.api_ip)
+        # The preferred endpoint comes first. Unless disabled, the others are
+        # raced against it while waiting for the controller, see login_step.
+        self.endpoints = {"eip": self.public_ip, "private": self.private_ip}
+        if os.environ.get("API_PRIVATE_ACCESS") == "True":
+            self.endpoints = {"private": self.private_ip, "eip": self.public_ip}
+        addresses = [address for address in self.endpoints.values() if address]
+        racing = os.environ.get("API_ENDPOINT_RACE", "True") == "True"
+        self.client = client.ApiClient(
+            addresses[0] if addresses else "",
+            alternatives=addresses[1:] if racing else (),
+        )
+        self.backoff = BackoffPolicy(READINESS_BACKOFF_BASE, READINESS_BACKOFF_CAP)
+        self.operation_backoff = BackoffPolicy(OPERATION_POLL_BASE, OPERATION_POLL_CAP)
 
     def deadline_exceeded(self) -> bool:
-        return time.time() - self.start_time >= HANDLE_HA_TIMEOUT
+        """Whether the budget of the running step, or of the run, is spent"""
+        step_deadline = deadline.current()
+        if step_deadline is not None and step_deadline.expired():
+            return True
+        return self.deadline.expired()
+
+    def _should_continue(self) -> bool:
+        """Whether the run ran out of time in this invocation only.
+
+        A step which exhausted its own budget while the invocation still has
+        time left fails: a new invocation would give it no more time.
+        """
+        now = time.time()
+        return (
+            self.can_continue
+            and now >= self.invocation_deadline
+            and now < self.run_deadline
+        )
+
+    def _start_continuation(self) -> None:
+        payload = {
+            CONTINUATION_EVENT_KEY: {
+                "instance_id": self.controller_instance["InstanceId"],
+                "attempt": self.attempt + 1,
+                "lease_owner": self.lock.owner,
+                "started_at": self.run_start_time,
+                "event_time": self.timeline.event_time,
+            }
+        }
+        logger.info("Continuing the HA run in a new invocation: %s", payload)
+        try:
+            self.lambda_client.invoke(
+                FunctionName=self.context.invoked_function_arn,
+                InvocationType="Event",
+                Payload=json.dumps(payload).encode(),
+            )
+        except botocore.exceptions.ClientError as err:
+            raise AvxError(f"Could not continue the HA run: {err}") from err
 
     def disable_api_termination_step(self) -> HAStepResult:
         old_inst_id = os.environ.get("INST_ID")
@@ -100,25 +224,11 @@ class HAEventHandler:
         )
         if modified_rules:
             logger.info("Disabled rules: %s", modified_rules)
-
-        rsp = self.ec2_client.describe_security_groups(
-            GroupIds=[
-                sg["GroupId"] for sg in self.controller_instance["SecurityGroups"]
-            ],
-        )
-        logger.info("Current security groups for the controller instance: %s", rsp)
         return HAStepResult.CONTINUE
 
     def enable_open_sg_rules_step(self) -> HAStepResult:
         logger.info("Re-enabling any previously allowed open SG rules")
         enable_open_sg_rules(self.ec2_client, self.controller_instance["InstanceId"])
-
-        rsp = self.ec2_client.describe_security_groups(
-            GroupIds=[
-                sg["GroupId"] for sg in self.controller_instance["SecurityGroups"]
-            ],
-        )
-        logger.info("Current security groups for the controller instance: %s", rsp)
         return HAStepResult.CONTINUE
 
     def assign_eip_step(self) -> HAStepResult:
@@ -155,53 +265,142 @@ class HAEventHandler:
                 self.lambda_client,
                 self.context,
                 {"TMP_SG_GRP": sg_modified, "TMP_SG_RULE": sgr_id},
+                durable=True,
             )
+            self.checkpoint.update(temp_sg_rule=[sg_modified, sgr_id])
         return HAStepResult.CONTINUE
 
+    def _record_retry_stats(self, stats: RetryStats) -> None:
+        self.timeline.annotate(
+            probes=stats.attempts,
+            waited=round(stats.waited, 3),
+            max_wasted=round(stats.last_delay, 3),
+            failures=stats.failures,
+        )
+
     def login_step(self) -> HAStepResult:
         # Because this is a newly created instance, it may take some time for the
         # controller to be ready to accept logins.
-        while not self.deadline_exceeded():
-            try:
-                self.client.login("admin", self.private_ip)
-                break
-            except Exception as err:
-                logger.exception(
-                    "Login failed due to %s: trying again in %s", err, WAIT_DELAY
-                )
-                time.sleep(WAIT_DELAY)
+        prober = ReadinessProber(
+            self.client,
+            self.backoff,
+            self.deadline_exceeded,
+            on_retry=self.timeline.retry,
+        )
+        stats = prober.wait_until_ready("admin", self.private_ip)
+        self._record_retry_stats(stats)
+        endpoint = self.client.controller_ip
+        kind = next(
+            (kind for kind, address in self.endpoints.items() if address == endpoint),
+            "override",
+        )
+        logger.info("Controller answered on its %s endpoint %s", kind, endpoint)
+        self.timeline.annotate(endpoint=endpoint, endpoint_kind=kind)
         return HAStepResult.CONTINUE
 
+    def _run_operation(
+        self,
+        name: str,
+        action: Callable[[], Any],
+        status: Callable[[], bool] | None = None,
+        **args: Any,
+    ) -> Any:
+        """Run a long running controller operation, polling it for progress.
+
+        The operation is recorded in the checkpoint while it runs. If the
+        deadline passes first, a resumed run attaches to it instead of
+        starting the same operation again. Without a status probe there is no
+        telling whether the earlier attempt completed, so the resumed run
+        waits until the controller can no longer be running it, then starts
+        it again.
+        """
+        key = f"{name}_in_flight"
+        window = client.API_TIMEOUTS[name]
+        in_flight = self.checkpoint.outputs.get(key)
+        operation: LongRunningOperation[Any] | None = None
+        if (
+            in_flight
+            and in_flight["args"] == args
+            and time.time() - in_flight["started_at"] < window
+        ):
+            logger.info("Waiting for %s started in an earlier invocation", name)
+            operation = LongRunningOperation(
+                name, in_flight["started_at"], window, status
+            )
+            operation.wait(
+                self.operation_backoff, self.deadline_exceeded, self._report_progress
+            )
+            if not operation.completed:
+                logger.warning("%s did not report completion, starting it again", name)
+                operation = None
+        result = None
+        if operation is None:
+            operation = LongRunningOperation.start(name, action, window, status)
+            self.checkpoint.update(
+                **{key: {"started_at": operation.started_at, "args": args}}
+            )
+            result = operation.wait(
+                self.operation_backoff, self.deadline_exceeded, self._report_progress
+            )
+        self.checkpoint.update(**{key: None})
+        return result
+
+    def _report_progress(self, operation: LongRunningOperation[Any]) -> None:
+        self.timeline.progress(
+            operation=operation.name,
+            elapsed=round(operation.elapsed(), 3),
+            polls=operation.polls,
+            attached=operation.attached,
+            completed=operation.completed,
+        )
+
     def initial_setup_step(self) -> HAStepResult:
         logger.info("Running initial setup")
-        self.client.initial_setup()
+        self._run_operation(
+            "initial_setup",
+            self.client.initial_setup,
+            status=lambda: self.client.get_initial_setup_status().get("return") is True,
+        )
         return HAStepResult.CONTINUE
 
     def create_temp_account_step(self) -> HAStepResult:
         """Create a temporary account needed for backup restore.
 
-        Retries until deadline since initial_setup may still be completing.
+        Transient failures are retried until deadline since initial_setup may
+        still be completing. Permanent ones, like a wrong role name, fail the
+        step after a few attempts.
         """
         logger.info("Creating temporary account for config restore")
+        stats = RetryStats()
+        retrier = Retrier(self.backoff)
         while not self.deadline_exceeded():
+            stats.attempts += 1
+            failure: Exception | dict[str, Any]
             try:
                 response_json = self.client.create_cloud_account(TEMP_ACCOUNT_NAME)
+            except Exception as err:
+                failure = err
+            else:
                 if response_json.get("return"):
                     logger.info("Successfully created temp account for restore")
+                    self._record_retry_stats(stats)
                     return HAStepResult.CONTINUE
-                logger.warning(
-                    "Create temp account returned failure: %s, retrying in %s",
-                    response_json,
-                    WAIT_DELAY,
-                )
-            except Exception as err:
-                logger.warning(
-                    "Failed to create temp account due to %s: retrying in %s",
-                    err,
-                    WAIT_DELAY,
-                )
-            time.sleep(WAIT_DELAY)
-        raise AvxError("Deadline exceeded while creating temp account")
+                failure = response_json
+            try:
+                delay = retrier.next_delay("Could not create temp account", failure)
+            except AvxError:
+                self._record_retry_stats(stats)
+                raise
+            logger.warning(
+                "Failed to create temp account due to %s: retrying in %.1fs",
+                failure,
+                delay,
+            )
+            stats.record_failure("create_account", delay)
+            self.timeline.retry()
+            time.sleep(delay)
+        self._record_retry_stats(stats)
+        raise DeadlineExceeded("Deadline exceeded while creating temp account")
 
     def restore_backup_step(self) -> HAStepResult:
         priv_ip = os.environ.get(
@@ -209,15 +408,28 @@ class HAEventHandler:
         )  # This private IP belongs to older terminated instance
         s3_file = f"CloudN_{priv_ip}_save_cloudx_config.enc"
         logger.info("Restoring backup file %s", s3_file)
-        if not is_backup_file_is_recent(s3_file):
+        backup = get_backup_file_info(s3_file)
+        if backup is None or not is_backup_file_is_recent(backup):
             raise AvxError(
                 f"HA event failed. Backup file {s3_file} does not exist or is older"
                 f" than {MAXIMUM_BACKUP_AGE}"
             )
+        self.timeline.annotate(
+            backup_size=backup.size,
+            backup_etag=backup.etag,
+            backup_age=round(backup.age),
+        )
 
-        response_json = self.client.restore_backup(s3_file, TEMP_ACCOUNT_NAME)
+        # The controller has no status action for a restore, so a restore cut
+        # short by the deadline is waited out by the resumed run, then started
+        # again
+        response_json = self._run_operation(
+            "restore_cloudx_config",
+            lambda: self.client.restore_backup(s3_file, TEMP_ACCOUNT_NAME),
+            s3_file=s3_file,
+        )
         if response_json.get("return", False) is not True:
-            raise AvxError(f"Could not restore backup: {response_json}")
+            raise api_error("Could not restore backup", response_json)
         return HAStepResult.CONTINUE
 
     def update_lambda_env_step(self) -> HAStepResult:
@@ -231,51 +443,153 @@ class HAEventHandler:
         return HAStepResult.CONTINUE
 
     def remove_temp_sg_rule_step(self) -> HAStepResult:
-        if not os.environ.get("TMP_SG_GRP") or not os.environ.get("TMP_SG_RULE"):
+        temp_sg_rules = set()
+        if os.environ.get("TMP_SG_GRP") and os.environ.get("TMP_SG_RULE"):
+            temp_sg_rules.add((os.environ["TMP_SG_GRP"], os.environ["TMP_SG_RULE"]))
+        # A rule created by an earlier attempt whose environment update was lost
+        if self.checkpoint.outputs.get("temp_sg_rule"):
+            temp_sg_rules.add(tuple(self.checkpoint.outputs["temp_sg_rule"]))
+        if not temp_sg_rules:
             return HAStepResult.CONTINUE
-        remove_temp_security_group_access(
-            self.ec2_client, os.environ["TMP_SG_GRP"], os.environ["TMP_SG_RULE"]
-        )
+        for sg_id, sgr_id in temp_sg_rules:
+            remove_temp_security_group_access(self.ec2_client, sg_id, sgr_id)
         update_env_dict(
-            self.lambda_client, self.context, {"TMP_SG_GRP": "", "TMP_SG_RULE": ""}
+            self.lambda_client,
+            self.context,
+            {"TMP_SG_GRP": "", "TMP_SG_RULE": ""},
+            durable=True,
         )
+        self.checkpoint.update(temp_sg_rule=None)
+        return HAStepResult.CONTINUE
+
+    def flush_env_step(self) -> HAStepResult:
+        flush_env(self.lambda_client, self.context)
         return HAStepResult.CONTINUE
 
+    def _run_step(self, step: HAStep) -> HAStepResult:
+        if self.deadline.expired():
+            raise DeadlineExceeded("Deadline exceeded while handling HA event")
+        name = step.__name__
+        share = STEP_BUDGET_SHARES.get(name, DEFAULT_STEP_BUDGET_SHARE)
+        with self.timeline.step(name) as record:
+            if name not in RERUN_STEPS and self.checkpoint.is_done(name):
+                record.outcome = "resumed"
+                return HAStepResult.CONTINUE
+            # Calls made by the step take their timeouts from its budget
+            with deadline.scoped(self.deadline.share(share, f"{name} budget")):
+                result = step()
+            record.outcome = result.name.lower()
+        if result == HAStepResult.CONTINUE:
+            self.checkpoint.record(name)
+        return result
+
     def run(self) -> None:
-        steps = [
-            self.disable_api_termination_step,
+        # Only one invocation may handle the controller at a time. The lock is
+        # kept for the continuation, if any.
+        if not self.lock.acquire():
+            logger.info(
+                "HA for %s is already being handled by %s. Exiting",
+                self.controller_instance["InstanceId"],
+                self.lock.holder.get("owner", "another invocation"),
+            )
+            self.client.close()
+            return
+        outcome = "failed"
+        try:
+            # A temporary SG rule left behind by an interrupted invocation is
+            # only removed with the lock held, as until then it may belong to
+            # the run holding the lock.
+            if os.environ.get("TMP_SG_GRP") and os.environ.get("TMP_SG_RULE"):
+                logger.info("Lambda probably did not complete last time")
+                self.remove_temp_sg_rule_step()
+            outcome = self._run_steps()
+        finally:
+            if outcome != "continued":
+                self.lock.release()
+
+    def _run_steps(self) -> str:
+        # Each step is mapped to the steps which must complete before it can
+        # start. Steps without a dependency between them run concurrently.
+        # Every step depends on disable_api_termination_step, which returns
+        # FINISH when the controller has already been restored.
+        pre_login_steps = [
             self.disable_open_sg_rules_step,
             self.assign_eip_step,
             self.enable_t2_unlimited_step,
             self.create_temp_sg_rule_step,
-            self.login_step,
-            self.initial_setup_step,
-            self.create_temp_account_step,
-            self.restore_backup_step,
-            self.update_lambda_env_step,
-            self.enable_open_sg_rules_step,
         ]
+        steps: dict[HAStep, list[HAStep]] = {
+            self.disable_api_termination_step: [],
+            **{step: [self.disable_api_termination_step] for step in pre_login_steps},
+            self.login_step: pre_login_steps,
+            self.initial_setup_step: [self.login_step],
+            self.create_temp_account_step: [self.initial_setup_step],
+            self.restore_backup_step: [self.create_temp_account_step],
+            self.update_lambda_env_step: [self.restore_backup_step],
+            self.enable_open_sg_rules_step: [self.update_lambda_env_step],
+        }
         cleanup_steps = [
             self.remove_temp_sg_rule_step,
             self.enable_open_sg_rules_step,
+            self.flush_env_step,
         ]
-        try:
-            for step in steps:
-                if self.deadline_exceeded():
-                    raise AvxError("Deadline exceeded while handling HA event")
-                result = step()
-                if result == HAStepResult.FINISH:
-                    return
-        except Exception:
-            raise
-        finally:
-            for step in cleanup_steps:
-                try:
-                    step()
-                except Exception as err:
-                    logger.exception(
-                        "Error during cleanup step %s: %s", step.__name__, err
-                    )
+        scheduler = TaskScheduler(
+            [
+                Task(
+                    step.__name__,
+                    functools.partial(self._run_step, step),
+                    tuple(dep.__name__ for dep in deps),
+                )
+                for step, deps in steps.items()
+            ],
+            max_workers=HA_STEP_WORKERS,
+        )
+        outcome = "failed"
+        # Environment updates made by the steps are written once by
+        # flush_env_step, except for the temporary SG rule markers which are
+        # written as soon as they change.
+        with env_transaction(self.lambda_client, self.context):
+            try:
+                results = scheduler.run(
+                    stop_when=lambda result: result == HAStepResult.FINISH
+                )
+                if HAStepResult.FINISH in results.values():
+                    outcome = "finished"
+                else:
+                    outcome = "restored"
+            except Exception as err:
+                # Out of time in this invocation, but not for the whole run:
+                # the progress is in the checkpoint, so a new invocation can
+                # pick up from there.
+                if not self._should_continue():
+                    raise
+                logger.warning("HA run interrupted by a deadline: %s", err)
+                outcome = "continued"
+            finally:
+                for step in cleanup_steps:
+                    # Open SG rules stay disabled until the run completes
+                    if (
+                        outcome == "continued"
+                        and step == self.enable_open_sg_rules_step
+                    ):
+                        continue
+                    try:
+                        with self.timeline.step(
+                            step.__name__, phase="cleanup"
+                        ) as record:
+                            result = step()
+                            record.outcome = result.name.lower()
+                    except Exception as err:
+                        logger.exception(
+                            "Error during cleanup step %s: %s", step.__name__, err
+                        )
+                if outcome in ("finished", "restored"):
+                    self.checkpoint.clear()
+                self.timeline.emit(outcome)
+                self.client.close()
+        if outcome == "continued":
+            self._start_continuation()
+        return outcome
 
 
 def handle_ha_event(
@@ -283,13 +597,37 @@ def handle_ha_event(
     lambda_client: LambdaClient,
     controller_instanceobj: InstanceTypeDef,
     context: Any,
+    event_time: float | None = None,
+    started_at: float | None = None,
+    attempt: int = 1,
+    lease_owner: str | None = None,
 ) -> None:
     """handle_ha_event() is called in response to the ASG creating a new controller instance.
 
     The function will run through a set of steps to restore the controller to a previous state.
 
     Care has to be taken for each step to be idempotent, so that if the function
-    is interrupted, it can be safely re-run without causing problems.
+    is interrupted, it can be safely re-run without causing problems. Completed
+    steps are recorded in a checkpoint, and a re-run resumes after them.
+
+    event_time is the time of the ASG launch event, used to measure the total
+    recovery time of the failover.
+
+    When the lambda is about to time out, the run is continued in a new
+    invocation, up to an overall budget of HA_RUN_BUDGET seconds. started_at,
+    attempt and lease_owner describe the run being continued.
+
+    Duplicate deliveries of the launch event exit early, as only the holder
+    of the controller's HA lock runs the steps.
     """
-    handler = HAEventHandler(ec2_client, lambda_client, context, controller_instanceobj)
+    handler = HAEventHandler(
+        ec2_client,
+        lambda_client,
+        context,
+        controller_instanceobj,
+        event_time,
+        started_at,
+        attempt,
+        lease_owner,
+    )
     handler.run()
@@ -1,17 +1,50 @@
+from __future__ import annotations
+
+import datetime
 import json
 import os
-from typing import cast, Any
-
-from types_boto3_ec2.client import EC2Client
-from types_boto3_ec2.literals import InstanceTypeType
-from types_boto3_ec2.type_defs import InstanceTypeDef
-from types_boto3_lambda.client import LambdaClient
+from typing import TYPE_CHECKING, cast, Any
 
+from aviatrix_ha.common.constants import CONTINUATION_EVENT_KEY
+from aviatrix_ha.csp.lambda_c import env_transaction
 from aviatrix_ha.csp.sg import create_new_sg
 from aviatrix_ha.errors.exceptions import AvxError
 from aviatrix_ha.handlers.asg.event import handle_ha_event
 from aviatrix_ha.handlers.cft.handler import delete_resources, setup_ha
 
+if TYPE_CHECKING:
+    from types_boto3_ec2.client import EC2Client
+    from types_boto3_ec2.literals import InstanceTypeType
+    from types_boto3_ec2.type_defs import InstanceTypeDef
+    from types_boto3_lambda.client import LambdaClient
+
+
+def _get_event_time(
+    event: dict[str, Any], sns_msg_json: dict[str, Any]
+) -> float | None:
+    """Get the time of the ASG event, used as the start of the failover"""
+    candidates = [
+        sns_msg_json.get("StartTime"),
+        event["Records"][0]["Sns"].get("Timestamp"),
+    ]
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return datetime.datetime.fromisoformat(candidate).timestamp()
+        except (TypeError, ValueError):
+            print(f"Could not parse event time {candidate}")
+    return None
+
+
+def starts_ha_run(event: dict[str, Any]) -> bool:
+    """Whether an SNS event starts a HA run, which takes the HA lock"""
+    try:
+        sns_msg_json = json.loads(event["Records"][0]["Sns"]["Message"])
+        return sns_msg_json["Event"] == "autoscaling:EC2_INSTANCE_LAUNCH"
+    except (KeyError, IndexError, TypeError, ValueError):
+        return False
+
 
 def handle_sns_event(
     describe_err: str | None,
@@ -43,7 +76,13 @@ def handle_sns_event(
     print("SNS Event %s Description %s " % (sns_msg_event, sns_msg_desc))
     if sns_msg_event == "autoscaling:EC2_INSTANCE_LAUNCH":
         print("Instance launched from Autoscaling")
-        handle_ha_event(client, lambda_client, controller_instanceobj, context)
+        handle_ha_event(
+            client,
+            lambda_client,
+            controller_instanceobj,
+            context,
+            _get_event_time(event, sns_msg_json),
+        )
     elif sns_msg_event == "autoscaling:TEST_NOTIFICATION":
         print("Successfully received Test Event from ASG")
     elif sns_msg_event == "autoscaling:EC2_INSTANCE_LAUNCH_ERROR":
@@ -51,18 +90,50 @@ def handle_sns_event(
         print("Instance launch error, recreating with new security group configuration")
         sg_id = create_new_sg(client)
         ami_id = os.environ.get("AMI_ID", "")
-        inst_type = cast(InstanceTypeType, os.environ.get("INST_TYPE", ""))
+        inst_type = cast("InstanceTypeType", os.environ.get("INST_TYPE", ""))
         key_name = os.environ.get("KEY_NAME", "")
         user_data = os.environ.get("USER_DATA", "")
         delete_resources(None, detach_instances=False)
-        setup_ha(
-            ami_id,
-            inst_type,
-            None,
-            key_name,
-            [sg_id],
-            context,
-            user_data,
-            attach_instance=False,
-            is_update=False,
+        with env_transaction(lambda_client, context):
+            setup_ha(
+                ami_id,
+                inst_type,
+                None,
+                key_name,
+                [sg_id],
+                context,
+                user_data,
+                attach_instance=False,
+                is_update=False,
+            )
+
+
+def handle_continuation_event(
+    describe_err: str | None,
+    event: dict[str, Any],
+    client: EC2Client,
+    lambda_client: LambdaClient,
+    controller_instanceobj: InstanceTypeDef,
+    context: Any,
+) -> None:
+    """Continue a HA run which ran out of time in an earlier invocation"""
+    continuation = event[CONTINUATION_EVENT_KEY]
+    print(f"Continuing HA run: {continuation}")
+    if describe_err:
+        raise AvxError(f"Could not continue HA run: {describe_err}")
+    if controller_instanceobj["InstanceId"] != continuation["instance_id"]:
+        print(
+            f"Controller is now {controller_instanceobj['InstanceId']}, not"
+            f" {continuation['instance_id']}. Not continuing"
         )
+        return
+    handle_ha_event(
+        client,
+        lambda_client,
+        controller_instanceobj,
+        context,
+        continuation.get("event_time"),
+        continuation.get("started_at"),
+        continuation.get("attempt", 1),
+        continuation.get("lease_owner"),
+    )
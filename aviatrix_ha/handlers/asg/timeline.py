@@ -0,0 +1,110 @@
+"""Timing instrumentation for the steps taken while handling a HA event"""
+
+import contextlib
+import json
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Iterator
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class StepRecord:
+    """Timing information about a single step"""
+
+    name: str
+    phase: str
+    started_at: float
+    duration: float = 0.0
+    retries: int = 0
+    outcome: str = "pending"
+    details: dict[str, Any] = field(default_factory=dict)
+
+
+class FailoverTimeline:
+    """Records wall time, retry count and outcome for every step of a failover.
+
+    A single summary record is emitted at the end of the failover. The total
+    recovery time (RTO) is measured from the time of the ASG launch event, if
+    known, otherwise from the time the handler started.
+    """
+
+    def __init__(self, instance_id: str, event_time: float | None = None):
+        self.instance_id = instance_id
+        self.start_time = time.time()
+        self.event_time = event_time or self.start_time
+        self.records: list[StepRecord] = []
+        self._lock = threading.Lock()
+        # Steps may run concurrently, so the running step is tracked per thread
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def step(self, name: str, phase: str = "step") -> Iterator[StepRecord]:
+        """Time the enclosed block as the step called name"""
+        record = StepRecord(name=name, phase=phase, started_at=time.time())
+        with self._lock:
+            self.records.append(record)
+        self._local.current = record
+        start = time.monotonic()
+        try:
+            yield record
+        except Exception:
+            record.outcome = "failed"
+            raise
+        finally:
+            record.duration = time.monotonic() - start
+            self._local.current = None
+            logger.info(
+                "Step %s finished in %.2fs with outcome %s after %d retries",
+                record.name,
+                record.duration,
+                record.outcome,
+                record.retries,
+            )
+
+    def retry(self) -> None:
+        """Count a retry against the step currently running"""
+        current = getattr(self._local, "current", None)
+        if current is not None:
+            current.retries += 1
+
+    def annotate(self, **details: Any) -> None:
+        """Attach details to the step currently running"""
+        current = getattr(self._local, "current", None)
+        if current is not None:
+            current.details.update(details)
+
+    def progress(self, **details: Any) -> None:
+        """Add a progress report to the step currently running"""
+        current = getattr(self._local, "current", None)
+        if current is None:
+            return
+        report = dict(details, at=round(time.time() - current.started_at, 3))
+        with self._lock:
+            current.details.setdefault("progress", []).append(report)
+        logger.info("Step %s progress: %s", current.name, report)
+
+    def summary(self, outcome: str) -> dict[str, Any]:
+        end_time = time.time()
+        return {
+            "instance_id": self.instance_id,
+            "outcome": outcome,
+            "event_time": self.event_time,
+            "handler_start_time": self.start_time,
+            "handler_duration": round(end_time - self.start_time, 3),
+            "rto": round(end_time - self.event_time, 3),
+            "steps": [
+                dict(asdict(record), duration=round(record.duration, 3))
+                for record in self.records
+            ],
+        }
+
+    def emit(self, outcome: str) -> dict[str, Any]:
+        """Log the summary record for this failover"""
+        summary = self.summary(outcome)
+        logger.info("HA failover timeline: %s", json.dumps(summary))
+        return summary
@@ -1,27 +1,36 @@
+from __future__ import annotations
+
 import base64
 import json
 import logging
 import os
 import time
-from typing import Any
+from typing import TYPE_CHECKING, Any
 import uuid
 
 from aviatrix_ha.handlers.cft.delete import delete_launch_template
-import boto3
 import botocore
-from types_boto3_ec2.literals import InstanceTypeType
-from types_boto3_ec2.type_defs import (
-    LaunchTemplateBlockDeviceMappingRequestTypeDef,
-    RequestLaunchTemplateDataTypeDef,
-)
 import yaml
 
+from aviatrix_ha.csp.clients import get_client
 from aviatrix_ha.csp.instance import is_controller_termination_protected
 from aviatrix_ha.csp.keypair import validate_keypair
-from aviatrix_ha.csp.lambda_c import get_lambda_tags, update_env_dict
+from aviatrix_ha.csp.lambda_c import (
+    get_lambda_function_arn,
+    get_lambda_tags,
+    update_env_dict,
+)
 from aviatrix_ha.csp.subnets import validate_subnets
 from aviatrix_ha.csp.target_group import get_target_group_arns
 from aviatrix_ha.errors.exceptions import AvxError
+from aviatrix_ha.tools.preflight import Check, run_checks
+
+if TYPE_CHECKING:
+    from types_boto3_ec2.literals import InstanceTypeType
+    from types_boto3_ec2.type_defs import (
+        LaunchTemplateBlockDeviceMappingRequestTypeDef,
+        RequestLaunchTemplateDataTypeDef,
+    )
 
 
 logger = logging.getLogger(__name__)
@@ -196,9 +205,7 @@ def _setup_sns_notifications(
     sns_topic_arn = sns_client.create_topic(Name=sns_topic, Tags=cf_tags)["TopicArn"]
     print(f"Created SNS topic: {sns_topic_arn}")
 
-    lambda_fn_arn = lambda_client.get_function(FunctionName=context.function_name)[
-        "Configuration"
-    ]["FunctionArn"]
+    lambda_fn_arn = get_lambda_function_arn(lambda_client, context.function_name)
 
     print(f"Subscribing Lambda to SNS topic")
     sns_client.subscribe(
@@ -266,10 +273,19 @@ def setup_ha(
 
     # Step 0: Validation and vars preparation
     sub_list = os.environ.get("SUBNETLIST", "")
-    val_subnets = validate_subnets(sub_list.split(","))
-    print("Valid subnets %s" % val_subnets)
+    val_subnets = ""
+
+    def subnets() -> None:
+        nonlocal val_subnets
+        val_subnets = validate_subnets(sub_list.split(","))
+        print("Valid subnets %s" % val_subnets)
+
+    checks = [Check("subnets", subnets)]
     if key_name:
-        validate_keypair(key_name)
+        checks.append(Check("keypair", lambda: validate_keypair(key_name)))
+    report = run_checks(checks)
+    if not report.passed:
+        raise AvxError(report.reason)
 
     # Prepare tags
     try:
@@ -311,14 +327,14 @@ def setup_ha(
         raise AvxError("Could not find any disks attached to the controller")
 
     # Instance configuration
-    lambda_client = boto3.client("lambda")
+    lambda_client = get_client("lambda")
     iam_arn = os.environ.get("IAM_ARN", "")
     monitoring = os.environ.get("MONITORING", "disabled") == "enabled"
     ebz_optimized = os.environ.get("EBS_OPT", "False") == "True"
     if inst_id:
         print("Setting launch template from instance")
 
-        target_group_arns = get_target_group_arns(inst_id)
+        target_group_arns = get_target_group_arns(inst_id, os.environ.get("VPC_ID"))
         if target_group_arns:
             update_env_dict(
                 lambda_client,
@@ -334,7 +350,7 @@ def setup_ha(
         # check if target groups are still valid
         old_target_group_arns = json.loads(os.environ.get("TARGET_GROUP_ARNS", "[]"))
         target_group_arns = []
-        elb_client = boto3.client("elbv2")
+        elb_client = get_client("elbv2")
         for target_group_arn in old_target_group_arns:
             try:
                 elb_client.describe_target_health(TargetGroupArn=target_group_arn)
@@ -368,7 +384,7 @@ def setup_ha(
         delete_launch_template(lt_name)
 
     # Step 2: Create launch template
-    ec2_client = boto3.client("ec2")
+    ec2_client = get_client("ec2")
     _create_launch_template(
         ec2_client,
         lt_name,
@@ -387,7 +403,7 @@ def setup_ha(
     )
 
     # Step 3: Create or Update ASG
-    asg_client = boto3.client("autoscaling")
+    asg_client = get_client("autoscaling")
     _create_or_update_asg(
         asg_client,
         asg_name,
@@ -401,7 +417,7 @@ def setup_ha(
     )
 
     # Step 4: Setup SNS notifications
-    sns_client = boto3.client("sns")
+    sns_client = get_client("sns")
     sns_topic_arn = _setup_sns_notifications(
         sns_client,
         lambda_client,
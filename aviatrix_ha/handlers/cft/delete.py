@@ -1,14 +1,14 @@
 import os
 
-import boto3
 import botocore
 
+from aviatrix_ha.csp.clients import get_client
 from aviatrix_ha.errors.exceptions import AvxError
 
 
 def delete_launch_template(lt_name: str) -> None:
     try:
-        boto3.client("ec2").delete_launch_template(LaunchTemplateName=lt_name)
+        get_client("ec2").delete_launch_template(LaunchTemplateName=lt_name)
     except botocore.exceptions.ClientError as err:
         if "InvalidLaunchTemplateName.NotFoundException" in str(err):
             print("Launch template already deleted")
@@ -24,7 +24,7 @@ def delete_resources(
     """Cloud formation cleanup"""
     lt_name = asg_name = os.environ.get("AVIATRIX_TAG", "")
 
-    asg_client = boto3.client("autoscaling")
+    asg_client = get_client("autoscaling")
     if detach_instances and inst_id:
         try:
             # in case customer manually changed the MinSize to greater than 0.
@@ -56,7 +56,7 @@ def delete_resources(
 
     if delete_sns:
         print("Deleting SNS topic")
-        sns_client = boto3.client("sns")
+        sns_client = get_client("sns")
         topic_arn = os.environ.get("TOPIC_ARN")
         if topic_arn == "N/A" or not topic_arn:
             print("Topic not created. Exiting")
@@ -1,15 +1,15 @@
+from __future__ import annotations
+
+import contextlib
 import os
 import traceback
-from typing import Any
-
-from types_boto3_ec2.client import EC2Client
-from types_boto3_ec2.type_defs import InstanceTypeDef
-from types_boto3_lambda.client import LambdaClient
+from typing import TYPE_CHECKING, Any
 
 from aviatrix_ha.api.external.ami import check_ami_id
 from aviatrix_ha.csp.eip import is_ip_elastic
 from aviatrix_ha.csp.instance import get_user_data, verify_iam
-from aviatrix_ha.csp.lambda_c import set_environ, update_env_dict
+from aviatrix_ha.csp.lambda_c import env_transaction, set_environ, update_env_dict
+from aviatrix_ha.csp.lock import get_ha_lock
 from aviatrix_ha.csp.s3 import (
     MAXIMUM_BACKUP_AGE,
     is_backup_file_is_recent,
@@ -20,6 +20,12 @@ from aviatrix_ha.errors.exceptions import AvxError
 from aviatrix_ha.handlers.cft.create import setup_ha
 from aviatrix_ha.handlers.cft.delete import delete_resources
 from aviatrix_ha.handlers.cft.response import send_response
+from aviatrix_ha.tools.preflight import Check, run_checks
+
+if TYPE_CHECKING:
+    from types_boto3_ec2.client import EC2Client
+    from types_boto3_ec2.type_defs import InstanceTypeDef
+    from types_boto3_lambda.client import LambdaClient
 
 
 def handle_cft(
@@ -56,14 +62,22 @@ def handle_cft(
         return
 
     try:
-        response_status, err_reason = _handle_cloud_formation_request(
-            ec2_client,
-            event,
-            lambda_client,
-            controller_instanceobj,
-            context,
-            instance_name,
-        )
+        # Environment updates made while handling the request are written once
+        # the request has been handled. The HA lock keeps the request from
+        # running alongside a failover of the same controller. A Delete does
+        # not take it, so a held or unusable lock cannot block stack deletion.
+        lock: contextlib.AbstractContextManager[Any] = contextlib.nullcontext()
+        if request_type != "Delete":
+            lock = get_ha_lock(controller_instanceobj["InstanceId"])
+        with lock, env_transaction(lambda_client, context):
+            response_status, err_reason = _handle_cloud_formation_request(
+                ec2_client,
+                event,
+                lambda_client,
+                controller_instanceobj,
+                context,
+                instance_name,
+            )
     except AvxError as err:
         err_reason = str(err)
         print(err_reason)
@@ -80,6 +94,76 @@ def handle_cft(
     print("Sent {} to CFT.".format(response_status))
 
 
+def _create_checks(
+    ec2_client: EC2Client,
+    lambda_client: LambdaClient,
+    controller_instanceobj: InstanceTypeDef,
+    context: Any,
+) -> list[Check]:
+    """Checks made before setting up HA.
+
+    The checks run concurrently, except for the backup file check: the bucket
+    must be valid to look for the file in it.
+    """
+
+    def iam() -> str | None:
+        if not verify_iam(controller_instanceobj):
+            return (
+                "IAM role aviatrix-role-ec2 could not be verified to be attached to"
+                " controller"
+            )
+        return None
+
+    def bucket() -> str | None:
+        bucket_status, bucket_region = verify_bucket()
+        os.environ["S3_BUCKET_REGION"] = bucket_region
+        update_env_dict(lambda_client, context, {"S3_BUCKET_REGION": bucket_region})
+        if not bucket_status:
+            return "Unable to verify S3 bucket"
+        return None
+
+    def backup_file() -> str | None:
+        backup = verify_backup_file(controller_instanceobj)
+        if backup is None:
+            return "Cannot find backup file in the bucket"
+        if not is_backup_file_is_recent(backup):
+            return f"Backup file is older than {MAXIMUM_BACKUP_AGE}"
+        return None
+
+    def eip() -> str | None:
+        # Without a public IP, USE_EIP=False was set by set_environ()
+        if not os.environ.get("EIP"):
+            return None
+        if is_ip_elastic(ec2_client, os.environ.get("EIP", "")):
+            return None
+        # Public IP but no Elastic IP
+        if not os.environ.get("API_PRIVATE_ACCESS", "False") == "True":
+            return (
+                "Failed to associate EIP or EIP was not found."
+                " Please attach an EIP to the controller before enabling HA"
+            )
+        # Private mode: correct the use_eip attribute
+        os.environ["USE_EIP"] = "False"
+        update_env_dict(lambda_client, context, {"USE_EIP": "False"})
+        return None
+
+    def ami() -> str | None:
+        if not check_ami_id(controller_instanceobj["ImageId"]):
+            return (
+                "AMI is not latest. Cannot enable Controller HA. Please backup"
+                "/restore to the latest AMI before enabling controller HA"
+            )
+        return None
+
+    return [
+        Check("iam", iam),
+        Check("bucket", bucket),
+        Check("backup_file", backup_file, depends_on=("bucket",)),
+        Check("eip", eip),
+        Check("ami", ami),
+    ]
+
+
 def _handle_cloud_formation_request(
     ec2_client: EC2Client,
     event: dict[str, Any],
@@ -104,45 +188,11 @@ def _handle_cloud_formation_request(
             print(err_reason)
             return "FAILED", err_reason
 
-        if not verify_iam(controller_instanceobj):
-            return (
-                "FAILED",
-                "IAM role aviatrix-role-ec2 could not be verified to be attached to"
-                " controller",
-            )
-        bucket_status, bucket_region = verify_bucket()
-        os.environ["S3_BUCKET_REGION"] = bucket_region
-        update_env_dict(lambda_client, context, {"S3_BUCKET_REGION": bucket_region})
-        if not bucket_status:
-            return "FAILED", "Unable to verify S3 bucket"
-        backup_file_status, backup_file = verify_backup_file(controller_instanceobj)
-        if not backup_file_status:
-            return "FAILED", "Cannot find backup file in the bucket"
-        if not is_backup_file_is_recent(backup_file):
-            return "FAILED", f"Backup file is older than {MAXIMUM_BACKUP_AGE}"
-        if os.environ.get("EIP"):
-            if not is_ip_elastic(ec2_client, os.environ.get("EIP", "")):
-                # Public IP but no Elastic IP
-                if (
-                    not os.environ.get("API_PRIVATE_ACCESS", "False") == "True"
-                ):  # Private mode
-                    return (
-                        "FAILED",
-                        "Failed to associate EIP or EIP was not found."
-                        " Please attach an EIP to the controller before enabling HA",
-                    )
-                else:
-                    # Correct the use_eip attribute
-                    os.environ["USE_EIP"] = "False"
-                    update_env_dict(lambda_client, context, {"USE_EIP": "False"})
-            # else  # Elastic IP is valid and attached to the instance
-        # else # Else private mode without public IP USE_EIP=False from set_environ() above
-        if not check_ami_id(controller_instanceobj["ImageId"]):
-            return (
-                "FAILED",
-                "AMI is not latest. Cannot enable Controller HA. Please backup"
-                "/restore to the latest AMI before enabling controller HA",
-            )
+        report = run_checks(
+            _create_checks(ec2_client, lambda_client, controller_instanceobj, context)
+        )
+        if not report.passed:
+            return "FAILED", report.reason
 
         print("Verified AWS and controller Credentials and backup file, EIP and AMI ID")
         print("Trying to setup HA")
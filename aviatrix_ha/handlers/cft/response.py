@@ -2,6 +2,10 @@ from typing import Any
 
 import requests
 
+from aviatrix_ha.tools import deadline
+
+RESPONSE_TIMEOUT = 10
+
 
 def send_response(
     event: dict[str, str],
@@ -32,7 +36,9 @@ def send_response(
             event["ResponseURL"],
             json=response_body,
             headers={"Content-Type": "application/json"},
-            timeout=10,
+            # CloudFormation waits for an hour without a response, so it is
+            # sent even when the deadline has passed
+            timeout=deadline.best_effort_timeout(RESPONSE_TIMEOUT),
         )
         return True
     except requests.exceptions.RequestException as exc:
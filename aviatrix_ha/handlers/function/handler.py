@@ -2,12 +2,16 @@ import logging
 import os
 from typing import Any
 
-from aviatrix_ha.csp.s3 import retrieve_controller_version
+from aviatrix_ha.csp.s3 import get_controller_version
 from aviatrix_ha.errors.exceptions import AvxError
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# The version only changes when the controller is upgraded and backed up
+# again, so callers may reuse it for a short while.
+VERSION_CACHE_CONTROL = "max-age=60"
+
 
 def handle_function_event(
     event: dict[str, Any], context: dict[str, Any]
@@ -50,7 +54,7 @@ def handle_function_event(
     version_filename = f"CloudN_{priv_ip}_save_cloudx_version.txt"
 
     try:
-        _, full_version = retrieve_controller_version(version_filename)
+        version = get_controller_version(version_filename)
     except AvxError as err:
         logger.exception("Failed to retrieve controller version: %s", err)
         return {
@@ -59,8 +63,22 @@ def handle_function_event(
             "headers": {"Content-Type": "text/plain"},
         }
 
+    etag = version.etag
+    response_headers = {
+        "Content-Type": "text/plain",
+        "ETag": etag,
+        "Cache-Control": VERSION_CACHE_CONTROL,
+    }
+    # Header names are lower case with HTTP APIs, but not with REST APIs
+    if_none_match = next(
+        (value for name, value in headers.items() if name.lower() == "if-none-match"),
+        None,
+    )
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return {"statusCode": 304, "body": "", "headers": response_headers}
+
     return {
         "statusCode": 200,
-        "body": full_version,
-        "headers": {"Content-Type": "text/plain"},
+        "body": version.version_with_build,
+        "headers": response_headers,
     }
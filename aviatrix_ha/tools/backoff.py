@@ -0,0 +1,55 @@
+"""Exponential backoff with jitter for polling and retry loops"""
+
+import random
+from dataclasses import dataclass, field
+from typing import Iterator
+
+
+@dataclass
+class BackoffPolicy:
+    """Exponential backoff, capped at cap seconds.
+
+    Each delay is drawn uniformly from the upper half of the current backoff
+    interval, so that concurrent pollers do not synchronize.
+    """
+
+    base: float
+    cap: float
+    multiplier: float = 2.0
+
+    def delays(self) -> Iterator[float]:
+        interval = self.base
+        while True:
+            yield interval / 2 + random.uniform(0, interval / 2)
+            interval = min(self.cap, interval * self.multiplier)
+
+
+@dataclass
+class RetryStats:
+    """Number of attempts made by a retry loop, and time spent waiting"""
+
+    attempts: int = 0
+    waited: float = 0.0
+    # Upper bound on the time wasted after the remote side became ready
+    last_delay: float = 0.0
+    failures: dict[str, int] = field(default_factory=dict)
+
+    def record_failure(self, stage: str, delay: float) -> None:
+        self.failures[stage] = self.failures.get(stage, 0) + 1
+        self.waited += delay
+        self.last_delay = delay
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How a category of failures is retried.
+
+    Failures are retried with delays from backoff, at most max_attempts
+    times in total, or until the deadline if max_attempts is None.
+    """
+
+    backoff: BackoffPolicy
+    max_attempts: int | None = None
+
+    def allows(self, attempts: int) -> bool:
+        return self.max_attempts is None or attempts < self.max_attempts
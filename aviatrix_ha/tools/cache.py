@@ -0,0 +1,51 @@
+"""Cache for AWS metadata looked up during one invocation.
+
+Entries are grouped in namespaces, e.g. "instance" for instance
+descriptions keyed by instance ID. Code that modifies a resource must
+invalidate its entry. The whole cache is cleared at the start of every
+invocation, so nothing is carried over between invocations.
+"""
+
+import threading
+from typing import Any, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+_MISSING = object()
+
+_entries: dict[tuple[str, Hashable], Any] = {}
+_lock = threading.Lock()
+
+
+def get_or_load(namespace: str, key: Hashable, loader: Callable[[], T]) -> T:
+    """Get a cached value, calling loader to look it up on a miss.
+
+    Loader errors are not cached.
+    """
+    with _lock:
+        value = _entries.get((namespace, key), _MISSING)
+    if value is not _MISSING:
+        return value
+    value = loader()
+    put(namespace, key, value)
+    return value
+
+
+def put(namespace: str, key: Hashable, value: Any) -> None:
+    with _lock:
+        _entries[(namespace, key)] = value
+
+
+def invalidate(namespace: str, key: Hashable = _MISSING) -> None:
+    """Drop one entry, or all entries of the namespace if no key is given"""
+    with _lock:
+        if key is not _MISSING:
+            _entries.pop((namespace, key), None)
+            return
+        for entry in [entry for entry in _entries if entry[0] == namespace]:
+            del _entries[entry]
+
+
+def clear() -> None:
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,109 @@
+"""Deadlines which bound the time spent in outbound calls.
+
+The deadline of the invocation is set from the lambda context when the
+invocation starts. Work running in a thread, like a HA step, may narrow it
+down with scoped(). HTTP calls take their timeouts from the current deadline
+and AWS calls fail before they are sent once it has passed.
+"""
+
+import contextlib
+import threading
+import time
+from typing import Any, Iterator
+
+from aviatrix_ha.errors.exceptions import DeadlineExceeded
+
+# Time kept back from the lambda timeout, to log and return
+INVOCATION_MARGIN = 2
+# Shortest timeout used for a best effort call, even past the deadline
+MIN_BEST_EFFORT_TIMEOUT = 1
+
+_invocation_deadline: "Deadline | None" = None
+_local = threading.local()
+
+
+class Deadline:
+    """A point in time by which some work must be done"""
+
+    def __init__(self, expires_at: float, name: str):
+        self.expires_at = expires_at
+        self.name = name
+
+    @classmethod
+    def after(cls, seconds: float, name: str) -> "Deadline":
+        return cls(time.time() + seconds, name)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.time()
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, what: str) -> None:
+        if self.expired():
+            raise DeadlineExceeded(
+                f"Deadline of the {self.name} exceeded before {what}"
+            )
+
+    def timeout(self, limit: float, what: str) -> float:
+        """Timeout for a call, no longer than limit nor the time left"""
+        self.check(what)
+        return min(limit, self.remaining())
+
+    def share(self, fraction: float, name: str) -> "Deadline":
+        """A deadline for a part of the remaining time"""
+        return Deadline(time.time() + max(self.remaining(), 0) * fraction, name)
+
+    def __repr__(self) -> str:
+        return f"Deadline({self.name}, {self.remaining():.1f}s left)"
+
+
+def start_invocation(context: Any) -> Deadline | None:
+    """Set the deadline of the invocation from the lambda context"""
+    global _invocation_deadline  # pylint: disable=global-statement
+    get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+    _invocation_deadline = None
+    if get_remaining_time is not None:
+        _invocation_deadline = Deadline.after(
+            get_remaining_time() / 1000 - INVOCATION_MARGIN, "lambda invocation"
+        )
+    return _invocation_deadline
+
+
+def current() -> Deadline | None:
+    """The deadline of the running thread, if any"""
+    return getattr(_local, "deadline", None) or _invocation_deadline
+
+
+@contextlib.contextmanager
+def scoped(deadline: Deadline) -> Iterator[Deadline]:
+    """Use deadline in the running thread for the enclosed block"""
+    previous = getattr(_local, "deadline", None)
+    _local.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _local.deadline = previous
+
+
+def timeout_for(limit: float, what: str) -> float:
+    """Timeout for a call, no longer than limit nor the current deadline"""
+    deadline = current()
+    if deadline is None:
+        return limit
+    return deadline.timeout(limit, what)
+
+
+def best_effort_timeout(limit: float) -> float:
+    """Timeout for a call which must be attempted even past the deadline"""
+    deadline = current()
+    if deadline is None:
+        return limit
+    return max(min(limit, deadline.remaining()), MIN_BEST_EFFORT_TIMEOUT)
+
+
+def check_before_aws_call(event_name: str = "", **kwargs: Any) -> None:
+    """botocore before-call handler failing calls made past the deadline"""
+    deadline = current()
+    if deadline is not None:
+        deadline.check(event_name.replace("before-call.", "", 1) or "AWS call")
@@ -0,0 +1,110 @@
+"""Run independent validation checks concurrently and report all failures"""
+
+import functools
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+from aviatrix_ha.errors.exceptions import AvxError
+from aviatrix_ha.tools.scheduler import Task, TaskScheduler
+
+PREFLIGHT_WORKERS = 6
+
+
+@dataclass
+class Check:
+    """A validation returning the reason it failed, or None if it passed.
+
+    An exception raised by func also fails the check, with the error as the
+    reason. A check is skipped if any check in depends_on did not pass.
+    """
+
+    name: str
+    func: Callable[[], str | None]
+    depends_on: tuple[str, ...] = field(default=())
+
+
+@dataclass
+class CheckResult:
+    name: str
+    # "passed", "failed" or "skipped"
+    outcome: str
+    reason: str = ""
+    duration: float = 0.0
+
+
+@dataclass
+class PreflightReport:
+    results: list[CheckResult]
+
+    @property
+    def passed(self) -> bool:
+        return all(result.outcome == "passed" for result in self.results)
+
+    @property
+    def reason(self) -> str:
+        """The reasons of all failed checks, in the order of the checks"""
+        return "; ".join(
+            result.reason for result in self.results if result.outcome == "failed"
+        )
+
+    def summary(self) -> str:
+        return json.dumps(
+            {
+                result.name: {
+                    "outcome": result.outcome,
+                    "duration": round(result.duration, 3),
+                }
+                for result in self.results
+            }
+        )
+
+
+def run_checks(
+    checks: list[Check], max_workers: int = PREFLIGHT_WORKERS
+) -> PreflightReport:
+    """Run all checks, each as soon as its dependencies have passed"""
+    results: dict[str, CheckResult] = {}
+    lock = threading.Lock()
+
+    def run(check: Check) -> None:
+        with lock:
+            failed_deps = [
+                dep for dep in check.depends_on if results[dep].outcome != "passed"
+            ]
+        start = time.monotonic()
+        if failed_deps:
+            result = CheckResult(
+                check.name, "skipped", f"{', '.join(failed_deps)} did not pass"
+            )
+        else:
+            try:
+                reason = check.func()
+            except AvxError as err:
+                reason = str(err) or type(err).__name__
+            except Exception as err:  # pylint: disable=broad-except
+                # e.g. a ClientError or a KeyError on an unexpected response,
+                # which must not discard the results of the other checks
+                reason = f"{type(err).__name__}: {err}"
+            result = CheckResult(
+                check.name,
+                "failed" if reason else "passed",
+                reason or "",
+                time.monotonic() - start,
+            )
+        with lock:
+            results[check.name] = result
+
+    scheduler = TaskScheduler(
+        [
+            Task(check.name, functools.partial(run, check), check.depends_on)
+            for check in checks
+        ],
+        max_workers=max_workers,
+    )
+    scheduler.run()
+    report = PreflightReport([results[check.name] for check in checks])
+    print(f"Pre-flight checks: {report.summary()}")
+    return report
@@ -0,0 +1,91 @@
+"""Run a set of tasks with declared dependencies on a bounded thread pool"""
+
+import concurrent.futures
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+from aviatrix_ha.errors.exceptions import AvxError
+
+
+@dataclass
+class Task:
+    """A unit of work which may start once all tasks in depends_on completed"""
+
+    name: str
+    func: Callable[[], Any]
+    depends_on: tuple[str, ...] = field(default=())
+
+
+class TaskScheduler:
+    """Execute tasks concurrently, honouring their dependencies.
+
+    Tasks are started as soon as all of their dependencies have completed.
+    Once a task raises, or its result satisfies stop_when, no new tasks are
+    started; tasks already running are allowed to finish.
+    """
+
+    def __init__(self, tasks: list[Task], max_workers: int):
+        self.tasks = {task.name: task for task in tasks}
+        self.max_workers = max_workers
+        if len(self.tasks) != len(tasks):
+            raise AvxError("Task names must be unique")
+        for task in tasks:
+            for dep in task.depends_on:
+                if dep not in self.tasks:
+                    raise AvxError(f"Task {task.name} depends on unknown task {dep}")
+        self._check_acyclic()
+
+    def _check_acyclic(self) -> None:
+        done: set[str] = set()
+        remaining = dict(self.tasks)
+        while remaining:
+            ready = [
+                name
+                for name, task in remaining.items()
+                if all(dep in done for dep in task.depends_on)
+            ]
+            if not ready:
+                raise AvxError(f"Dependency cycle between tasks {sorted(remaining)}")
+            for name in ready:
+                done.add(name)
+                del remaining[name]
+
+    def run(self, stop_when: Callable[[Any], bool] | None = None) -> dict[str, Any]:
+        """Run the tasks and return the result of every task that completed.
+
+        The first exception raised by a task is re-raised once all running
+        tasks have finished.
+        """
+        results: dict[str, Any] = {}
+        pending = dict(self.tasks)
+        running: dict[concurrent.futures.Future[Any], str] = {}
+        error: BaseException | None = None
+        stopped = False
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers
+        ) as executor:
+            while True:
+                if error is None and not stopped:
+                    for name, task in list(pending.items()):
+                        if all(dep in results for dep in task.depends_on):
+                            running[executor.submit(task.func)] = name
+                            del pending[name]
+                if not running:
+                    break
+                finished, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as err:  # pylint: disable=broad-except
+                        error = error or err
+                        continue
+                    if stop_when is not None and stop_when(results[name]):
+                        stopped = True
+
+        if error is not None:
+            raise error
+        return results
@@ -0,0 +1,30 @@
+""" Take a snapshot of the list of supported controller AMIs
+
+The snapshot is bundled with the lambda package, and used to check AMI IDs
+when the CDN cannot be reached.
+
+Usage:
+    make ami_snapshot
+"""
+
+import json
+
+import requests
+
+from aviatrix_ha.api.external.ami import AMI_ID, AMI_SNAPSHOT, AmiIndex
+
+
+def main():
+    resp = requests.get(AMI_ID, timeout=30)
+    resp.raise_for_status()
+    document = resp.json()
+    images = AmiIndex.from_document(document).images
+    if not images:
+        raise SystemExit(f"No AMI IDs found in {AMI_ID}")
+    with open(AMI_SNAPSHOT, "w", encoding="utf-8") as fileh:
+        json.dump(document, fileh, indent=2, sort_keys=True)
+    print(f"Saved {len(images)} AMI IDs to {AMI_SNAPSHOT}")
+
+
+if __name__ == "__main__":
+    main()
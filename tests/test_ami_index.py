@@ -0,0 +1,84 @@
+"""Tests for the AMI index of aviatrix_ha.api.external.ami."""
+
+import json
+
+import pytest
+import requests
+import responses
+
+from aviatrix_ha.api.external import ami
+
+DOCUMENT = {
+    "BYOL": {"us-east-1": "ami-byol1", "us-east-2": "ami-byol2"},
+    "g3": {"amd64": {"us-east-1": "ami-g3a", "us-east-2": "ami-g3b"}},
+    "release": "7.2",
+}
+
+
+@pytest.fixture(autouse=True)
+def paths(monkeypatch, tmp_path):
+    monkeypatch.setattr(ami, "AMI_INDEX_CACHE", str(tmp_path / "cache" / "index.json"))
+    monkeypatch.setattr(ami, "AMI_SNAPSHOT", str(tmp_path / "snapshot.json"))
+    return tmp_path
+
+
+def test_index_from_document():
+    index = ami.AmiIndex.from_document(DOCUMENT)
+    assert set(index.images) == {"ami-byol1", "ami-byol2", "ami-g3a", "ami-g3b"}
+    assert index.images["ami-g3b"] == ami.AmiImage("ami-g3b", "us-east-2", "g3/amd64")
+    assert index.images["ami-byol1"].version == "BYOL"
+    assert "7.2" not in index
+
+
+@responses.activate
+def test_conditional_fetch():
+    responses.add(
+        responses.GET,
+        ami.AMI_ID,
+        json=DOCUMENT,
+        headers={"ETag": '"v1"', "Last-Modified": "Tue, 01 Oct 2024 00:00:00 GMT"},
+    )
+    assert ami.check_ami_id("ami-g3a")
+    assert "If-None-Match" not in responses.calls[0].request.headers
+
+    # A warm start only revalidates the index kept in /tmp
+    responses.replace(responses.GET, ami.AMI_ID, status=304)
+    assert ami.check_ami_id("ami-byol2")
+    assert not ami.check_ami_id("ami-other")
+    request = responses.calls[1].request
+    assert request.headers["If-None-Match"] == '"v1"'
+    assert request.headers["If-Modified-Since"] == "Tue, 01 Oct 2024 00:00:00 GMT"
+
+
+@responses.activate
+def test_fallbacks_when_cdn_unreachable(paths):
+    unreachable = requests.exceptions.ConnectionError("unreachable")
+    responses.add(responses.GET, ami.AMI_ID, body=unreachable)
+    assert not ami.check_ami_id("ami-g3a")
+
+    # The bundled snapshot
+    (paths / "snapshot.json").write_text(json.dumps(DOCUMENT))
+    assert ami.check_ami_id("ami-g3a")
+
+    # The index kept in /tmp takes precedence over the snapshot
+    ami.AmiIndex.from_document({"BYOL": {"us-east-1": "ami-new"}}).save(
+        ami.AMI_INDEX_CACHE
+    )
+    assert ami.check_ami_id("ami-new")
+    assert not ami.check_ami_id("ami-g3a")
+
+
+@responses.activate
+def test_http_error_is_not_a_fallback_case(paths):
+    (paths / "snapshot.json").write_text(json.dumps(DOCUMENT))
+    responses.add(responses.GET, ami.AMI_ID, status=404)
+    assert not ami.check_ami_id("ami-g3a")
+
+
+@responses.activate
+def test_server_error_falls_back(paths):
+    responses.add(responses.GET, ami.AMI_ID, status=503)
+    assert not ami.check_ami_id("ami-g3a")
+
+    (paths / "snapshot.json").write_text(json.dumps(DOCUMENT))
+    assert ami.check_ami_id("ami-g3a")
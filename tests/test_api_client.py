@@ -1,6 +1,7 @@
 """Test the API client."""
 
 import json
+import socket
 import ssl
 from typing import Any
 
@@ -11,6 +12,13 @@ import trustme
 import werkzeug.wrappers as wrappers
 
 from aviatrix_ha.api import client
+from aviatrix_ha.api.readiness import ReadinessProber
+from aviatrix_ha.errors.exceptions import (
+    AvxError,
+    PermanentApiError,
+    TransientApiError,
+)
+from aviatrix_ha.tools.backoff import BackoffPolicy
 
 
 @pytest.fixture(scope="session")
@@ -74,6 +82,82 @@ def test_client(httpserver: HTTPServer):
     assert c.cid == ""
     c.login("admin", "mypassword")
     assert c.cid == "mycid"
+    assert c.api_token == "mytoken"
     c.initial_setup()
     assert c.create_cloud_account("myaccount")["return"]
     assert c.restore_backup("mybackup", "myaccount")["return"]
+
+
+def test_readiness_prober(httpserver: HTTPServer):
+    httpserver.expect_request(
+        "/v2/api", query_string="action=get_api_token", method="GET"
+    ).respond_with_json({"return": True, "results": {"api_token": "mytoken"}})
+    httpserver.expect_request(
+        "/v2/api",
+    ).respond_with_handler(v2_api_handler)
+
+    policy = BackoffPolicy(base=0.01, cap=0.02)
+    c = client.ApiClient(f"localhost:{httpserver.port}")
+    stats = ReadinessProber(c, policy, lambda: False).wait_until_ready(
+        "admin", "mypassword"
+    )
+    assert stats.attempts == 1
+    assert c.cid == "mycid"
+
+    # Nothing listens on the port of a stopped server
+    port = httpserver.port
+    httpserver.stop()
+    try:
+        checks = iter([False, False, True])
+        prober = ReadinessProber(
+            client.ApiClient(f"localhost:{port}"), policy, lambda: next(checks)
+        )
+        with pytest.raises(AvxError, match="Deadline exceeded"):
+            prober.wait_until_ready("admin", "mypassword")
+    finally:
+        httpserver.start()
+
+
+def test_readiness_prober_fails_fast_on_wrong_password(httpserver: HTTPServer):
+    httpserver.expect_request(
+        "/v2/api", query_string="action=get_api_token", method="GET"
+    ).respond_with_json({"return": True, "results": {"api_token": "mytoken"}})
+    httpserver.expect_request("/v2/api", method="POST").respond_with_json(
+        {"return": False, "reason": "Invalid username or password"}
+    )
+
+    c = client.ApiClient(f"localhost:{httpserver.port}")
+    prober = ReadinessProber(c, BackoffPolicy(0.01, 0.02), lambda: False)
+    prober.check_connect = lambda: None
+    with pytest.raises(PermanentApiError, match="login failed.*Invalid username"):
+        prober.wait_until_ready("admin", "wrong")
+    logins = [request for request, _ in httpserver.log if request.method == "POST"]
+    assert len(logins) == 3
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def test_select_endpoint_races_candidates(httpserver: HTTPServer, monkeypatch):
+    live = f"localhost:{httpserver.port}"
+    dead = f"localhost:{unused_port()}"
+
+    c = client.ApiClient(dead, alternatives=[live, dead])
+    assert c.candidates == [dead, live]
+    assert c.controller_ip == dead
+    assert c.select_endpoint(timeout=2) == live
+    assert c.endpoint == f"https://{live}/v2/api"
+
+    with pytest.raises(TransientApiError, match="No controller endpoint answered"):
+        client.ApiClient(
+            dead, alternatives=[f"localhost:{unused_port()}"]
+        ).select_endpoint(timeout=2)
+
+    # The override is a candidate like the others, tried first
+    monkeypatch.setattr(client, "OVERRIDE_API_ENDPOINT", live)
+    c = client.ApiClient(dead)
+    assert c.candidates == [live, dead]
+    assert c.select_endpoint(timeout=2) == live
@@ -0,0 +1,44 @@
+"""Tests for aviatrix_ha.tools.cache."""
+
+import pytest
+
+from aviatrix_ha.tools import cache
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def test_get_or_load_and_invalidate():
+    calls = []
+
+    def loader(value):
+        def load():
+            calls.append(value)
+            return value
+
+        return load
+
+    assert cache.get_or_load("instance", "i-1", loader("a")) == "a"
+    assert cache.get_or_load("instance", "i-1", loader("b")) == "a"
+    assert cache.get_or_load("instance", "i-2", loader("c")) == "c"
+    assert calls == ["a", "c"]
+
+    cache.invalidate("instance", "i-1")
+    assert cache.get_or_load("instance", "i-1", loader("d")) == "d"
+    assert cache.get_or_load("instance", "i-2", loader("e")) == "c"
+
+    cache.invalidate("instance")
+    assert cache.get_or_load("instance", "i-2", loader("f")) == "f"
+
+
+def test_errors_are_not_cached():
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        cache.get_or_load("aws_account", None, fail)
+    assert cache.get_or_load("aws_account", None, lambda: "123") == "123"
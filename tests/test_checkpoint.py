@@ -0,0 +1,374 @@
+"""Tests for resuming HA runs from a checkpoint."""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+import boto3
+import moto
+import pytest
+
+import aviatrix_ha
+from aviatrix_ha.api import client
+from aviatrix_ha.common.constants import CONTINUATION_EVENT_KEY, HA_RUN_BUDGET
+from aviatrix_ha.csp.state import FileStateStore
+from aviatrix_ha.errors.exceptions import AvxError, OperationInFlight
+from aviatrix_ha.handlers.asg.checkpoint import Checkpoint
+from aviatrix_ha.handlers.asg.event import HAEventHandler, HAStepResult
+from aviatrix_ha.tools import cache, deadline
+from aviatrix_ha.tools.backoff import BackoffPolicy
+
+CONTROLLER = {
+    "InstanceId": "i-new",
+    "NetworkInterfaces": [{"PrivateIpAddress": "10.1.1.1"}],
+}
+
+
+@pytest.fixture
+def store_path(monkeypatch, tmp_path):
+    monkeypatch.setenv("HA_CHECKPOINT_STORE", f"file://{tmp_path}/{{instance_id}}.json")
+    return tmp_path / "i-new.json"
+
+
+def test_checkpoint_is_per_instance(store_path):
+    checkpoint = Checkpoint("i-new")
+    assert not checkpoint.is_done("login_step")
+    checkpoint.record("initial_setup_step")
+    checkpoint.update(temp_sg_rule=["sg-1", "sgr-1"])
+
+    resumed = Checkpoint("i-new")
+    assert resumed.is_done("initial_setup_step")
+    assert resumed.outputs == {"temp_sg_rule": ["sg-1", "sgr-1"]}
+
+    # A checkpoint left by a run for another instance is ignored
+    assert not Checkpoint("i-other", FileStateStore(str(store_path))).completed
+
+    resumed.clear()
+    assert FileStateStore(str(store_path)).load() == {}
+
+
+def test_handler_resumes_after_completed_steps(store_path, monkeypatch):
+    monkeypatch.setenv("EIP", "198.51.100.1")
+    Checkpoint("i-new").record("login_step")
+    Checkpoint("i-new").record("restore_backup_step")
+    handler = HAEventHandler(
+        None, None, argparse.Namespace(function_name="ha"), CONTROLLER
+    )
+    calls = []
+
+    def step(name):
+        def func():
+            calls.append(name)
+            return HAStepResult.CONTINUE
+
+        func.__name__ = name
+        return func
+
+    for name in ("login_step", "restore_backup_step", "update_lambda_env_step"):
+        assert handler._run_step(step(name)) == HAStepResult.CONTINUE
+    # login_step always runs again, restore_backup_step is not repeated
+    assert calls == ["login_step", "update_lambda_env_step"]
+    assert Checkpoint("i-new").completed == [
+        "login_step",
+        "restore_backup_step",
+        "update_lambda_env_step",
+    ]
+    assert [record.outcome for record in handler.timeline.records] == [
+        "continue",
+        "resumed",
+        "continue",
+    ]
+    handler.client.close()
+
+
+def named_step(name, result=HAStepResult.CONTINUE):
+    def func(self):
+        return result
+
+    func.__name__ = name
+    return func
+
+
+@moto.mock_aws
+def test_failed_run_disables_open_sg_rules_again(store_path, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("EIP", "198.51.100.1")
+    monkeypatch.setenv("HA_STATE_STORE", "memory")
+    monkeypatch.setenv("HA_LOCK_STORE", "memory")
+    ec2 = boto3.client("ec2")
+    vpc_id = ec2.create_vpc(CidrBlock="10.0.0.0/16")["Vpc"]["VpcId"]
+    sg_id = ec2.create_security_group(
+        GroupName="controller", Description="controller", VpcId=vpc_id
+    )["GroupId"]
+    ec2.authorize_security_group_ingress(
+        GroupId=sg_id, IpProtocol="tcp", FromPort=443, ToPort=443, CidrIp="0.0.0.0/0"
+    )
+    subnet_id = ec2.create_subnet(VpcId=vpc_id, CidrBlock="10.0.0.0/24")["Subnet"][
+        "SubnetId"
+    ]
+    controller = ec2.run_instances(
+        ImageId="ami-12c6146b",
+        MinCount=1,
+        MaxCount=1,
+        SubnetId=subnet_id,
+        SecurityGroupIds=[sg_id],
+    )["Instances"][0]
+
+    def open_cidrs():
+        rules = ec2.describe_security_group_rules(
+            Filters=[{"Name": "group-id", "Values": [sg_id]}]
+        )["SecurityGroupRules"]
+        return [sgr["CidrIpv4"] for sgr in rules if not sgr["IsEgress"]]
+
+    cidrs_at_login = []
+
+    def login_step(self):
+        cidrs_at_login.append(open_cidrs())
+        raise AvxError("Login failed")
+
+    for name in (
+        "disable_api_termination_step",
+        "assign_eip_step",
+        "enable_t2_unlimited_step",
+        "create_temp_sg_rule_step",
+        "remove_temp_sg_rule_step",
+        "flush_env_step",
+    ):
+        monkeypatch.setattr(HAEventHandler, name, named_step(name))
+    monkeypatch.setattr(HAEventHandler, "login_step", login_step)
+    context = argparse.Namespace(function_name="ha")
+
+    for _ in range(2):
+        cache.clear()
+        handler = HAEventHandler(ec2, None, context, controller)
+        with pytest.raises(AvxError, match="Login failed"):
+            handler.run()
+        # The failed run re-enables the rules
+        assert open_cidrs() == ["0.0.0.0/0"]
+    assert Checkpoint(controller["InstanceId"]).is_done("disable_open_sg_rules_step")
+    # Both runs had the rules disabled while logging in
+    assert cidrs_at_login == [["0.0.0.0/32"], ["0.0.0.0/32"]]
+
+
+def test_temp_sg_rule_is_reverted_only_with_the_lock(store_path, monkeypatch):
+    monkeypatch.setenv("EIP", "198.51.100.1")
+    monkeypatch.setenv("HA_STATE_STORE", "memory")
+    monkeypatch.setenv("HA_LOCK_STORE", "memory")
+    monkeypatch.setenv("TMP_SG_GRP", "sg-1")
+    monkeypatch.setenv("TMP_SG_RULE", "sgr-1")
+    removed = []
+    monkeypatch.setattr(
+        "aviatrix_ha.handlers.asg.event.remove_temp_security_group_access",
+        lambda client, sg_id, sgr_id: removed.append((sg_id, sgr_id)),
+    )
+    monkeypatch.setattr(HAEventHandler, "_run_steps", lambda self: "finished")
+    context = argparse.Namespace(function_name="ha")
+
+    # A duplicate delivery leaves the rule of the run in progress alone
+    running = HAEventHandler(None, None, context, CONTROLLER)
+    assert running.lock.acquire()
+    HAEventHandler(None, None, context, CONTROLLER).run()
+    assert removed == []
+    running.lock.release()
+    running.client.close()
+
+    # The next run to hold the lock reverts the rule left behind
+    HAEventHandler(None, None, context, CONTROLLER).run()
+    assert removed == [("sg-1", "sgr-1")]
+    assert os.environ["TMP_SG_GRP"] == os.environ["TMP_SG_RULE"] == ""
+
+
+def test_events_outside_ha_runs_revert_the_temp_sg_rule(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    reverted = []
+    monkeypatch.setattr(aviatrix_ha, "load_state", lambda *args: None)
+    monkeypatch.setattr(
+        aviatrix_ha.Invocation, "revert_temp_sg", lambda self: reverted.append(True)
+    )
+    monkeypatch.setattr(
+        aviatrix_ha.Invocation, "controller", (None, CONTROLLER), raising=False
+    )
+    monkeypatch.setattr(
+        "aviatrix_ha.handlers.asg.handler.handle_sns_event", lambda *args: None
+    )
+
+    def sns_event(name):
+        message = json.dumps({"Event": name})
+        return {"Records": [{"EventSource": "aws:sns", "Sns": {"Message": message}}]}
+
+    context = argparse.Namespace(function_name="ha")
+    # A launch starts a HA run, which reverts the rule once it holds the lock
+    aviatrix_ha._lambda_handler(sns_event("autoscaling:EC2_INSTANCE_LAUNCH"), context)
+    assert reverted == []
+    aviatrix_ha._lambda_handler(sns_event("autoscaling:TEST_NOTIFICATION"), context)
+    assert reverted == [True]
+    assert aviatrix_ha._lambda_handler({}, context) is False
+    assert reverted == [True, True]
+
+
+class FakeLambdaClient:
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, **kwargs):
+        self.invocations.append(kwargs)
+
+
+def test_handler_continues_in_new_invocation(store_path, monkeypatch):
+    monkeypatch.setenv("EIP", "198.51.100.1")
+    monkeypatch.setenv("HA_STATE_STORE", "memory")
+    monkeypatch.setenv("HA_LOCK_STORE", "memory")
+    lambda_client = FakeLambdaClient()
+    # No time left in this invocation once the reserve is taken out
+    context = argparse.Namespace(
+        function_name="ha",
+        invoked_function_arn="arn:aws:lambda:us-east-1:123456789012:function:ha",
+        get_remaining_time_in_millis=lambda: 1000,
+    )
+    handler = HAEventHandler(
+        None, lambda_client, context, CONTROLLER, event_time=100.0, attempt=2
+    )
+    handler.run()
+
+    [invocation] = lambda_client.invocations
+    assert invocation["InvocationType"] == "Event"
+    assert invocation["FunctionName"] == context.invoked_function_arn
+    payload = json.loads(invocation["Payload"])[CONTINUATION_EVENT_KEY]
+    assert payload["instance_id"] == "i-new"
+    assert payload["attempt"] == 3
+    assert payload["event_time"] == 100.0
+    assert payload["started_at"] == handler.run_start_time
+
+    # The lock stays with the run while it continues
+    assert not HAEventHandler(None, lambda_client, context, CONTROLLER).lock.acquire()
+
+    # Once the overall budget is spent the run fails
+    handler = HAEventHandler(
+        None,
+        lambda_client,
+        context,
+        CONTROLLER,
+        started_at=time.time() - HA_RUN_BUDGET,
+        lease_owner=payload["lease_owner"],
+    )
+    with pytest.raises(AvxError, match="Deadline exceeded"):
+        handler.run()
+    assert len(lambda_client.invocations) == 1
+    # and releases the lock
+    assert HAEventHandler(None, lambda_client, context, CONTROLLER).lock.acquire()
+
+
+def test_resumed_run_attaches_to_operation_in_flight(store_path, monkeypatch):
+    monkeypatch.setenv("EIP", "198.51.100.1")
+    release = threading.Event()
+    calls = []
+
+    def action():
+        calls.append("initial_setup")
+        release.wait(5)
+
+    context = argparse.Namespace(function_name="ha")
+    handler = HAEventHandler(None, None, context, CONTROLLER)
+    handler.operation_backoff = BackoffPolicy(0.01, 0.05)
+    monkeypatch.setattr(handler, "deadline_exceeded", lambda: bool(calls))
+    with pytest.raises(OperationInFlight):
+        handler._run_operation("initial_setup", action, status=lambda: False)
+    in_flight = Checkpoint("i-new").outputs["initial_setup_in_flight"]
+    assert in_flight["args"] == {}
+    handler.client.close()
+    release.set()
+
+    # The resumed run waits for the same operation instead of starting it again
+    handler = HAEventHandler(None, None, context, CONTROLLER)
+    handler.operation_backoff = BackoffPolicy(0.01, 0.05)
+    statuses = iter([False, True])
+    with handler.timeline.step("initial_setup_step") as record:
+        handler._run_operation("initial_setup", action, status=lambda: next(statuses))
+    assert calls == ["initial_setup"]
+    assert [report["attached"] for report in record.details["progress"]] == [
+        True,
+        True,
+    ]
+    assert Checkpoint("i-new").outputs["initial_setup_in_flight"] is None
+    handler.client.close()
+
+
+def test_resumed_run_waits_out_operation_without_status(store_path, monkeypatch):
+    monkeypatch.setenv("EIP", "198.51.100.1")
+    monkeypatch.setitem(client.API_TIMEOUTS, "restore_cloudx_config", 0.3)
+    release = threading.Event()
+    calls = []
+
+    def action():
+        calls.append(time.time())
+        release.wait(5)
+        return {"return": True}
+
+    context = argparse.Namespace(function_name="ha")
+    handler = HAEventHandler(None, None, context, CONTROLLER)
+    handler.operation_backoff = BackoffPolicy(0.01, 0.05)
+    monkeypatch.setattr(handler, "deadline_exceeded", lambda: bool(calls))
+    with pytest.raises(OperationInFlight):
+        handler._run_operation("restore_cloudx_config", action, s3_file="a.enc")
+    in_flight = Checkpoint("i-new").outputs["restore_cloudx_config_in_flight"]
+    assert in_flight["args"] == {"s3_file": "a.enc"}
+    handler.client.close()
+    release.set()
+
+    # Without a status probe, the resumed run waits until the first restore
+    # can no longer be running before starting it again
+    handler = HAEventHandler(None, None, context, CONTROLLER)
+    handler.operation_backoff = BackoffPolicy(0.01, 0.05)
+    result = handler._run_operation("restore_cloudx_config", action, s3_file="a.enc")
+    assert result == {"return": True}
+    assert len(calls) == 2
+    assert calls[1] - in_flight["started_at"] >= 0.3
+    assert Checkpoint("i-new").outputs["restore_cloudx_config_in_flight"] is None
+    handler.client.close()
+
+
+def test_store_failures_are_surfaced(store_path):
+    class BrokenStore(FileStateStore):
+        def _read(self):
+            raise AvxError("AccessDenied")
+
+    with pytest.raises(AvxError, match="Could not read checkpoint.*AccessDenied"):
+        Checkpoint("i-new", BrokenStore(str(store_path)))
+
+    checkpoint = Checkpoint("i-new")
+    writes = []
+
+    def write(state):
+        writes.append(state)
+        if len(writes) != 2:
+            raise AvxError("SlowDown")
+
+    checkpoint.store._write = write
+    # A single failed write is retried with the next one
+    checkpoint.record("login_step")
+    checkpoint.record("initial_setup_step")
+    assert writes[-1]["completed"] == ["login_step", "initial_setup_step"]
+    checkpoint.record("create_temp_account_step")
+    with pytest.raises(AvxError, match="2 times in a row: SlowDown"):
+        checkpoint.record("restore_backup_step")
+
+
+def test_only_the_invocation_deadline_continues_the_run(store_path, monkeypatch):
+    monkeypatch.setenv("EIP", "198.51.100.1")
+    context = argparse.Namespace(
+        function_name="ha", get_remaining_time_in_millis=lambda: 600_000
+    )
+    handler = HAEventHandler(None, None, context, CONTROLLER)
+    # A step out of its own budget fails, a new invocation would not help
+    with deadline.scoped(deadline.Deadline(time.time() - 1, "login_step budget")):
+        assert handler.deadline_exceeded()
+        assert not handler._should_continue()
+    handler.invocation_deadline = time.time() - 1
+    assert handler._should_continue()
+    handler.client.close()
@@ -0,0 +1,39 @@
+"""Tests for aviatrix_ha.csp.clients."""
+
+import pytest
+
+from aviatrix_ha.csp import clients
+
+
+@pytest.fixture(autouse=True)
+def aws_env(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.delenv("AWS_REGION", raising=False)
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    clients.reset_clients()
+    yield
+    clients.reset_clients()
+
+
+def test_clients_are_shared():
+    ec2 = clients.get_client("ec2")
+    assert clients.get_client("ec2") is ec2
+    assert ec2.meta.region_name == "us-east-1"
+    assert ec2.meta.config.max_pool_connections == 16
+    assert ec2.meta.config.retries["mode"] == "standard"
+
+    s3_west = clients.get_client("s3", "us-west-2")
+    assert s3_west.meta.region_name == "us-west-2"
+    assert clients.get_client("s3") is not s3_west
+
+    clients.reset_clients()
+    assert clients.get_client("ec2") is not ec2
+
+
+def test_preload_clients():
+    clients.preload_clients(("ec2", "lambda"))
+    assert set(clients._clients) == {
+        ("ec2", "us-east-1", "default"),
+        ("lambda", "us-east-1", "default"),
+    }
@@ -0,0 +1,92 @@
+"""Tests for aviatrix_ha.tools.deadline."""
+
+import time
+
+import pytest
+import requests
+
+from aviatrix_ha.api import client
+from aviatrix_ha.csp import clients
+from aviatrix_ha.errors.exceptions import AvxError, DeadlineExceeded
+from aviatrix_ha.tools import deadline
+
+
+class FakeContext:
+    def __init__(self, remaining_ms: int):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self) -> int:
+        return self.remaining_ms
+
+
+@pytest.fixture(autouse=True)
+def aws_env(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    clients.reset_clients()
+    yield
+    deadline.start_invocation(None)
+    clients.reset_clients()
+
+
+def test_start_invocation_keeps_a_margin():
+    invocation = deadline.start_invocation(FakeContext(60_000))
+    assert invocation is deadline.current()
+    assert 57 < invocation.remaining() <= 60 - deadline.INVOCATION_MARGIN
+
+    assert deadline.start_invocation(object()) is None
+    assert deadline.current() is None
+    assert deadline.timeout_for(10, "anything") == 10
+
+
+def test_share_and_scoped():
+    deadline.start_invocation(FakeContext(102_000))
+    run = deadline.Deadline.after(100, "HA run")
+    step = run.share(0.25, "step budget")
+    assert 24 < step.remaining() <= 25
+
+    with deadline.scoped(step):
+        assert deadline.current() is step
+        assert deadline.timeout_for(60, "restore") <= 25
+        with deadline.scoped(deadline.Deadline.after(1, "inner")):
+            assert deadline.timeout_for(60, "restore") <= 1
+        assert deadline.current() is step
+    assert deadline.current() is not step
+    assert deadline.timeout_for(5, "login") == 5
+
+
+def test_expired_deadline_fails_fast():
+    with deadline.scoped(deadline.Deadline(time.time() - 1, "step budget")):
+        with pytest.raises(DeadlineExceeded, match="step budget.*before login"):
+            deadline.timeout_for(10, "login")
+        assert deadline.best_effort_timeout(10) == deadline.MIN_BEST_EFFORT_TIMEOUT
+
+
+def test_aws_calls_fail_past_the_deadline():
+    ec2 = clients.get_client("ec2")
+    with deadline.scoped(deadline.Deadline(time.time() - 1, "step budget")):
+        with pytest.raises(DeadlineExceeded, match="before ec2.DescribeInstances"):
+            ec2.describe_instances()
+
+
+def test_api_client_timeout_becomes_deadline_exceeded(monkeypatch):
+    seen = {}
+
+    def request(method, url, timeout=None, **kwargs):
+        seen["timeout"] = timeout
+        raise requests.exceptions.ReadTimeout("timed out")
+
+    api = client.ApiClient("127.0.0.1")
+    monkeypatch.setattr(api.session, "request", request)
+    with deadline.scoped(deadline.Deadline.after(3, "step budget")):
+        with pytest.raises(DeadlineExceeded, match="initial_setup"):
+            api.initial_setup()
+    assert seen["timeout"][1] <= 3
+
+    # Without a deadline, the full timeout of the action is used and a
+    # timeout is not a deadline error
+    with pytest.raises(AvxError) as excinfo:
+        api.initial_setup()
+    assert not isinstance(excinfo.value, DeadlineExceeded)
+    assert seen["timeout"][1] == client.API_TIMEOUTS["initial_setup"]
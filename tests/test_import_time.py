@@ -0,0 +1,69 @@
+"""Import time budgets for the lambda entry paths.
+
+Each entry path is imported in a fresh interpreter with python -X importtime.
+The budgets are generous defaults for a developer machine and can be changed
+with the AVX_HA_IMPORT_BUDGET_MS environment variable, e.g. "1500" for all
+paths or "aviatrix_ha=800,aviatrix_ha.handlers.cft.handler=1500" per path.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+DEFAULT_BUDGETS_MS = {
+    "aviatrix_ha": 1000,
+    "aviatrix_ha.handlers.function.handler": 1000,
+    "aviatrix_ha.handlers.asg.handler": 2000,
+    "aviatrix_ha.handlers.cft.handler": 2000,
+}
+
+
+def _budget_ms(module: str) -> float:
+    setting = os.environ.get("AVX_HA_IMPORT_BUDGET_MS", "")
+    if setting and "=" not in setting:
+        return float(setting)
+    overrides = dict(item.split("=", 1) for item in setting.split(",") if "=" in item)
+    return float(overrides.get(module, DEFAULT_BUDGETS_MS[module]))
+
+
+def _import(module: str, code: str = "") -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}\n{code}"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+
+
+def _cumulative_ms(importtime_output: str, module: str) -> float:
+    """Get the cumulative import time of a module from -X importtime output"""
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative) / 1000
+    raise AssertionError(f"{module} not found in import time output")
+
+
+@pytest.mark.parametrize("module", DEFAULT_BUDGETS_MS)
+def test_import_time_budget(module):
+    rsp = _import(module)
+    elapsed_ms = _cumulative_ms(rsp.stderr, module)
+    budget_ms = _budget_ms(module)
+    assert (
+        elapsed_ms <= budget_ms
+    ), f"Importing {module} took {elapsed_ms:.0f}ms, budget is {budget_ms:.0f}ms"
+
+
+def test_handlers_load_on_demand():
+    rsp = _import(
+        "aviatrix_ha",
+        "import sys\n"
+        "print(sorted(m for m in sys.modules if m.startswith("
+        "('aviatrix_ha.handlers.', 'types_boto3', 'yaml'))))",
+    )
+    assert rsp.stdout.strip() == "[]"
@@ -18,6 +18,9 @@ import trustme
 import werkzeug.wrappers as wrappers
 
 import aviatrix_ha
+import aviatrix_ha.handlers.asg.event
+import aviatrix_ha.handlers.cft.handler
+from aviatrix_ha.csp.s3 import clear_version_cache
 from aviatrix_ha.errors.exceptions import AvxError
 
 
@@ -533,8 +536,13 @@ def test_lambda_e2e_with_open_sg(e2e_test_env, with_error):
     ids=["http_api", "rest_api"],
 )
 @moto.mock_aws
-def test_lambda_function(event_data):
+def test_lambda_function(event_data, monkeypatch):
     """Test the lambda function returns the controller version fetched from S3"""
+
+    def unexpected_describe(*args, **kwargs):
+        raise AssertionError("Function requests must not describe the controller")
+
+    monkeypatch.setattr(aviatrix_ha, "get_controller_instance", unexpected_describe)
     os.environ["S3_BUCKET_REGION"] = "us-west-2"
     s3 = boto3.client("s3")
     os.environ["PRIV_IP"] = priv_ip = "10.20.30.40"
@@ -551,7 +559,28 @@ def test_lambda_function(event_data):
         Body=b"some data",
     )
 
+    clear_version_cache()
     result = aviatrix_ha._lambda_handler(event_data, CONTEXT)
     assert result["statusCode"] == 200
     assert result["body"] == "8.0.0-1000.1234"
     assert result["headers"]["Content-Type"] == "text/plain"
+    assert result["headers"]["Cache-Control"]
+    etag = result["headers"]["ETag"]
+
+    conditional_event = {
+        **event_data,
+        "headers": {**event_data["headers"], "If-None-Match": etag},
+    }
+    result = aviatrix_ha._lambda_handler(conditional_event, CONTEXT)
+    assert result["statusCode"] == 304
+    assert result["headers"]["ETag"] == etag
+
+    s3.put_object(
+        Bucket=os.environ["S3_BUCKET_BACK"],
+        Key=f"CloudN_{priv_ip}_save_cloudx_version.txt",
+        Body=b"8.1.0-1000.2345",
+    )
+    result = aviatrix_ha._lambda_handler(conditional_event, CONTEXT)
+    assert result["statusCode"] == 200
+    assert result["body"] == "8.1.0-1000.2345"
+    assert result["headers"]["ETag"] != etag
@@ -0,0 +1,110 @@
+"""Tests for aviatrix_ha.csp.lock."""
+
+import contextlib
+
+import boto3
+import moto
+import pytest
+
+import aviatrix_ha.handlers.cft.handler as cft_handler
+from aviatrix_ha.csp import lock, state
+from aviatrix_ha.errors.exceptions import AvxError, LockHeldError
+
+
+@pytest.fixture(autouse=True)
+def aws_env(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_SESSION_TOKEN", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+
+def test_memory_lock():
+    backend = {}
+    first = lock.LeaseLock(state.MemoryStateStore(backend))
+    second = lock.LeaseLock(state.MemoryStateStore(backend))
+
+    assert first.acquire()
+    assert not second.acquire()
+    assert second.holder["owner"] == first.owner
+    with pytest.raises(LockHeldError):
+        with second:
+            pass
+
+    # The same owner may take the lock again, e.g. from a continuation
+    assert lock.LeaseLock(state.MemoryStateStore(backend), first.owner).acquire()
+
+    first.release()
+    with second:
+        assert not first.acquire()
+    assert first.acquire()
+
+
+def test_expired_lease_is_taken_over():
+    backend = {}
+    stuck = lock.LeaseLock(state.MemoryStateStore(backend), lease=-1)
+    assert stuck.acquire()
+    other = lock.LeaseLock(state.MemoryStateStore(backend))
+    assert other.acquire()
+    # The previous holder no longer owns the lock and cannot release it
+    stuck.release()
+    assert not stuck.acquire()
+
+
+def test_conflicting_write_loses():
+    backend = {}
+    first = lock.LeaseLock(state.MemoryStateStore(backend))
+    second = lock.LeaseLock(state.MemoryStateStore(backend))
+    # second reads the lock as free, then first takes it
+    second.store.load()
+    assert first.acquire()
+    # and still believes it free when it writes
+    second.store.load = lambda: {}
+    assert not second.acquire()
+
+
+@moto.mock_aws
+def test_s3_lock(monkeypatch):
+    boto3.client("s3").create_bucket(Bucket="backup-bucket")
+    monkeypatch.setenv("S3_BUCKET_BACK", "backup-bucket")
+    monkeypatch.setenv("AVIATRIX_TAG", "ctrl")
+    monkeypatch.delenv("HA_LOCK_STORE", raising=False)
+
+    first = lock.get_ha_lock("i-1")
+    assert repr(first.store) == "s3://backup-bucket/avx-ha/locks/ctrl/i-1.json"
+    assert first.acquire()
+    assert not lock.get_ha_lock("i-1").acquire()
+    assert lock.get_ha_lock("i-2").acquire()
+    first.release()
+    assert lock.get_ha_lock("i-1").acquire()
+
+
+def test_store_errors_are_raised():
+    class BrokenStore(state.MemoryStateStore):
+        def _read(self):
+            raise AvxError("AccessDenied")
+
+    # Running without the lock could handle the same controller twice
+    with pytest.raises(AvxError, match="Could not take lock.*AccessDenied"):
+        lock.LeaseLock(BrokenStore({})).acquire()
+
+
+def test_cft_delete_does_not_take_the_lock(monkeypatch):
+    monkeypatch.setenv("HA_LOCK_STORE", "memory")
+    monkeypatch.setattr(
+        cft_handler, "env_transaction", lambda *args: contextlib.nullcontext()
+    )
+    monkeypatch.setattr(cft_handler, "delete_resources", lambda inst_id: None)
+    responses = []
+    monkeypatch.setattr(
+        cft_handler,
+        "send_response",
+        lambda event, context, status, *args: responses.append(status),
+    )
+    assert lock.get_ha_lock("i-cft").acquire()
+    controller = {"InstanceId": "i-cft"}
+    for request_type in ("Update", "Delete"):
+        event = {"RequestType": request_type, "ResourceProperties": {}}
+        cft_handler.handle_cft(None, event, None, None, None, controller, "ctrl")
+    # A held lock fails an Update, but not the deletion of the stack
+    assert responses == ["FAILED", "SUCCESS"]
@@ -0,0 +1,84 @@
+"""Tests for aviatrix_ha.api.operation."""
+
+import threading
+import time
+
+import pytest
+
+from aviatrix_ha.api.operation import LongRunningOperation
+from aviatrix_ha.errors.exceptions import AvxError, OperationInFlight
+from aviatrix_ha.tools import deadline
+from aviatrix_ha.tools.backoff import BackoffPolicy
+
+POLICY = BackoffPolicy(0.01, 0.05)
+
+
+def test_operation_returns_result_and_reports_progress():
+    release = threading.Event()
+
+    def action():
+        release.wait(5)
+        return {"return": True}
+
+    operation = LongRunningOperation.start("restore", action, window=60)
+    reports = []
+
+    def on_progress(op):
+        reports.append(op.completed)
+        if len(reports) == 3:
+            release.set()
+
+    assert operation.wait(POLICY, lambda: False, on_progress) == {"return": True}
+    assert operation.completed
+    assert reports[-1] is True and not any(reports[:-1])
+    assert operation.polls == len(reports)
+
+
+def test_operation_error_is_raised():
+    def action():
+        raise AvxError("restore failed")
+
+    operation = LongRunningOperation.start("restore", action, window=60)
+    with pytest.raises(AvxError, match="restore failed"):
+        operation.wait(POLICY, lambda: False)
+
+
+def test_deadline_leaves_operation_in_flight():
+    release = threading.Event()
+    operation = LongRunningOperation.start("restore", lambda: release.wait(5), 60)
+    with pytest.raises(OperationInFlight, match="restore still running"):
+        operation.wait(POLICY, lambda: operation.polls >= 2)
+    assert not operation.completed
+    release.set()
+
+
+def test_action_runs_with_the_deadline_of_the_caller():
+    step_deadline = deadline.Deadline.after(0.05, "step budget")
+    with deadline.scoped(step_deadline):
+        operation = LongRunningOperation.start("restore", deadline.current, 60)
+    assert operation.wait(POLICY, lambda: False) is step_deadline
+
+
+def test_action_cut_short_by_the_deadline_is_in_flight():
+    def action():
+        raise AvxError("read timed out")
+
+    operation = LongRunningOperation.start("restore", action, window=60)
+    with pytest.raises(OperationInFlight, match="read timed out"):
+        operation.wait(POLICY, lambda: True)
+
+
+def test_attached_operation():
+    # Completes when the status probe says so
+    statuses = iter([False, False, True])
+    operation = LongRunningOperation(
+        "initial_setup", time.time() - 5, 60, status=lambda: next(statuses)
+    )
+    assert operation.attached
+    assert operation.wait(POLICY, lambda: False) is None
+    assert operation.completed and operation.polls == 3
+
+    # Without a status probe, it is over once its window has passed
+    operation = LongRunningOperation("restore", time.time() - 0.05, 0.1)
+    assert operation.wait(POLICY, lambda: False) is None
+    assert not operation.completed
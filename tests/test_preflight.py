@@ -0,0 +1,89 @@
+"""Tests for aviatrix_ha.tools.preflight."""
+
+import argparse
+import threading
+import time
+
+import aviatrix_ha.handlers.cft.handler as cft_handler
+from aviatrix_ha.errors.exceptions import AvxError
+from aviatrix_ha.tools.preflight import Check, run_checks
+
+
+def test_checks_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def check():
+        # Only passes if all three checks run at the same time
+        barrier.wait()
+        time.sleep(0.05)
+
+    report = run_checks([Check(name, check) for name in ("a", "b", "c")])
+    assert report.passed
+    assert report.reason == ""
+    assert all(result.duration >= 0.05 for result in report.results)
+
+
+def test_failures_are_aggregated():
+    def raises():
+        raise AvxError("keypair is invalid")
+
+    report = run_checks(
+        [
+            Check("bucket", lambda: "Unable to verify S3 bucket"),
+            Check("backup", lambda: None, depends_on=("bucket",)),
+            Check("keypair", raises),
+            Check("subnets", lambda: None),
+        ]
+    )
+    assert not report.passed
+    assert [result.outcome for result in report.results] == [
+        "failed",
+        "skipped",
+        "failed",
+        "passed",
+    ]
+    assert report.reason == "Unable to verify S3 bucket; keypair is invalid"
+    assert '"backup": {"outcome": "skipped"' in report.summary()
+
+
+def test_unexpected_errors_fail_the_check():
+    def raises():
+        raise KeyError("Buckets")
+
+    report = run_checks(
+        [
+            Check("bucket", raises),
+            Check("backup_file", lambda: None, depends_on=("bucket",)),
+            Check("subnets", lambda: None),
+        ]
+    )
+    assert [result.outcome for result in report.results] == [
+        "failed",
+        "skipped",
+        "passed",
+    ]
+    assert report.reason == "KeyError: 'Buckets'"
+
+
+def test_create_checks_report_all_failures(monkeypatch):
+    monkeypatch.delenv("EIP", raising=False)
+    monkeypatch.setattr(cft_handler, "verify_iam", lambda instance: False)
+    monkeypatch.setattr(cft_handler, "verify_bucket", lambda: (False, ""))
+    monkeypatch.setattr(cft_handler, "check_ami_id", lambda ami_id: False)
+    monkeypatch.setattr(cft_handler, "update_env_dict", lambda *args: None)
+    context = argparse.Namespace(function_name="ha")
+
+    report = run_checks(
+        cft_handler._create_checks(None, None, {"ImageId": "ami-old"}, context)
+    )
+    outcomes = {result.name: result.outcome for result in report.results}
+    assert outcomes == {
+        "iam": "failed",
+        "bucket": "failed",
+        "backup_file": "skipped",
+        "eip": "passed",
+        "ami": "failed",
+    }
+    assert report.reason.startswith("IAM role aviatrix-role-ec2 could not be verified")
+    assert "Unable to verify S3 bucket" in report.reason
+    assert "AMI is not latest" in report.reason
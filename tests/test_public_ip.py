@@ -0,0 +1,80 @@
+"""Tests for aviatrix_ha.api.external.ip."""
+
+import time
+
+import pytest
+import requests
+import responses
+from pytest_httpserver import HTTPServer
+
+from aviatrix_ha.api.external import ip
+from aviatrix_ha.errors.exceptions import AvxError
+
+SOURCES = ["https://one.example", "https://two.example", "https://three.example"]
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    ip.clear_public_ip_cache()
+    yield
+    ip.clear_public_ip_cache()
+
+
+def test_local_stub_source(monkeypatch):
+    # A server of its own, as the shared one may be set up for TLS
+    server = HTTPServer(port=0)
+    server.expect_request("/ip").respond_with_data("198.51.100.7\n")
+    server.start()
+    try:
+        monkeypatch.setenv("PUBLIC_IP_SOURCES", f" {server.url_for('/ip')} ,")
+        assert ip.get_public_ip_sources() == [server.url_for("/ip")]
+        assert ip.get_public_ip() == "198.51.100.7"
+    finally:
+        server.stop()
+
+
+@responses.activate
+def test_first_valid_answer_wins():
+    def slow(request):
+        time.sleep(2)
+        return 200, {}, "198.51.100.1"
+
+    responses.add_callback(responses.GET, SOURCES[0], callback=slow)
+    responses.add(responses.GET, SOURCES[1], body="<html>rate limited</html>")
+    responses.add(responses.GET, SOURCES[2], body="198.51.100.3\n")
+    start = time.monotonic()
+    assert ip.get_public_ip(SOURCES) == "198.51.100.3"
+    assert time.monotonic() - start < 1
+
+
+@responses.activate
+def test_no_valid_answer():
+    responses.add(responses.GET, SOURCES[0], status=503)
+    responses.add(responses.GET, SOURCES[1], body="127.0.0.1")
+    responses.add(
+        responses.GET, SOURCES[2], body=requests.exceptions.ConnectionError("down")
+    )
+    with pytest.raises(AvxError, match="Could not determine the public IP"):
+        ip.get_public_ip(SOURCES)
+
+
+@responses.activate
+def test_warm_cache(monkeypatch):
+    responses.add(responses.GET, SOURCES[0], body="198.51.100.1")
+    assert ip.get_public_ip(SOURCES[:1]) == "198.51.100.1"
+    assert ip.get_public_ip(SOURCES[:1]) == "198.51.100.1"
+    assert len(responses.calls) == 1
+
+    # A stale address is looked up again
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + ip.PUBLIC_IP_CACHE_TTL)
+    responses.replace(responses.GET, SOURCES[0], body="198.51.100.2")
+    assert ip.get_public_ip(SOURCES[:1]) == "198.51.100.2"
+
+    # and still used for a while if no source answers
+    monkeypatch.setattr(time, "time", lambda: now + 2 * ip.PUBLIC_IP_CACHE_TTL)
+    responses.replace(responses.GET, SOURCES[0], status=500)
+    assert ip.get_public_ip(SOURCES[:1]) == "198.51.100.2"
+    monkeypatch.setattr(time, "time", lambda: now + 2 * ip.PUBLIC_IP_MAX_STALE)
+    with pytest.raises(AvxError):
+        ip.get_public_ip(SOURCES[:1])
@@ -0,0 +1,59 @@
+"""Tests for aviatrix_ha.api.retry."""
+
+import pytest
+import requests
+
+from aviatrix_ha.api.retry import Retrier, api_error, classify
+from aviatrix_ha.errors.exceptions import (
+    DeadlineExceeded,
+    PermanentApiError,
+    TransientApiError,
+)
+from aviatrix_ha.tools.backoff import BackoffPolicy
+
+
+def http_error(status: int) -> requests.exceptions.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status} error", response=response)
+
+
+@pytest.mark.parametrize(
+    "failure, category",
+    [
+        (requests.exceptions.ConnectionError("Connection refused"), TransientApiError),
+        (requests.exceptions.ReadTimeout("read timed out"), TransientApiError),
+        (http_error(502), TransientApiError),
+        (http_error(429), TransientApiError),
+        (http_error(403), PermanentApiError),
+        ({"return": False, "reason": "Controller is not ready"}, TransientApiError),
+        ({"return": False, "reason": "CID is invalid or expired"}, TransientApiError),
+        ({"return": False, "reason": "Invalid role arn"}, PermanentApiError),
+        ({"return": False, "reason": "AccessDenied: not allowed"}, PermanentApiError),
+        # Vague reasons are retried
+        ({"return": False, "reason": "Something went wrong"}, TransientApiError),
+        ({"return": False}, TransientApiError),
+    ],
+)
+def test_classify(failure, category):
+    assert classify(failure) is category
+    assert isinstance(api_error("Call failed", failure), category)
+
+
+def test_api_error_message():
+    error = api_error("Could not restore backup", {"return": False, "reason": "x"})
+    assert str(error) == "Could not restore backup: x"
+
+
+def test_retrier_limits_permanent_failures():
+    retrier = Retrier(BackoffPolicy(0.01, 0.02))
+    for _ in range(10):
+        assert retrier.next_delay("call", http_error(503)) <= 0.02
+    failure = {"return": False, "reason": "Invalid role arn"}
+    assert retrier.next_delay("call", failure) <= 2
+    assert retrier.next_delay("call", failure) <= 2
+    with pytest.raises(PermanentApiError, match="call: Invalid role arn"):
+        retrier.next_delay("call", failure)
+
+    with pytest.raises(DeadlineExceeded):
+        Retrier().next_delay("call", DeadlineExceeded("no time left"))
@@ -0,0 +1,41 @@
+"""Tests for aviatrix_ha.csp.s3."""
+
+import datetime
+
+import boto3
+import moto
+import pytest
+
+from aviatrix_ha.csp import s3
+
+BUCKET = "backup-bucket"
+
+
+@pytest.fixture(autouse=True)
+def aws_env(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_SESSION_TOKEN", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("S3_BUCKET_BACK", BUCKET)
+    monkeypatch.setenv("S3_BUCKET_REGION", "us-east-1")
+
+
+@moto.mock_aws
+def test_backup_file_info():
+    s3c = boto3.client("s3")
+    s3c.create_bucket(Bucket=BUCKET)
+    s3c.put_object(
+        Bucket=BUCKET, Key="CloudN_10.1.1.1_save_cloudx_config.enc", Body=b"x" * 1024
+    )
+
+    backup = s3.get_backup_file_info("CloudN_10.1.1.1_save_cloudx_config.enc")
+    assert backup is not None
+    assert backup.size == 1024
+    assert backup.etag
+    assert s3.is_backup_file_is_recent(backup)
+
+    backup.last_modified -= datetime.timedelta(seconds=s3.MAXIMUM_BACKUP_AGE + 1)
+    assert not s3.is_backup_file_is_recent(backup)
+
+    assert s3.get_backup_file_info("CloudN_10.2.2.2_save_cloudx_config.enc") is None
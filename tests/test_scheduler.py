@@ -0,0 +1,75 @@
+"""Tests for aviatrix_ha.tools.scheduler."""
+
+import threading
+
+import pytest
+
+from aviatrix_ha.errors.exceptions import AvxError
+from aviatrix_ha.tools.scheduler import Task, TaskScheduler
+
+
+def test_dependencies_are_honoured():
+    order = []
+    lock = threading.Lock()
+
+    def record(name):
+        def func():
+            with lock:
+                order.append(name)
+            return name
+
+        return func
+
+    scheduler = TaskScheduler(
+        [
+            Task("c", record("c"), ("a", "b")),
+            Task("a", record("a")),
+            Task("b", record("b"), ("a",)),
+            Task("d", record("d"), ("a",)),
+        ],
+        max_workers=4,
+    )
+    results = scheduler.run()
+    assert results == {"a": "a", "b": "b", "c": "c", "d": "d"}
+    assert order[0] == "a"
+    assert order.index("c") > order.index("b")
+
+
+def test_independent_tasks_overlap():
+    barrier = threading.Barrier(2, timeout=5)
+    scheduler = TaskScheduler(
+        [Task("a", barrier.wait), Task("b", barrier.wait)], max_workers=2
+    )
+    # Would raise BrokenBarrierError if the tasks ran one after the other
+    scheduler.run()
+
+
+def test_stop_when_skips_dependents():
+    scheduler = TaskScheduler(
+        [Task("a", lambda: "stop"), Task("b", lambda: "b", ("a",))], max_workers=2
+    )
+    assert scheduler.run(stop_when=lambda result: result == "stop") == {"a": "stop"}
+
+
+def test_error_skips_dependents():
+    def fail():
+        raise AvxError("boom")
+
+    called = []
+    scheduler = TaskScheduler(
+        [Task("a", fail), Task("b", lambda: called.append("b"), ("a",))],
+        max_workers=2,
+    )
+    with pytest.raises(AvxError, match="boom"):
+        scheduler.run()
+    assert not called
+
+
+def test_invalid_graphs():
+    with pytest.raises(AvxError, match="unknown task"):
+        TaskScheduler([Task("a", lambda: None, ("b",))], max_workers=1)
+    with pytest.raises(AvxError, match="cycle"):
+        TaskScheduler(
+            [Task("a", lambda: None, ("b",)), Task("b", lambda: None, ("a",))],
+            max_workers=1,
+        )
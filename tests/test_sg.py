@@ -0,0 +1,120 @@
+"""Tests for aviatrix_ha.csp.sg."""
+
+import collections
+
+import boto3
+import moto
+import pytest
+
+from aviatrix_ha.csp import sg
+from aviatrix_ha.tools import cache
+
+MOTO_AMI_ID = "ami-12c6146b"
+
+
+@pytest.fixture(autouse=True)
+def aws_env(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_SESSION_TOKEN", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    cache.clear()
+
+
+def count_calls(client):
+    calls = collections.Counter()
+
+    def count(model, **_):
+        calls[model.name] += 1
+
+    client.meta.events.register("before-call", count)
+    return calls
+
+
+@moto.mock_aws
+def test_open_rules_are_modified_in_batches(capsys):
+    ec2 = boto3.client("ec2")
+    vpc_id = ec2.create_vpc(CidrBlock="10.0.0.0/16")["Vpc"]["VpcId"]
+    group_ids = [
+        ec2.create_security_group(
+            GroupName=f"controller-{i}", Description="controller", VpcId=vpc_id
+        )["GroupId"]
+        for i in range(2)
+    ]
+    for group_id in group_ids:
+        ec2.authorize_security_group_ingress(
+            GroupId=group_id,
+            IpPermissions=[
+                {
+                    "IpProtocol": "tcp",
+                    "FromPort": port,
+                    "ToPort": port,
+                    "IpRanges": [{"CidrIp": "0.0.0.0/0"}],
+                }
+                for port in (443, 8443)
+            ]
+            + [
+                {
+                    "IpProtocol": "tcp",
+                    "FromPort": 0,
+                    "ToPort": 1024,
+                    "IpRanges": [{"CidrIp": "0.0.0.0/0"}],
+                },
+                {
+                    "IpProtocol": "tcp",
+                    "FromPort": 443,
+                    "ToPort": 443,
+                    "IpRanges": [{"CidrIp": "10.0.0.0/16"}],
+                },
+            ],
+        )
+    subnet_id = ec2.create_subnet(VpcId=vpc_id, CidrBlock="10.0.0.0/24")["Subnet"][
+        "SubnetId"
+    ]
+    inst_id = ec2.run_instances(
+        ImageId=MOTO_AMI_ID,
+        MinCount=1,
+        MaxCount=1,
+        SubnetId=subnet_id,
+        SecurityGroupIds=group_ids,
+    )["Instances"][0]["InstanceId"]
+
+    def rules(cidr):
+        found = ec2.describe_security_group_rules(
+            Filters=[{"Name": "group-id", "Values": group_ids}]
+        )["SecurityGroupRules"]
+        return {
+            sgr["SecurityGroupRuleId"]
+            for sgr in found
+            if not sgr["IsEgress"] and sgr.get("CidrIpv4") == cidr
+        }
+
+    open_rules = rules("0.0.0.0/0")
+    assert len(open_rules) == 6
+    calls = count_calls(ec2)
+    disabled = sg.disable_open_sg_rules(ec2, inst_id)
+
+    # The rules covering port 443 are modified with one call per group and
+    # tagged with a single call
+    assert len(disabled) == 4
+    assert {rule["GroupId"] for rule in disabled} == set(group_ids)
+    assert calls["ModifySecurityGroupRules"] == 2
+    assert calls["CreateTags"] == 1
+    assert calls["DescribeSecurityGroups"] == 0
+    assert sum(calls.values()) == 5
+    assert "Disabled 4 open SG rules using 5 EC2 API calls" in capsys.readouterr().out
+    disabled_ids = {rule["SecurityGroupRuleId"] for rule in disabled}
+    assert rules("0.0.0.0/32") == disabled_ids
+    assert rules("0.0.0.0/0") == open_rules - disabled_ids
+
+    calls.clear()
+    enabled = sg.enable_open_sg_rules(ec2, inst_id)
+    assert {rule["SecurityGroupRuleId"] for rule in enabled} == disabled_ids
+    assert calls["ModifySecurityGroupRules"] == 2
+    assert calls["DeleteTags"] == 1
+    # The instance description is reused from the first call
+    assert calls["DescribeInstances"] == 0
+    assert sum(calls.values()) == 4
+    assert "Re-enabled 4 open SG rules using 4 EC2 API calls" in capsys.readouterr().out
+    assert rules("0.0.0.0/32") == set()
+    assert rules("0.0.0.0/0") == open_rules
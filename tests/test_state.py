@@ -0,0 +1,158 @@
+"""Tests for aviatrix_ha.csp.state and the state store used by lambda_c."""
+
+import argparse
+import os
+
+import boto3
+import moto
+import pytest
+
+from aviatrix_ha.csp import lambda_c, state
+from aviatrix_ha.errors.exceptions import AvxError, StateConflictError
+
+CONTEXT = argparse.Namespace(function_name="state-test-ha")
+
+
+@pytest.fixture(autouse=True)
+def aws_env(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_SESSION_TOKEN", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+
+def test_memory_store_skips_unchanged_writes():
+    store = state.store_from_url("memory")
+    assert store.load() == {}
+    assert store.save({"INST_ID": "i-1"})
+    assert not store.save({"INST_ID": "i-1"})
+    assert store.load() == {"INST_ID": "i-1"}
+
+
+def test_file_store(tmp_path):
+    path = tmp_path / "state.json"
+    store = state.store_from_url(f"file://{path}")
+    assert store.load() == {}
+    store.save({"INST_ID": "i-1"})
+    assert state.store_from_url(f"file://{path}").load() == {"INST_ID": "i-1"}
+
+
+@moto.mock_aws
+def test_s3_store_conditional_writes():
+    boto3.client("s3").create_bucket(Bucket="state-bucket")
+    first = state.store_from_url("s3://state-bucket/ha/state.json")
+    second = state.store_from_url("s3://state-bucket/ha/state.json")
+
+    assert first.save({"INST_ID": "i-1"})
+    assert second.load() == {"INST_ID": "i-1"}
+    assert second.save({"INST_ID": "i-2"})
+    # first still holds the ETag of its own write
+    with pytest.raises(StateConflictError):
+        first.save({"INST_ID": "i-3"})
+    assert first.load() == {"INST_ID": "i-2"}
+    assert first.save({"INST_ID": "i-3"})
+
+
+@moto.mock_aws
+def test_ssm_store():
+    store = state.store_from_url("ssm:/avx/ha/state")
+    assert store.load() == {}
+    store.save({"INST_ID": "i-1"})
+    assert state.store_from_url("ssm:/avx/ha/state").load() == {"INST_ID": "i-1"}
+
+
+def test_unsupported_store():
+    with pytest.raises(AvxError):
+        state.store_from_url("ftp://somewhere/state")
+
+
+def test_lambda_state_uses_configured_store(monkeypatch, tmp_path):
+    path = tmp_path / "state.json"
+    monkeypatch.setenv("HA_STATE_STORE", f"file://{path}")
+    monkeypatch.setenv("AVIATRIX_TAG", "ha_ctrl")
+    state.FileStateStore(str(path)).save(
+        {"INST_ID": "i-1", "PRIV_IP": "10.1.1.1", "AVIATRIX_TAG": "stale"}
+    )
+    monkeypatch.delenv("INST_ID", raising=False)
+    monkeypatch.delenv("PRIV_IP", raising=False)
+
+    lambda_c.load_state(None, CONTEXT)
+    assert os.environ["INST_ID"] == "i-1"
+    assert os.environ["AVIATRIX_TAG"] == "ha_ctrl"
+
+    lambda_c.update_env_dict(None, CONTEXT, {"INST_ID": "i-2"})
+    saved = state.FileStateStore(str(path)).load()
+    assert saved["INST_ID"] == "i-2"
+    assert saved["PRIV_IP"] == "10.1.1.1"
+
+
+class FakeWaiter:
+    def wait(self, **kwargs):
+        pass
+
+
+class FakeLambdaClient:
+    """The environment of a lambda function, counting the updates made"""
+
+    def __init__(self, variables):
+        self.variables = dict(variables)
+        self.updates = 0
+
+    def get_waiter(self, name):
+        return FakeWaiter()
+
+    def get_function_configuration(self, FunctionName):
+        return {"Environment": {"Variables": dict(self.variables)}}
+
+    def update_function_configuration(self, FunctionName, Environment):
+        self.variables = dict(Environment["Variables"])
+        self.updates += 1
+
+
+def test_lambda_env_store_keeps_other_variables():
+    lambda_client = FakeLambdaClient(
+        {"INST_ID": "i-1", "HA_LOCK_STORE": "s3://locks/ha", "API_ENDPOINT_RACE": "1"}
+    )
+    store = lambda_c.LambdaEnvStateStore(lambda_client, CONTEXT.function_name)
+    assert store.save({"INST_ID": "i-2", "PRIV_IP": "10.1.1.2"})
+    assert lambda_client.variables == {
+        "INST_ID": "i-2",
+        "PRIV_IP": "10.1.1.2",
+        "HA_LOCK_STORE": "s3://locks/ha",
+        "API_ENDPOINT_RACE": "1",
+    }
+
+
+def test_lambda_env_updates_are_coalesced(monkeypatch):
+    monkeypatch.delenv("HA_STATE_STORE", raising=False)
+    monkeypatch.setenv("TMP_SG_GRP", "")
+    monkeypatch.setenv("TMP_SG_RULE", "")
+    context = argparse.Namespace(function_name="coalesce-test-ha")
+    lambda_client = FakeLambdaClient(
+        dict(lambda_c._get_env_dict(), HA_LOCK_STORE="memory")
+    )
+    lambda_c.load_state(lambda_client, context)
+
+    # Nothing changed, although the environment holds other variables too
+    lambda_c.flush_env(lambda_client, context)
+    assert lambda_client.updates == 0
+
+    with lambda_c.env_transaction(lambda_client, context):
+        lambda_c.update_env_dict(lambda_client, context, {"TMP_SG_GRP": "sg-1"})
+        lambda_c.update_env_dict(lambda_client, context, {"TMP_SG_RULE": "sgr-1"})
+        assert lambda_client.updates == 0
+        # Durable updates are written at once, with those deferred so far
+        lambda_c.update_env_dict(
+            lambda_client, context, {"TMP_SG_GRP": "sg-2"}, durable=True
+        )
+        assert lambda_client.updates == 1
+        assert lambda_client.variables["TMP_SG_RULE"] == "sgr-1"
+        lambda_c.update_env_dict(lambda_client, context, {"TMP_SG_RULE": "sgr-2"})
+    assert lambda_client.updates == 2
+    assert lambda_client.variables["TMP_SG_GRP"] == "sg-2"
+    assert lambda_client.variables["TMP_SG_RULE"] == "sgr-2"
+    assert lambda_client.variables["HA_LOCK_STORE"] == "memory"
+
+    # Writing the values already saved is skipped
+    lambda_c.update_env_dict(lambda_client, context, {"TMP_SG_GRP": "sg-2"})
+    assert lambda_client.updates == 2
@@ -0,0 +1,59 @@
+"""Tests for aviatrix_ha.csp.target_group."""
+
+import boto3
+import moto
+import pytest
+
+from aviatrix_ha.csp import target_group
+from aviatrix_ha.tools import cache
+
+MOTO_AMI_ID = "ami-12c6146b"
+
+
+@pytest.fixture(autouse=True)
+def aws_env(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_SESSION_TOKEN", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    cache.clear()
+
+
+@moto.mock_aws
+def test_get_target_group_arns():
+    ec2 = boto3.client("ec2")
+    elb = boto3.client("elbv2")
+    vpc_id = ec2.create_vpc(CidrBlock="10.0.0.0/16")["Vpc"]["VpcId"]
+    other_vpc_id = ec2.create_vpc(CidrBlock="10.1.0.0/16")["Vpc"]["VpcId"]
+    inst_id = ec2.run_instances(ImageId=MOTO_AMI_ID, MinCount=1, MaxCount=1)[
+        "Instances"
+    ][0]["InstanceId"]
+
+    def create_target_group(name, vpc, target_type="instance"):
+        return elb.create_target_group(
+            Name=name,
+            Protocol="HTTPS",
+            Port=443,
+            VpcId=vpc,
+            TargetType=target_type,
+        )["TargetGroups"][0]["TargetGroupArn"]
+
+    for i in range(3):
+        create_target_group(f"unrelated-{i}", vpc_id)
+    create_target_group("ip-targets", vpc_id, target_type="ip")
+    controller_tg = create_target_group("controller", vpc_id)
+    other_vpc_tg = create_target_group("other-vpc", other_vpc_id)
+    elb.register_targets(TargetGroupArn=controller_tg, Targets=[{"Id": inst_id}])
+    elb.register_targets(TargetGroupArn=other_vpc_tg, Targets=[{"Id": inst_id}])
+
+    assert target_group.get_target_group_arns(inst_id, vpc_id) == [controller_tg]
+    assert target_group.get_target_group_arns(inst_id) == [
+        controller_tg,
+        other_vpc_tg,
+    ]
+
+    # Results are cached for the rest of the invocation
+    elb.deregister_targets(TargetGroupArn=controller_tg, Targets=[{"Id": inst_id}])
+    assert target_group.get_target_group_arns(inst_id, vpc_id) == [controller_tg]
+    cache.clear()
+    assert target_group.get_target_group_arns(inst_id, vpc_id) == []
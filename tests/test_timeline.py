@@ -0,0 +1,73 @@
+"""Tests for aviatrix_ha.handlers.asg.timeline."""
+
+import json
+import logging
+import threading
+import types
+
+import pytest
+
+from aviatrix_ha.handlers.asg import timeline as timeline_module
+from aviatrix_ha.handlers.asg.timeline import FailoverTimeline
+
+
+def test_step_records_timing_retries_and_details(monkeypatch):
+    clock = iter([100.0, 102.5])
+    fake_time = types.SimpleNamespace(
+        time=lambda: 1000.0, monotonic=lambda: next(clock)
+    )
+    monkeypatch.setattr(timeline_module, "time", fake_time)
+    timeline = FailoverTimeline("i-123")
+    with timeline.step("login_step") as record:
+        timeline.retry()
+        timeline.retry()
+        timeline.annotate(endpoint="10.0.0.1")
+        timeline.progress(state="waiting")
+        record.outcome = "continue"
+
+    assert record.duration == 2.5
+    assert record.retries == 2
+    assert record.details["endpoint"] == "10.0.0.1"
+    assert record.details["progress"][0]["state"] == "waiting"
+    # Outside of a step, nothing is recorded
+    timeline.retry()
+    timeline.annotate(ignored=True)
+    assert record.retries == 2
+    assert "ignored" not in record.details
+
+
+def test_failed_step_and_concurrent_steps():
+    timeline = FailoverTimeline("i-123")
+    with pytest.raises(RuntimeError):
+        with timeline.step("restore_backup_step"):
+            raise RuntimeError("restore failed")
+    assert timeline.records[0].outcome == "failed"
+
+    def run(name: str) -> None:
+        with timeline.step(name):
+            timeline.retry()
+
+    threads = [threading.Thread(target=run, args=(f"step{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Each retry is counted against the step of its own thread
+    assert [record.retries for record in timeline.records[1:]] == [1, 1, 1, 1]
+
+
+def test_summary_and_emit(caplog):
+    timeline = FailoverTimeline("i-123", event_time=1000.0)
+    timeline.start_time = 1010.0
+    with timeline.step("create_temp_sg_rule_step", phase="setup") as record:
+        record.outcome = "continue"
+
+    with caplog.at_level(logging.INFO):
+        summary = timeline.emit("succeeded")
+    assert summary["instance_id"] == "i-123"
+    assert summary["outcome"] == "succeeded"
+    assert summary["rto"] - summary["handler_duration"] == pytest.approx(10.0)
+    assert [step["name"] for step in summary["steps"]] == ["create_temp_sg_rule_step"]
+    assert summary["steps"][0]["phase"] == "setup"
+    logged = caplog.records[-1].getMessage()
+    assert json.loads(logged.split(": ", 1)[1])["outcome"] == "succeeded"